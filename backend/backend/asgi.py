@@ -2,6 +2,10 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with ``uvicorn backend.asgi:application --workers 4`` to get the
+benefit of the async views in parcels/async_views.py and
+students/async_views.py, and the guard devices' scan socket at /ws/scans/
+(parcels/scan_socket.py; needs the ``websockets`` package).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +16,20 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Settings pick ASGI-safe database connection defaults (backend/db.py)
+os.environ.setdefault('SERVED_BY_ASGI', 'True')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Needs the app registry, which get_asgi_application() has just set up
+from parcels.scan_socket import PATH as SCAN_SOCKET_PATH, scan_socket  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        if scope["path"] == SCAN_SOCKET_PATH:
+            return await scan_socket(scope, receive, send)
+        # No other WebSocket endpoints: refuse the handshake
+        await receive()
+        return await send({"type": "websocket.close"})
+    return await django_application(scope, receive, send)
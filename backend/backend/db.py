@@ -0,0 +1,81 @@
+"""Connection management modes for settings.DATABASES.
+
+The database is a remote serverless Postgres, so opening a connection costs
+a TCP + TLS handshake and authentication round trips on every request
+unless connections are reused:
+
+``none``
+    Django's default: connect and disconnect on every request.
+``persistent``
+    Keep one connection per worker thread for ``conn_max_age`` seconds and
+    ping it before reuse (``CONN_HEALTH_CHECKS``), so connections dropped by
+    Neon's idle suspend are replaced transparently.
+``pool``
+    psycopg3 connection pool shared by the threads of a worker process.
+    Suits threaded/gevent workers, where one connection per thread would
+    exceed the server's connection limit.
+
+Under ASGI (uvicorn, backend/asgi.py) Django advises against persistent
+connections: sync views and sync_to_async calls run in executor threads,
+and each thread would hold its own long-lived connection. The default mode
+(``default_conn_mode``) is therefore ``persistent`` under WSGI but ``pool``,
+or ``none`` without PostgreSQL, under ASGI.
+
+``pgbouncer`` keeps the chosen mode but stays safe behind a transaction-mode
+pooler: no server-side cursors (``.iterator()`` falls back to client-side
+chunking) and no prepared statements or server-side parameter binding.
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+CONN_MODES = ("none", "persistent", "pool")
+
+
+def default_conn_mode(db, asgi):
+    """DB_CONN_MODE when none is set, for a server of the given kind"""
+    if not asgi:
+        return "persistent"
+    return "pool" if db["ENGINE"] == "django.db.backends.postgresql" else "none"
+
+
+def apply_conn_mode(db, mode, conn_max_age=600, pool_min=2, pool_max=10,
+                    pool_timeout=10, pgbouncer=False):
+    """Return a copy of a DATABASES entry configured for ``mode``"""
+    if mode not in CONN_MODES:
+        raise ImproperlyConfigured(
+            f"DB_CONN_MODE must be one of {', '.join(CONN_MODES)}, got {mode!r}")
+
+    db = {**db, "OPTIONS": {**db.get("OPTIONS", {})}}
+    is_postgres = db["ENGINE"] == "django.db.backends.postgresql"
+
+    if mode == "none":
+        db["CONN_MAX_AGE"] = 0
+    elif mode == "persistent":
+        db["CONN_MAX_AGE"] = conn_max_age
+        db["CONN_HEALTH_CHECKS"] = True
+    elif mode == "pool":
+        if not is_postgres:
+            raise ImproperlyConfigured(
+                "DB_CONN_MODE=pool requires a PostgreSQL DATABASE_URL")
+        # Django returns connections to the pool at the end of each request;
+        # persistent connections on top of a pool are not allowed.
+        db["CONN_MAX_AGE"] = 0
+        db["OPTIONS"]["pool"] = {
+            "min_size": pool_min,
+            "max_size": pool_max,
+            "timeout": pool_timeout,
+            # Recycle before Neon suspends an idle compute endpoint
+            "max_idle": 240,
+            "check": _pool_check,
+        }
+
+    if pgbouncer and is_postgres:
+        db["DISABLE_SERVER_SIDE_CURSORS"] = True
+        db["OPTIONS"]["prepare_threshold"] = None
+        db["OPTIONS"]["server_side_binding"] = False
+    return db
+
+
+def _pool_check(connection):
+    # Imported lazily: psycopg_pool is only needed in pool mode
+    from psycopg_pool import ConnectionPool
+    ConnectionPool.check_connection(connection)
@@ -0,0 +1,112 @@
+"""Read-replica routing with read-your-writes stickiness.
+
+Only views decorated with ``reads_from_replica`` (list and search endpoints)
+read from a replica; everything else, including the read half of a
+read-modify-write such as verify_qr, stays on the primary. A client that
+just wrote something is pinned to the primary for REPLICA_PIN_SECONDS, so a
+guard refreshing the list right after a scan never sees replication lag.
+Pins live in the default cache; use a shared cache backend so they hold
+across worker processes.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+_use_replica = ContextVar("use_replica", default=False)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+def client_keys(request):
+    """Pin keys for a client: its IP, plus its clerk id when the request
+    carries one (X-Clerk-Id header or ?clerk_id=)"""
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+    ip = forwarded.split(",")[0].strip() or request.META.get("REMOTE_ADDR", "")
+    keys = [f"db-pin:ip:{ip}"]
+    clerk_id = request.headers.get("X-Clerk-Id") or request.GET.get("clerk_id")
+    if clerk_id:
+        keys.append(f"db-pin:clerk:{clerk_id}")
+    return keys
+
+
+def is_pinned(request):
+    return bool(cache.get_many(client_keys(request)))
+
+
+def reads_from_replica(view):
+    """Route the view's reads to a replica unless the client is pinned"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not settings.DATABASE_REPLICAS or await cache.aget_many(
+                    client_keys(request)):
+                return await view(request, *args, **kwargs)
+            token = _use_replica.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.DATABASE_REPLICAS or is_pinned(request):
+            return view(request, *args, **kwargs)
+        token = _use_replica.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
+
+
+class ReplicaPinningMiddleware:
+    """Pin clients to the primary after a successful write"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.should_pin(request, response):
+            cache.set_many(dict.fromkeys(client_keys(request), 1),
+                           settings.REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.should_pin(request, response):
+            await cache.aset_many(dict.fromkeys(client_keys(request), 1),
+                                  settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def should_pin(self, request, response):
+        return (settings.DATABASE_REPLICAS
+                and request.method not in SAFE_METHODS
+                and response.status_code < 400)
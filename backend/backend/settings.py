@@ -14,10 +14,9 @@ from pathlib import Path
 import os
 import dotenv
 import dj_database_url
-from decouple import config
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
+from backend.db import apply_conn_mode, default_conn_mode
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -35,6 +34,18 @@ DEBUG = True
 ALLOWED_HOSTS = []
 
 
+def config_required(name, dev_default=""):
+    """An environment setting deployments must provide. Only DEBUG (local
+    development, tests, benchmarks) may run on ``dev_default``; elsewhere a
+    missing or mistyped variable stops the process at startup."""
+    value = config(name, default="")
+    if value:
+        return value
+    if not DEBUG:
+        raise ImproperlyConfigured(f"{name} must be set when DEBUG is off")
+    return dev_default
+
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -47,7 +58,6 @@ INSTALLED_APPS = [
 
     'rest_framework',
     'corsheaders',
-    'cloudinary',
     'cloudinary_storage',
 
     'students',  # Your app for student management
@@ -55,7 +65,11 @@ INSTALLED_APPS = [
     'support',  # Your app for support requests
 ]
 MIDDLEWARE = [
+    'utils.metrics.MetricsMiddleware',
+    'utils.timing.RequestTimingMiddleware',
+    'utils.compression.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'backend.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,6 +77,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Innermost, so profiles cover the view rather than other middleware
+    'utils.profiling.ProfilingMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -93,10 +109,286 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# With DEBUG on it falls back to a local SQLite file, so tests and
+# benchmarks run offline; otherwise DATABASE_URL is required.
+
 DATABASES = {
     'default': dj_database_url.config(
-        default=config("DATABASE_URL")
+        default=config_required(
+            "DATABASE_URL", f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
+    )
+}
+
+# Connection reuse towards the remote database: none | persistent | pool.
+# Defaults to persistent under WSGI. backend/asgi.py sets SERVED_BY_ASGI, and
+# there persistent connections would pile up one per executor thread, so
+# the default is pool (none on SQLite); don't set persistent under ASGI.
+# Set DB_PGBOUNCER when DATABASE_URL points at a transaction-mode pooler.
+# See backend/db.py and `manage.py benchmark_db_connections`.
+
+SERVED_BY_ASGI = config("SERVED_BY_ASGI", default=False, cast=bool)
+DB_CONN_MODE = config(
+    "DB_CONN_MODE",
+    default=default_conn_mode(DATABASES['default'], SERVED_BY_ASGI))
+
+DATABASES['default'] = apply_conn_mode(
+    DATABASES['default'],
+    DB_CONN_MODE,
+    conn_max_age=config("DB_CONN_MAX_AGE", default=600, cast=int),
+    pool_min=config("DB_POOL_MIN_SIZE", default=2, cast=int),
+    pool_max=config("DB_POOL_MAX_SIZE", default=10, cast=int),
+    pool_timeout=config("DB_POOL_TIMEOUT", default=10, cast=int),
+    pgbouncer=config("DB_PGBOUNCER", default=False, cast=bool),
+)
+
+# Optional read replicas (comma-separated URLs). List and search views read
+# from them; writers stay pinned to the primary for REPLICA_PIN_SECONDS.
+# See backend/routers.py.
+
+DATABASE_REPLICAS = []
+for index, url in enumerate(
+        config("DATABASE_REPLICA_URLS", default="", cast=Csv()), start=1):
+    alias = f"replica{index}"
+    DATABASES[alias] = apply_conn_mode(
+        dj_database_url.parse(url),
+        DB_CONN_MODE,
+        conn_max_age=config("DB_CONN_MAX_AGE", default=600, cast=int),
+        pgbouncer=config("DB_PGBOUNCER", default=False, cast=bool),
     )
+    # Tests read through the replica alias from the primary's test database
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['backend.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = config("REPLICA_PIN_SECONDS", default=10, cast=int)
+
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # File-backed test database: the concurrent benchmarks open several
+    # connections, which an in-memory shared-cache database can't handle.
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
+
+# Threads that run ORM reads for the async views (see utils/aio.py); each
+# holds its own database connection.
+ASYNC_DB_THREADS = config("ASYNC_DB_THREADS", default=20, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Point CACHE_BACKEND/CACHE_LOCATION at Redis or Memcached to share cached
+# responses between worker processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': config(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache"),
+        'LOCATION': config("CACHE_LOCATION", default="hosteldrop"),
+    },
+    # Serialized parcels (parcels/serializers.py): one entry per parcel, so
+    # kept apart from the default cache's list and QR entries
+    'fragments': {
+        'BACKEND': config(
+            "FRAGMENT_CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache"),
+        'LOCATION': config(
+            "FRAGMENT_CACHE_LOCATION", default="hosteldrop-fragments"),
+    },
+}
+if CACHES['fragments']['BACKEND'].endswith('LocMemCache'):
+    CACHES['fragments']['OPTIONS'] = {'MAX_ENTRIES': config(
+        "FRAGMENT_CACHE_MAX_ENTRIES", default=100000, cast=int)}
+
+# Seconds a rendered per-student parcel list stays in the cache. Entries are
+# keyed by the student's parcels_version, so this only bounds memory use.
+PARCEL_LIST_CACHE_TIMEOUT = config(
+    "PARCEL_LIST_CACHE_TIMEOUT", default=60 * 60 * 24, cast=int)
+# Picked-up parcels' serialized fragments no longer change; keep them longer
+FRAGMENT_PICKED_UP_TIMEOUT = config(
+    "FRAGMENT_PICKED_UP_TIMEOUT", default=60 * 60 * 24 * 7, cast=int)
+
+
+# Request instrumentation
+# Opt-in Server-Timing headers (SQL, QR render, upload, serialization) and a
+# slow-request log. Disabled, the middleware is removed at startup.
+
+REQUEST_TIMING_ENABLED = config(
+    "REQUEST_TIMING_ENABLED", default=False, cast=bool)
+SLOW_REQUEST_MS = config("SLOW_REQUEST_MS", default=500, cast=int)
+SLOW_REQUEST_TOP_QUERIES = config(
+    "SLOW_REQUEST_TOP_QUERIES", default=5, cast=int)
+SLOW_REQUEST_LOG = config("SLOW_REQUEST_LOG", default="")
+
+# Opt-in per-request profiling (utils.profiling), triggered by a signed
+# X-Profile header, `manage.py profile_requests on`, or sampling. Reports go
+# to PROFILING_DIR, capped at PROFILING_MAX_MB. Disabled, the middleware is
+# removed at startup.
+PROFILING_ENABLED = config("PROFILING_ENABLED", default=False, cast=bool)
+PROFILING_DIR = config("PROFILING_DIR", default=str(BASE_DIR / "profiles"))
+PROFILING_MAX_MB = config("PROFILING_MAX_MB", default=200, cast=int)
+PROFILING_SAMPLE_RATE = config("PROFILING_SAMPLE_RATE", default=0.0, cast=float)
+PROFILING_SAMPLE_INTERVAL_MS = config(
+    "PROFILING_SAMPLE_INTERVAL_MS", default=5, cast=int)
+PROFILING_TOKEN_MAX_AGE = config(
+    "PROFILING_TOKEN_MAX_AGE", default=3600, cast=int)
+PROFILING_TOGGLE_POLL_SECONDS = config(
+    "PROFILING_TOGGLE_POLL_SECONDS", default=5, cast=int)
+
+
+# Metrics
+# Prometheus text exposition at /metrics/. Set PROMETHEUS_MULTIPROC_DIR when
+# running several worker processes (see utils/metrics.py).
+
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+# Scrapers send "Authorization: Bearer <METRICS_TOKEN>". Without a token
+# /metrics/ refuses everyone, unless METRICS_PUBLIC opts out because the
+# endpoint is only reachable from an internal network.
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+METRICS_PUBLIC = config("METRICS_PUBLIC", default=False, cast=bool)
+
+# Idempotency-Key support on parcel intake, pickups and help requests (see
+# parcels/idempotency.py). Stored responses are replayed for TTL hours;
+# purge older ones with `manage.py purge_idempotency_keys`.
+IDEMPOTENCY_TTL_HOURS = config("IDEMPOTENCY_TTL_HOURS", default=24, cast=int)
+# A claimed key whose request hasn't finished after this long is abandoned
+IDEMPOTENCY_LOCK_SECONDS = config(
+    "IDEMPOTENCY_LOCK_SECONDS", default=60, cast=int)
+
+# Guard scan socket (ws[s]://<host>/ws/scans/, see parcels/scan_socket.py).
+# Devices authenticate with one of these tokens; empty disables the socket.
+SCAN_DEVICE_TOKENS = config("SCAN_DEVICE_TOKENS", default="", cast=Csv())
+# Scans from one device verified concurrently; the socket reads no further
+# frames until one finishes
+SCAN_PIPELINE_DEPTH = config("SCAN_PIPELINE_DEPTH", default=8, cast=int)
+
+# Consumed-token store (parcels/replay.py): rescans of already picked up
+# parcels are refused without a database query. Set CONSUMED_BLOOM_CAPACITY
+# (e.g. 1000000, about 1.2 MB) to skip the shared cache lookup on fresh scans.
+# The test runner (backend/test_runner.py) turns it off
+CONSUMED_TOKENS_ENABLED = config(
+    "CONSUMED_TOKENS_ENABLED", default=True, cast=bool)
+CONSUMED_LRU_SIZE = config("CONSUMED_LRU_SIZE", default=50000, cast=int)
+CONSUMED_LOCAL_SECONDS = config(
+    "CONSUMED_LOCAL_SECONDS", default=300, cast=int)
+CONSUMED_BLOOM_CAPACITY = config(
+    "CONSUMED_BLOOM_CAPACITY", default=0, cast=int)
+
+# QR label sheets (/parcels/labels/<pdf|png>/, `manage.py print_labels`):
+# processes rendering pages, and the most labels one request may ask for
+LABEL_WORKERS = config(
+    "LABEL_WORKERS", default=min(4, os.cpu_count() or 1), cast=int)
+LABEL_SHEET_MAX_LABELS = config(
+    "LABEL_SHEET_MAX_LABELS", default=2000, cast=int)
+# Days a printed label's code scans for; reprint labels for parcels kept
+# longer than this
+LABEL_TOKEN_MAX_AGE_DAYS = config(
+    "LABEL_TOKEN_MAX_AGE_DAYS", default=60, cast=int)
+
+# Seconds a rendered parcel QR PNG is reused before being signed afresh
+QR_CACHE_SECONDS = config("QR_CACHE_SECONDS", default=60 * 60, cast=int)
+
+
+# API rendering and transfer
+# orjson for JSON in and out; gzip (or brotli, when the brotli package is
+# installed and the client accepts it) for responses of at least
+# COMPRESSION_MIN_BYTES. /parcels/all/ and /students/all/ stream with
+# ?stream=1, STREAM_CHUNK_SIZE rows at a time.
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'utils.rendering.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'utils.rendering.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'utils.throttling.TokenBucketThrottle',
+    ],
+    # Proxies in front of the app, so the client IP is read correctly from
+    # X-Forwarded-For for throttling. We run behind one load balancer; with
+    # 0 every client would be keyed on the balancer's address and share a
+    # single bucket. Set 0 only when clients connect directly.
+    'NUM_PROXIES': config("NUM_PROXIES", default=1, cast=int),
+}
+
+
+# Throttling
+# Token buckets per client (IP, plus clerk_id when a request names one) and
+# endpoint scope, see utils/throttling.py. Rates are N/s, N/min, N/hour or N/day; N is also the
+# burst size. The pickup scope has no global cap and no other scope draws
+# on it, so the guard's scans keep working while lists are being hammered.
+# THROTTLE_BACKEND=cache shares the buckets between workers.
+
+# The test runner (backend/test_runner.py) turns it off
+THROTTLE_ENABLED = config("THROTTLE_ENABLED", default=True, cast=bool)
+THROTTLE_BACKEND = config("THROTTLE_BACKEND", default="local")
+THROTTLE_RATES = {
+    'pickup': config("THROTTLE_PICKUP_RATE", default="120/min"),
+    'qr': config("THROTTLE_QR_RATE", default="60/min"),
+    'heavy': config("THROTTLE_HEAVY_RATE", default="10/min"),
+    'default': config("THROTTLE_DEFAULT_RATE", default="300/min"),
+}
+THROTTLE_GLOBAL_RATES = {
+    'qr': config("THROTTLE_QR_GLOBAL_RATE", default="600/min"),
+    'heavy': config("THROTTLE_HEAVY_GLOBAL_RATE", default="60/min"),
+    'default': config("THROTTLE_DEFAULT_GLOBAL_RATE", default="3000/min"),
+}
+THROTTLE_SCOPES = {
+    'verify_qr': 'pickup',
+    'verify_pass': 'pickup',
+    'pickup_with_pass': 'pickup',
+    'mark_picked_up': 'pickup',
+    'parcel_qr': 'qr',
+    'parcel_qr_base64': 'qr',
+    'parcel_qr_base64_async': 'qr',
+    'pickup_pass': 'qr',
+    'student_bootstrap': 'qr',
+    'all_parcels': 'heavy',
+    'all_parcels_async': 'heavy',
+    'guard_bootstrap': 'heavy',
+    'parcel-list': 'heavy',
+    'export_ledger': 'heavy',
+    'parcel_labels': 'heavy',
+    'get_all_students': 'heavy',
+}
+
+COMPRESSION_MIN_BYTES = config("COMPRESSION_MIN_BYTES", default=1024, cast=int)
+BROTLI_QUALITY = config("BROTLI_QUALITY", default=5, cast=int)
+STREAM_CHUNK_SIZE = config("STREAM_CHUNK_SIZE", default=500, cast=int)
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.2/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+        'slow_requests': {
+            'class': 'logging.FileHandler',
+            'filename': SLOW_REQUEST_LOG,
+            'delay': True,
+        } if SLOW_REQUEST_LOG else {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'hosteldrop': {
+            'handlers': ['console'],
+            'level': config("LOG_LEVEL", default="INFO"),
+        },
+        'hosteldrop.slow_requests': {
+            'handlers': ['slow_requests'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
 
 
@@ -118,20 +410,41 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=config("CLOUDINARY_CLOUD_NAME"),
-    api_key=config("CLOUDINARY_API_KEY"),
-    api_secret=config("CLOUDINARY_API_SECRET"),
-    secure=True
-)
-
+# Configure Cloudinary. The SDK is configured from these on first use, an
+# upload or building a URL for a bare public id (utils.uploads), not at
+# import time, to keep worker cold starts cheap.
 CLOUDINARY_STORAGE = {
-    "CLOUD_NAME": config("CLOUDINARY_CLOUD_NAME"),
-    "API_KEY": config("CLOUDINARY_API_KEY"), 
-    "API_SECRET": config("CLOUDINARY_API_SECRET"),
+    "CLOUD_NAME": config_required("CLOUDINARY_CLOUD_NAME"),
+    "API_KEY": config_required("CLOUDINARY_API_KEY"), 
+    "API_SECRET": config_required("CLOUDINARY_API_SECRET"),
 }
 
+# Upload client (utils.uploads): keep-alive pool per worker, timeouts in
+# seconds, retries of transient failures within the deadline, and a circuit
+# breaker that pauses uploads after repeated failures. Photos arriving while
+# it is open are queued; drain them with `manage.py upload_deferred_images`.
+CLOUDINARY_POOL_SIZE = config("CLOUDINARY_POOL_SIZE", default=10, cast=int)
+CLOUDINARY_CONNECT_TIMEOUT = config(
+    "CLOUDINARY_CONNECT_TIMEOUT", default=3.0, cast=float)
+CLOUDINARY_READ_TIMEOUT = config(
+    "CLOUDINARY_READ_TIMEOUT", default=15.0, cast=float)
+CLOUDINARY_UPLOAD_RETRIES = config(
+    "CLOUDINARY_UPLOAD_RETRIES", default=2, cast=int)
+CLOUDINARY_UPLOAD_DEADLINE = config(
+    "CLOUDINARY_UPLOAD_DEADLINE", default=20.0, cast=float)
+CLOUDINARY_BREAKER_THRESHOLD = config(
+    "CLOUDINARY_BREAKER_THRESHOLD", default=5, cast=int)
+CLOUDINARY_BREAKER_COOLDOWN = config(
+    "CLOUDINARY_BREAKER_COOLDOWN", default=30.0, cast=float)
+
+# Parcel photo storage (parcels.storage): "cloudinary" or "local". The local
+# backend keeps photos under LOCAL_IMAGE_ROOT and serves them itself;
+# LOCAL_IMAGE_BASE_URL (e.g. https://api.example.com) makes their URLs
+# absolute for frontends on another origin.
+IMAGE_STORAGE = config("IMAGE_STORAGE", default="cloudinary")
+LOCAL_IMAGE_ROOT = config("LOCAL_IMAGE_ROOT", default=str(BASE_DIR / "media" / "parcels"))
+LOCAL_IMAGE_BASE_URL = config("LOCAL_IMAGE_BASE_URL", default="")
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
@@ -140,6 +453,8 @@ STATIC_URL = 'static/'
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
+TEST_RUNNER = "backend.test_runner.TestRunner"
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 DEFAULT_FILE_STORAGE = "cloudinary_storage.storage.MediaCloudinaryStorage"
 MEDIA_URL = "https://res.cloudinary.com/hosteldrop/"
@@ -0,0 +1,33 @@
+import os
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Runs the suite with per-process protections off: their state
+    outlives a test, and the benchmarks replay hundreds of requests from
+    one client. Tests of these features switch them back on with
+    override_settings."""
+
+    OVERRIDES = {
+        "THROTTLE_ENABLED": False,
+        "CONSUMED_TOKENS_ENABLED": False,
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Benchmarks run only when asked for, with `--tag benchmark` or
+        # RUN_BENCHMARKS=1
+        if ("benchmark" not in self.tags
+                and not os.environ.get("RUN_BENCHMARKS")):
+            self.exclude_tags.add("benchmark")
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._overrides = override_settings(**self.OVERRIDES)
+        self._overrides.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._overrides.disable()
+        super().teardown_test_environment(**kwargs)
@@ -16,10 +16,14 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from utils.health import health_view
+from utils.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('parcels/', include('parcels.urls')),
     path('students/', include('students.urls')),
     path('support/', include('support.urls')),
+    path('metrics/', metrics_view, name='metrics'),
+    path('health/', health_view, name='health'),
 ]
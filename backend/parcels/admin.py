@@ -1,4 +1,7 @@
+import uuid
+
 from django.contrib import admin
+from students.models import Student
 from .models import Parcel
 
 
@@ -6,9 +9,14 @@ from .models import Parcel
 class ParcelAdmin(admin.ModelAdmin):
     list_display = ['tracking_id', 'get_student_name',
                     'service', 'status', 'created_at']
-    list_filter = ['status', 'service', 'created_at']
-    search_fields = ['tracking_id', 'student__name',
-                     'student__email', 'service']
+    list_filter = ['status', 'service']
+    list_select_related = ['student']
+    autocomplete_fields = ['student']
+    date_hierarchy = 'created_at'
+    # Skip the unfiltered COUNT(*) next to every filtered count
+    show_full_result_count = False
+    search_fields = ['=tracking_id']
+    search_help_text = "Tracking ID, or a student's name prefix, email or Clerk id"
     readonly_fields = ['tracking_id', 'created_at']
     ordering = ['-created_at']
 
@@ -18,6 +26,28 @@ class ParcelAdmin(admin.ModelAdmin):
     get_student_name.short_description = 'Student Name'
     get_student_name.admin_order_field = 'student__name'
 
+    def get_queryset(self, request):
+        # Parcel.__str__ reads the student: the change form and the help
+        # request autocomplete list parcels too
+        return super().get_queryset(request).select_related('student')
+
+    def get_search_results(self, request, queryset, search_term):
+        """A tracking ID matches exactly; anything else searches students
+        (see StudentAdmin.search_fields) and lists their parcels. Each
+        branch is an index lookup, where OR-ing icontains across the join
+        scanned every parcel."""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        try:
+            uuid.UUID(term)
+        except ValueError:
+            students, _ = self.admin_site.get_model_admin(
+                Student).get_search_results(
+                    request, Student.objects.all(), term)
+            return queryset.filter(student__in=students.values('pk')), False
+        return queryset.filter(tracking_id=term), False
+
     fieldsets = (
         ('Parcel Information', {
             'fields': ('tracking_id', 'student', 'service', 'description')
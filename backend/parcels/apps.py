@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ParcelsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'parcels'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        # Hooks every new DB connection so request metrics see its queries
+        import utils.timing  # noqa: F401
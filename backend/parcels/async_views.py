@@ -0,0 +1,100 @@
+"""Async variants of the hot read endpoints, for serving under ASGI.
+
+DRF's ``@api_view`` is synchronous, so these are plain Django async views
+returning JsonResponse with the same payloads as their sync counterparts.
+They pay off when served by an ASGI server (``uvicorn backend.asgi:application``):
+a request waiting on the database or on QR rendering no longer pins a
+worker thread. ORM reads go through utils.aio.db_read rather than the async
+ORM; see its docstring for why.
+"""
+import base64
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from backend.routers import reads_from_replica
+from students.models import Student
+from utils.aio import db_read
+from utils.qr import cached_qr_png
+from utils.throttling import throttle
+from utils.timing import span
+from .cache import aversioned_parcel_response
+from .images import requested_variant
+from .models import Parcel
+from .serializers import ParcelSerializer
+from .views import with_qr_urls
+
+# QR rendering is CPU-bound PIL work; keep it off the event loop and off
+# the single thread Django reserves for the async ORM.
+render_qr = sync_to_async(cached_qr_png, thread_sensitive=False)
+
+
+def serialize_parcels(parcels, image_variant=None):
+    with span('serialize'):
+        return with_qr_urls(ParcelSerializer(
+            parcels, many=True, context={'image_variant': image_variant}).data)
+
+
+@require_GET
+@reads_from_replica
+@throttle
+async def my_parcels(request):
+    clerk_id = request.GET.get('clerk_id')
+    if not clerk_id:
+        return JsonResponse({"error": "clerk_id is required"}, status=400)
+
+    student = await db_read(
+        Student.objects.filter(clerk_id=clerk_id).only(
+            'id', 'parcels_version', 'parcels_changed_at').first)
+    if student is None:
+        return JsonResponse([], safe=False)
+
+    image_variant = requested_variant(request)
+
+    async def build():
+        return await db_read(serialize_parcels, Parcel.objects.filter(
+            student=student).select_related('student'), image_variant)
+
+    variant = f"my.{image_variant}" if image_variant else 'my'
+    return await aversioned_parcel_response(request, student, variant, build)
+
+
+@require_GET
+@reads_from_replica
+@throttle
+async def all_parcels(request):
+    # Serializing a long list is CPU work too; keep it off the event loop
+    data = await db_read(
+        serialize_parcels, Parcel.objects.select_related('student'),
+        requested_variant(request))
+    return JsonResponse(data, safe=False)
+
+
+@require_GET
+@throttle
+async def parcel_qr_base64(request, parcel_id):
+    parcel = await db_read(
+        Parcel.objects.select_related('student').filter(id=parcel_id).first)
+    if parcel is None:
+        return JsonResponse({"error": "Parcel not found"}, status=404)
+
+    if parcel.status != Parcel.ParcelStatus.PENDING:
+        return JsonResponse(
+            {"error": "Parcel not available for pickup"}, status=410)
+
+    with span('qr'):
+        png_bytes = await render_qr(str(parcel_id), max_age_hours=48)
+    qr_base64 = base64.b64encode(png_bytes).decode('utf-8')
+
+    return JsonResponse({
+        "parcel_id": parcel_id,
+        "tracking_id": parcel.tracking_id,
+        "qr_code": f"data:image/png;base64,{qr_base64}",
+        "expires_in_hours": 48,
+        "student_info": {
+            "name": parcel.student.name,
+            "room": parcel.student.room_number,
+            "block": parcel.student.hostel_block
+        }
+    })
@@ -0,0 +1,139 @@
+"""Dashboard bootstrap endpoints: everything a dashboard shows on first
+paint in one response, so a phone on a slow network waits for one round
+trip instead of four or more.
+
+``student_bootstrap`` replaces the student dashboard's calls to
+/students/by-clerk/, /parcels/my/, /support/my/ and the per-parcel QR
+fetches; ``guard_bootstrap`` replaces /parcels/all/ and the help request
+list. Each takes a fixed number of queries however many parcels there
+are. The individual endpoints stay for refreshing one panel. Each is
+throttled in the scope of the costliest call it replaces (qr for the
+student's, heavy for the guard's).
+"""
+import base64
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from backend.routers import reads_from_replica
+from students.models import Student
+from students.serializers import StudentSerializer
+from support.models import HelpRequest
+from support.serializers import HelpRequestSerializer
+from utils.qr import cached_qr_pngs
+from utils.timing import span
+from .cache import cached_parcel_list
+from .images import requested_variant
+from .models import Parcel
+from .serializers import ParcelSerializer
+from .views import student_parcel_list, with_qr_urls
+
+PENDING = Parcel.ParcelStatus.PENDING
+PICKED_UP = Parcel.ParcelStatus.PICKED_UP
+
+
+def help_request_list(help_requests):
+    return HelpRequestSerializer(
+        help_requests.select_related('parcel').order_by('-created_at'),
+        many=True).data
+
+
+def open_count(help_requests):
+    return sum(1 for help_request in help_requests
+               if help_request['status'] != 'resolved')
+
+
+@api_view(['GET'])
+@reads_from_replica
+def student_bootstrap(request):
+    """Profile, parcels with their pickup QR codes inline, help requests and
+    counts for the student dashboard. Three queries, two when the parcel
+    list is cached."""
+    clerk_id = request.GET.get('clerk_id')
+
+    if not clerk_id:
+        return Response(
+            {"error": "clerk_id is required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        student = Student.objects.filter(clerk_id=clerk_id).first()
+        if student is None:
+            return Response(
+                {"error": "Student not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        image_variant = requested_variant(request)
+        variant = f"my.{image_variant}" if image_variant else 'my'
+        # ✅ Same cached list /parcels/my/ serves
+        parcels = cached_parcel_list(
+            student, variant,
+            lambda: student_parcel_list(student, image_variant))
+        help_requests = help_request_list(
+            HelpRequest.objects.filter(student=student))
+
+        # ✅ QR codes inline, saving a request per pending parcel
+        pending = [parcel['id'] for parcel in parcels
+                   if parcel['status'] == PENDING]
+        with span('qr'):
+            qr_codes = {
+                parcel_id: "data:image/png;base64,"
+                + base64.b64encode(png_bytes).decode('utf-8')
+                for parcel_id, png_bytes in cached_qr_pngs(
+                    [str(parcel_id) for parcel_id in pending]).items()}
+
+        return Response({
+            "student": StudentSerializer(student).data,
+            "parcels": parcels,
+            "qr_codes": qr_codes,
+            "help_requests": help_requests,
+            "summary": {
+                "pending_parcels": len(pending),
+                "picked_up_parcels": len(parcels) - len(pending),
+                "open_help_requests": open_count(help_requests),
+            },
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@reads_from_replica
+def guard_bootstrap(request):
+    """All parcels, help requests and the dashboard's stats for guards.
+    Two queries."""
+    try:
+        parcels = list(Parcel.objects.select_related('student'))
+        context = {'image_variant': requested_variant(request)}
+        with span('serialize'):
+            parcel_data = with_qr_urls(
+                ParcelSerializer(parcels, many=True, context=context).data)
+        help_requests = help_request_list(HelpRequest.objects.all())
+
+        today = timezone.localdate()
+        return Response({
+            "parcels": parcel_data,
+            "help_requests": help_requests,
+            "summary": {
+                "total_parcels": len(parcels),
+                "pending_parcels": sum(
+                    1 for parcel in parcels if parcel.status == PENDING),
+                "picked_up_today": sum(
+                    1 for parcel in parcels
+                    if parcel.status == PICKED_UP and parcel.picked_up_time
+                    and timezone.localdate(parcel.picked_up_time) == today),
+                "open_help_requests": open_count(help_requests),
+            },
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
@@ -0,0 +1,96 @@
+from calendar import timegm
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from students.models import Student
+
+
+def bump_parcels_version(student_id):
+    """Invalidate every cached parcel list of a student.
+
+    The counter lives in the database, so all worker processes see the new
+    version on their next request no matter which cache backend is used.
+    """
+    Student.objects.filter(pk=student_id).update(
+        parcels_version=F('parcels_version') + 1,
+        parcels_changed_at=timezone.now(),
+    )
+
+
+def parcel_list_cache_key(student, variant):
+    return f"parcels:{variant}:{student.pk}:{student.parcels_version}"
+
+
+def parcel_list_etag(student, variant):
+    return quote_etag(f"{variant}-{student.pk}-{student.parcels_version}")
+
+
+def _conditional_response(request, student, variant):
+    etag = parcel_list_etag(student, variant)
+    last_modified = timegm(student.parcels_changed_at.utctimetuple())
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    return etag, last_modified, response
+
+
+def _patch_response(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Clients may keep the body but must revalidate on every load
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def versioned_parcel_response(request, student, variant, build):
+    """Serve a student's parcel list with conditional GET support.
+
+    ``build`` is only called on a cache miss; a matching ``If-None-Match``
+    or ``If-Modified-Since`` returns ``304 Not Modified`` without touching
+    the parcel table at all.
+    """
+    etag, last_modified, response = _conditional_response(
+        request, student, variant)
+    if response is None:
+        data = cached_parcel_list(student, variant, build)
+        response = Response(data, status=status.HTTP_200_OK)
+    return _patch_response(response, etag, last_modified)
+
+
+def cached_parcel_list(student, variant, build):
+    """The student's parcel list from the versioned cache, calling ``build``
+    on a miss"""
+    key = parcel_list_cache_key(student, variant)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, settings.PARCEL_LIST_CACHE_TIMEOUT)
+    return data
+
+
+async def aversioned_parcel_response(request, student, variant, abuild):
+    """Async counterpart of versioned_parcel_response for plain Django
+    async views; ``abuild`` is a coroutine function and the result is a
+    JsonResponse."""
+    etag, last_modified, response = _conditional_response(
+        request, student, variant)
+    if response is None:
+        key = parcel_list_cache_key(student, variant)
+        data = await cache.aget(key)
+        if data is None:
+            data = await abuild()
+            await cache.aset(key, data, settings.PARCEL_LIST_CACHE_TIMEOUT)
+        response = JsonResponse(data, safe=False)
+    return _patch_response(response, etag, last_modified)
@@ -0,0 +1,82 @@
+"""Parcel photos queued while image uploads are unavailable.
+
+When the upload circuit is open (utils.uploads), create_parcel stores the
+parcel without its photo and keeps the bytes in a DeferredUpload instead
+of holding the guard's request. ``manage.py upload_deferred_images``,
+run from cron, uploads them once the service is back and fills in
+Parcel.image.
+"""
+import io
+import logging
+
+from django.db import transaction
+
+from utils.metrics import UPLOADS_DEFERRED
+from utils.uploads import UploadUnavailable
+from .models import DeferredUpload, ImageAsset
+from .storage import get_image_storage
+
+logger = logging.getLogger(__name__)
+
+# Photos Cloudinary keeps refusing (not just failing to reach) are dropped
+MAX_ATTEMPTS = 5
+
+
+def defer_upload(parcel, image_file, digest):
+    image_file.seek(0)
+    DeferredUpload.objects.create(
+        parcel=parcel, sha256=digest, data=image_file.read())
+    UPLOADS_DEFERRED.inc()
+    logger.warning("Image upload deferred for parcel %s", parcel.id)
+
+
+def _store(deferred):
+    # The same photo may have been stored since (a retried intake)
+    asset = ImageAsset.objects.filter(sha256=deferred.sha256).first()
+    if asset is not None:
+        return asset.url
+    url = get_image_storage().save(io.BytesIO(bytes(deferred.data)),
+                                   deferred.sha256)
+    ImageAsset.objects.bulk_create(
+        [ImageAsset(sha256=deferred.sha256, url=url)], ignore_conflicts=True)
+    return url
+
+
+def upload_deferred(limit=None):
+    """Upload queued photos, oldest first. Stops early if uploads are still
+    unavailable. Returns (uploaded, dropped, remaining)."""
+    ids = DeferredUpload.objects.order_by('created_at', 'id').values_list(
+        'id', flat=True)
+    uploaded = dropped = 0
+    for deferred_id in ids[:limit] if limit else ids:
+        with transaction.atomic():
+            # Skip rows a concurrent run is already uploading
+            deferred = (DeferredUpload.objects.select_for_update(skip_locked=True)
+                        .select_related('parcel').filter(id=deferred_id).first())
+            if deferred is None:
+                continue
+            try:
+                url = _store(deferred)
+            except UploadUnavailable as e:
+                deferred.last_error = str(e)
+                deferred.save(update_fields=['last_error'])
+                break
+            except Exception as e:
+                logger.exception("Deferred upload failed for parcel %s",
+                                 deferred.parcel_id)
+                deferred.attempts += 1
+                if deferred.attempts >= MAX_ATTEMPTS:
+                    deferred.delete()
+                    dropped += 1
+                else:
+                    deferred.last_error = str(e)
+                    deferred.save(update_fields=['attempts', 'last_error'])
+                continue
+
+            parcel = deferred.parcel
+            parcel.image = url
+            # Saved, not updated, so the signals refresh cached lists
+            parcel.save(update_fields=['image', 'updated_at'])
+            deferred.delete()
+            uploaded += 1
+    return uploaded, dropped, DeferredUpload.objects.count()
@@ -0,0 +1,118 @@
+import uuid
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+from rest_framework.pagination import PageNumberPagination
+
+from students.serializers import StudentMiniSerializer
+from .models import Parcel
+
+
+class ParcelPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+def _parse_day(param, value, expected="YYYY-MM-DD"):
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValidationError({param: f"Use {expected}"})
+    return day
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_parcels(queryset, params):
+    """Apply the parcel filters in ``params`` (a QueryDict or dict):
+
+    ?status=, ?student=<uuid>, ?service=, ?block=<hostel block>,
+    ?created_after=/?created_before= (YYYY-MM-DD, inclusive) and
+    ?month=YYYY-MM. Raises ValidationError on malformed values.
+    """
+    status = params.get('status')
+    if status:
+        if status not in Parcel.ParcelStatus.values:
+            raise ValidationError({'status': f"Unknown status {status!r}"})
+        queryset = queryset.filter(status=status)
+
+    student = params.get('student')
+    if student:
+        try:
+            queryset = queryset.filter(student_id=uuid.UUID(student))
+        except ValueError:
+            raise ValidationError({'student': "Must be a student id"})
+
+    service = params.get('service')
+    if service:
+        queryset = queryset.filter(service=service)
+
+    block = params.get('block')
+    if block:
+        queryset = queryset.filter(student__hostel_block=block)
+
+    # Compare against day boundaries rather than created_at__date, which
+    # wraps the column in a cast and can't use its index
+    created_after = params.get('created_after')
+    if created_after:
+        queryset = queryset.filter(created_at__gte=_day_start(
+            _parse_day('created_after', created_after)))
+    created_before = params.get('created_before')
+    if created_before:
+        queryset = queryset.filter(created_at__lt=_day_start(
+            _parse_day('created_before', created_before) + timedelta(days=1)))
+
+    month = params.get('month')
+    if month:
+        first = _parse_day('month', f"{month}-01", "YYYY-MM")
+        following = (first + timedelta(days=32)).replace(day=1)
+        queryset = queryset.filter(created_at__gte=_day_start(first),
+                                   created_at__lt=_day_start(following))
+
+    return queryset
+
+
+class ParcelFilter(BaseFilterBackend):
+    """See filter_parcels"""
+
+    def filter_queryset(self, request, queryset, view):
+        return filter_parcels(queryset, request.query_params)
+
+
+class IndexedOrderingFilter(OrderingFilter):
+    # Only columns with an index, so ?ordering= can't force a table sort
+    ordering_fields = ['created_at', 'status', 'tracking_id', 'id']
+
+
+def sparse_fields(request, serializer_class):
+    """Field names requested with ?fields=a,b (None when not given)"""
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+    fields = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = fields - set(serializer_class().fields)
+    if unknown:
+        raise ValidationError(
+            {'fields': f"Unknown fields: {', '.join(sorted(unknown))}"})
+    return fields
+
+
+def only_columns(queryset, fields):
+    """Trim ``queryset`` to the columns a ParcelSerializer limited to
+    ``fields`` reads, joining the student only when it is requested"""
+    columns = [name for name in fields if name != 'student']
+    if 'student' in fields:
+        queryset = queryset.select_related('student')
+        columns += [f'student__{name}'
+                    for name in StudentMiniSerializer.Meta.fields]
+    else:
+        queryset = queryset.select_related(None)
+    return queryset.only('id', *columns)
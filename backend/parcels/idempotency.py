@@ -0,0 +1,126 @@
+"""``Idempotency-Key`` support for write endpoints.
+
+A client that retries a write with the same key gets the first response
+back instead of a second parcel, upload or pickup. Keys are scoped to the
+endpoint (its URL name) and kept for IDEMPOTENCY_TTL_HOURS.
+
+The first request claims the key by inserting a row with no response yet;
+the unique (scope, key) constraint makes exactly one of several concurrent
+requests win. The others get 409 with Retry-After until it finishes. A
+claim older than IDEMPOTENCY_LOCK_SECONDS is taken to be from a worker that
+died and may be taken over. Server errors release the claim so the client
+can retry for real.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+
+
+def request_fingerprint(request):
+    """Hash of the method, path and submitted data. Uploaded files count by
+    name and size, which is enough to tell a retry from a different
+    request reusing the key."""
+    data = request.data
+    items = data.lists() if hasattr(data, 'lists') else data.items()
+    parts = [request.method, request.path]
+    for name, value in sorted(items, key=lambda item: item[0]):
+        parts.append(f"{name}={value!r}")
+    for name, upload in sorted(request.FILES.items()):
+        parts.append(f"{name}:{upload.name}:{upload.size}")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def _claim(scope, key, fingerprint):
+    """(row, claimed): the stored row for the key, and whether this request
+    now owns it and must run the view"""
+    now = timezone.now()
+    row = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+    if row is not None:
+        if row.created_at < now - timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS):
+            row.delete()
+        elif (row.status_code is None and row.created_at
+              < now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)):
+            # Abandoned claim: the conditional update lets one retry take it
+            taken = IdempotencyKey.objects.filter(
+                pk=row.pk, status_code=None, created_at=row.created_at,
+            ).update(fingerprint=fingerprint, created_at=now)
+            return row, bool(taken)
+        else:
+            return row, False
+
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                scope=scope, key=key, fingerprint=fingerprint,
+                created_at=now), True
+    except IntegrityError:
+        # Lost the race to a concurrent request with the same key
+        return IdempotencyKey.objects.get(scope=scope, key=key), False
+
+
+def _replay(row, fingerprint):
+    if row.fingerprint != fingerprint:
+        return Response(
+            {"error": f"{HEADER} was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if row.status_code is None:
+        return Response(
+            {"error": "A request with this Idempotency-Key is in progress"},
+            status=status.HTTP_409_CONFLICT,
+            headers={"Retry-After": "1"}
+        )
+    return Response(row.response, status=row.status_code,
+                    headers={"Idempotent-Replayed": "true"})
+
+
+def idempotent(view):
+    """Honour an Idempotency-Key header on an API view. Goes under
+    @api_view (and @parser_classes) so request.data is parsed."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {"error": f"{HEADER} must be at most 255 characters"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        scope = request.resolver_match.url_name
+        fingerprint = request_fingerprint(request)
+        row, claimed = _claim(scope, key, fingerprint)
+        if not claimed:
+            return _replay(row, fingerprint)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            row.delete()
+            raise
+        if response.status_code >= 500 or not hasattr(response, 'data'):
+            row.delete()
+            return response
+
+        IdempotencyKey.objects.filter(pk=row.pk).update(
+            status_code=response.status_code, response=response.data)
+        return response
+    return wrapper
+
+
+def purge_expired():
+    """Delete stored keys past IDEMPOTENCY_TTL_HOURS; returns how many"""
+    cutoff = timezone.now() - timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,47 @@
+"""Responsive variants of parcel photos.
+
+Each stored photo is available as thumb, card and full (see
+storage.VARIANTS). Serializers expose them as a srcset; lists can ask for a
+single size with ``?image=``. Variant URLs come from the configured image
+storage backend and need no I/O.
+"""
+import hashlib
+
+from .storage import VARIANTS, get_image_storage
+
+
+def content_hash(image_file):
+    """sha256 hex digest of an uploaded file; leaves it rewound"""
+    digest = hashlib.sha256()
+    for chunk in image_file.chunks():
+        digest.update(chunk)
+    image_file.seek(0)
+    return digest.hexdigest()
+
+
+def requested_variant(request):
+    """The variant named by ``?image=`` (thumb, card, full), or None"""
+    variant = request.GET.get("image")
+    return variant if variant in VARIANTS else None
+
+
+def image_url(name):
+    """Delivery URL of a stored Parcel.image value"""
+    if not name:
+        return None
+    return get_image_storage().url(name)
+
+
+def variant_url(url, variant):
+    """``url`` resized to the named variant"""
+    return get_image_storage().variant_url(url, variant)
+
+
+def srcset(url):
+    """``url`` as an ``<img srcset>`` value over all variants"""
+    storage = get_image_storage()
+    if storage.variant_url(url, "thumb") == url:
+        # Stored by another backend; no variants to offer
+        return None
+    return ", ".join(f"{storage.variant_url(url, name)} {width}w"
+                     for name, (width, _, _) in VARIANTS.items())
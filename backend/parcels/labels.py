@@ -0,0 +1,91 @@
+"""Printable QR label sheets for a filtered set of parcels.
+
+Each page of labels is rendered in a worker process (qrcode and PIL are
+CPU-bound), pages are collected in order as they finish, and the PDF is
+written out page by page. Tokens are signed here, in the web process, so
+workers never need the Django settings. They use the label salt, which
+verify_scan accepts for LABEL_TOKEN_MAX_AGE_DAYS rather than the 48 hours
+of a dashboard code, since a label stays on the parcel until pickup.
+"""
+import atexit
+import threading
+
+from django.conf import settings
+
+from utils.labelsheet import (
+    LABELS_PER_PAGE, PDFWriter, render_pdf_page, render_png)
+from utils.qr import sign_label
+
+CONTENT_TYPES = {"pdf": "application/pdf", "png": "image/png"}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def render_pool():
+    """Worker processes shared by every sheet this process renders.
+
+    Spawned rather than forked: forking a threaded server process can copy
+    held locks, and workers only import utils.labelsheet anyway.
+    """
+    global _pool
+    # Loaded on first use, like qrcode, to keep worker start-up lean
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.LABEL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown, cancel_futures=True)
+        return _pool
+
+
+def label_queryset(queryset):
+    return queryset.select_related(None).order_by('created_at', 'id').values_list(
+        'id', 'tracking_id', 'student__name', 'student__hostel_block',
+        'student__room_number')
+
+
+def labels(queryset, limit=None):
+    """One dict per parcel in the shape utils.labelsheet.render_page takes"""
+    rows = label_queryset(queryset)
+    if limit is not None:
+        rows = rows[:limit]
+    for parcel_id, tracking_id, name, block, room in rows:
+        yield {
+            "token": sign_label(str(parcel_id)),
+            "tracking_id": str(tracking_id),
+            "name": name,
+            "location": " · ".join(part for part in (block, room) if part),
+        }
+
+
+def pages(label_list):
+    for start in range(0, len(label_list), LABELS_PER_PAGE):
+        yield label_list[start:start + LABELS_PER_PAGE]
+
+
+def _rendered(render, label_list):
+    futures = [render_pool().submit(render, page) for page in pages(label_list)]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        # Client went away: don't render pages nobody will read
+        for future in futures:
+            future.cancel()
+
+
+def stream_pdf(label_list):
+    writer = PDFWriter()
+    yield writer.start()
+    for page in _rendered(render_pdf_page, label_list):
+        yield writer.page(*page)
+    yield writer.finish()
+
+
+def png_pages(label_list):
+    """PNG bytes per sheet, in order"""
+    return _rendered(render_png, label_list)
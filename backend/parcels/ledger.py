@@ -0,0 +1,202 @@
+"""Parcel ledger export as streamed CSV or XLSX.
+
+Rows are read with ``.iterator()`` (a server-side cursor on PostgreSQL)
+and written out a few hundred at a time, so a year of parcels exports in
+constant memory and the first bytes reach the client immediately.
+
+XLSX is written by hand: a workbook is a zip of XML parts, and zipfile can
+write to a non-seekable stream, so the worksheet is produced row by row
+with inline strings instead of buffering a shared-strings table.
+"""
+import csv
+import re
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .models import Parcel
+
+HEADER = ("Tracking ID", "Status", "Student", "Block", "Room", "Service",
+          "Received", "Picked up", "Pickup latency (hours)")
+
+COLUMNS = ("tracking_id", "status", "student__name", "student__hostel_block",
+           "student__room_number", "service", "created_at", "picked_up_time")
+
+CHUNK_ROWS = 500
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def ledger_queryset(queryset=None):
+    queryset = Parcel.objects.all() if queryset is None else queryset
+    return queryset.order_by("created_at", "id").values_list(*COLUMNS)
+
+
+def ledger_rows(queryset):
+    """(tracking id, status, student, block, room, service, received,
+    picked up, latency hours) per parcel, times in the current timezone"""
+    for (tracking_id, status, name, block, room, service, created_at,
+         picked_up_time) in queryset.iterator(chunk_size=2000):
+        created_at = timezone.localtime(created_at)
+        latency = None
+        if picked_up_time is not None:
+            picked_up_time = timezone.localtime(picked_up_time)
+            latency = round(
+                (picked_up_time - created_at).total_seconds() / 3600, 2)
+        yield (tracking_id, status, name, block, room, service or "",
+               created_at, picked_up_time, latency)
+
+
+class _Buffer:
+    """Write target that hands back whatever was written since last asked"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data) if isinstance(data, memoryview)
+                           else data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+# Leading characters that make a spreadsheet read a cell as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _csv_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # Names, blocks and services are user-supplied; a leading quote
+        # keeps Excel from running them (OWASP CSV injection)
+        return f"'{value}"
+    return value
+
+
+def stream_csv(rows):
+    class Echo:
+        def write(self, value):
+            return value
+
+    writer = csv.writer(Echo())
+    yield "\ufeff".encode()  # BOM so Excel opens it as UTF-8
+    yield writer.writerow(HEADER).encode()
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow([_csv_cell(value) for value in row]))
+        if len(lines) >= CHUNK_ROWS:
+            yield "".join(lines).encode()
+            lines = []
+    if lines:
+        yield "".join(lines).encode()
+
+
+# Characters XML 1.0 does not allow, even escaped
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Ledger" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'),
+    # Style 1: date-time cells; style 2: bold header
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm"/></numFmts>'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="3"><xf/>'
+        '<xf numFmtId="164" applyNumberFormat="1"/>'
+        '<xf fontId="1" applyFont="1"/></cellXfs>'
+        '</styleSheet>'),
+}
+
+
+def _cell(value, style=0):
+    if value is None or value == "":
+        return "<c/>"
+    if isinstance(value, datetime):
+        serial = (value.replace(tzinfo=None) - _EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c s="1"><v>{serial:.6f}</v></c>'
+    if isinstance(value, (int, float)):
+        return f"<c><v>{value}</v></c>"
+    text = escape(_INVALID_XML.sub("", str(value)))
+    attrs = f' s="{style}"' if style else ""
+    return f'<c t="inlineStr"{attrs}><is><t>{text}</t></is></c>'
+
+
+def stream_xlsx(rows):
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, xml in _STATIC_PARTS.items():
+            archive.writestr(name, xml)
+        yield buffer.take()
+
+        with archive.open("xl/worksheets/sheet1.xml", "w",
+                          force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData><row>'
+                + "".join(_cell(title, style=2) for title in HEADER).encode()
+                + b"</row>")
+            lines = []
+            for row in rows:
+                lines.append("<row>" + "".join(map(_cell, row)) + "</row>")
+                if len(lines) >= CHUNK_ROWS:
+                    sheet.write("".join(lines).encode())
+                    lines = []
+                    yield buffer.take()
+            sheet.write("".join(lines).encode()
+                        + b"</sheetData></worksheet>")
+    yield buffer.take()
+
+
+STREAMS = {"csv": stream_csv, "xlsx": stream_xlsx}
+
+
+def export_filename(fmt, params):
+    suffix = params.get("month") or timezone.localdate().isoformat()
+    return f"parcel-ledger-{suffix}.{fmt}"
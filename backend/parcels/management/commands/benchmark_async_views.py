@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import AsyncClient, Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from parcels.models import Parcel
+from students.models import Student
+from utils.benchmark import measure_concurrent, report, summarize
+from utils.timing import wrap_queries
+
+# (name, WSGI path, ASGI path)
+ENDPOINTS = [
+    ("my_parcels", "/parcels/my/?clerk_id={clerk_id}",
+     "/parcels/async/my/?clerk_id={clerk_id}"),
+    ("get_student_by_clerk_id", "/students/by-clerk/?clerk_id={clerk_id}",
+     "/students/async/by-clerk/?clerk_id={clerk_id}"),
+    ("parcel_qr_base64", "/parcels/qr/{parcel_id}/base64/",
+     "/parcels/async/qr/{parcel_id}/base64/"),
+    ("all_parcels", "/parcels/all/", "/parcels/async/all/"),
+]
+
+
+class Command(BaseCommand):
+    help = ("Compare concurrent throughput of the sync (WSGI) and async "
+            "(ASGI) read endpoints against the configured database. "
+            "Seed it first with generate_synthetic_data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--db-latency-ms", type=float, default=0,
+                            help="Sleep before every query to emulate a "
+                                 "remote database round trip")
+        parser.add_argument("--endpoints", nargs="+",
+                            choices=[name for name, _, _ in ENDPOINTS],
+                            default=[name for name, _, _ in ENDPOINTS])
+
+    def handle(self, *args, **options):
+        student = Student.objects.annotate(n=Count("parcels")).order_by(
+            "-n").first()
+        parcel = Parcel.objects.filter(
+            status=Parcel.ParcelStatus.PENDING).first()
+        if student is None or parcel is None:
+            raise CommandError("No data; run generate_synthetic_data first")
+        params = {"clerk_id": student.clerk_id, "parcel_id": parcel.id}
+
+        latency = options["db_latency_ms"] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        self.wrapper = slow_query if latency else None
+
+        setup_test_environment()
+        try:
+            for name, sync_path, async_path in ENDPOINTS:
+                if name not in options["endpoints"]:
+                    continue
+                self.bench_wsgi(name, sync_path.format(**params), options)
+                asyncio.run(self.bench_asgi(
+                    name, async_path.format(**params), options))
+        finally:
+            teardown_test_environment()
+
+    def bench_wsgi(self, name, path, options):
+        client = Client()
+
+        def call():
+            if self.wrapper is None:
+                return client.get(path).status_code
+            with wrap_queries(self.wrapper):
+                return client.get(path).status_code
+
+        measure_concurrent(f"wsgi {name}", [call] * options["requests"],
+                           concurrency=options["concurrency"])
+
+    async def bench_asgi(self, name, path, options):
+        client = AsyncClient()
+        limit = asyncio.Semaphore(options["concurrency"])
+
+        async def call():
+            async with limit:
+                start = time.perf_counter()
+                await client.get(path)
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        if self.wrapper is None:
+            samples = await asyncio.gather(
+                *(call() for _ in range(options["requests"])))
+        else:
+            with wrap_queries(self.wrapper):
+                samples = await asyncio.gather(
+                    *(call() for _ in range(options["requests"])))
+        report(summarize(f"asgi {name}", samples,
+                         time.perf_counter() - start))
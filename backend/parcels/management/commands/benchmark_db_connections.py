@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.db.utils import ConnectionHandler
+
+from backend.db import CONN_MODES, apply_conn_mode
+from utils.benchmark import report, summarize
+
+
+class Command(BaseCommand):
+    help = ("Measure per-request database connection overhead for each "
+            "DB_CONN_MODE against the configured DATABASE_URL")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument("--modes", nargs="+", choices=CONN_MODES,
+                            default=list(CONN_MODES))
+        parser.add_argument("--pgbouncer", action="store_true",
+                            help="Apply the transaction-pooler settings too")
+
+    def handle(self, *args, **options):
+        base = settings.DATABASES[DEFAULT_DB_ALIAS]
+        for mode in options["modes"]:
+            try:
+                db = apply_conn_mode(base, mode,
+                                     pgbouncer=options["pgbouncer"])
+            except ImproperlyConfigured as e:
+                self.stdout.write(f"skipping {mode}: {e}")
+                continue
+            self.run_mode(mode, db, options["requests"])
+
+    def run_mode(self, mode, db, requests):
+        connection = ConnectionHandler({DEFAULT_DB_ALIAS: db})[DEFAULT_DB_ALIAS]
+        samples = []
+        try:
+            for _ in range(requests):
+                start = time.perf_counter()
+                # What request_started/request_finished do around a view
+                connection.close_if_unusable_or_obsolete()
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+                connection.close_if_unusable_or_obsolete()
+                samples.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+            if hasattr(connection, "close_pool"):
+                connection.close_pool()
+        report(summarize(f"db conn mode={mode}", samples))
@@ -0,0 +1,69 @@
+import gzip
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.renderers import JSONRenderer
+
+from parcels.models import Parcel
+from parcels.serializers import ParcelSerializer
+from parcels.views import with_qr_urls
+from utils.benchmark import measure
+from utils.compression import brotli
+from utils.rendering import ORJSONRenderer
+
+LISTS = [("parcels_all", "/parcels/all/"), ("students_all", "/students/all/")]
+
+
+class Command(BaseCommand):
+    help = ("Compare DRF's JSONRenderer with the orjson renderer on the "
+            "/parcels/all/ payload, report compressed sizes, and peak memory "
+            "of buffered vs streamed (?stream=1) large lists. Seed data "
+            "first with generate_synthetic_data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=None)
+
+    def handle(self, *args, **options):
+        parcels = Parcel.objects.select_related("student")
+        if not parcels.exists():
+            raise CommandError("No data; run generate_synthetic_data first")
+        data = with_qr_urls(ParcelSerializer(parcels, many=True).data)
+        self.stdout.write(f"{len(data)} parcels")
+
+        iterations = options["iterations"]
+        measure("render drf JSONRenderer",
+                lambda: JSONRenderer().render(data), iterations)
+        measure("render ORJSONRenderer",
+                lambda: ORJSONRenderer().render(data), iterations)
+
+        body = ORJSONRenderer().render(data)
+        sizes = [f"identity {len(body)}",
+                 f"gzip {len(gzip.compress(body, compresslevel=6))}"]
+        if brotli is not None:
+            sizes.append(f"br {len(brotli.compress(body, quality=5))}")
+        self.stdout.write(f"/parcels/all/ bytes: {', '.join(sizes)}")
+
+        setup_test_environment()
+        try:
+            client = Client()
+            for name, path in LISTS:
+                for mode, suffix in (("buffered", ""), ("streamed", "?stream=1")):
+                    peak = self.peak_memory(client, path + suffix)
+                    self.stdout.write(
+                        f"{name} {mode}: peak {peak / 1024 / 1024:.1f} MiB")
+        finally:
+            teardown_test_environment()
+
+    def peak_memory(self, client, path):
+        tracemalloc.start()
+        try:
+            response = client.get(path)
+            # Drain the body the way a WSGI server would, chunk by chunk
+            for _ in (response.streaming_content if response.streaming
+                      else [response.content]):
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,51 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from parcels.filters import filter_parcels
+from parcels.ledger import STREAMS, export_filename, ledger_queryset, ledger_rows
+from parcels.models import Parcel
+
+
+class Command(BaseCommand):
+    help = ("Export the parcel ledger (parcel, student, block, room, service, "
+            "received/picked-up times, pickup latency) as CSV or XLSX, "
+            "streamed in constant memory")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(STREAMS), default="csv")
+        parser.add_argument("--output", "-o",
+                            help="File to write; '-' for stdout. Defaults to "
+                                 "parcel-ledger-<month or date>.<format>")
+        parser.add_argument("--month", help="YYYY-MM")
+        parser.add_argument("--created-after", help="YYYY-MM-DD, inclusive")
+        parser.add_argument("--created-before", help="YYYY-MM-DD, inclusive")
+        parser.add_argument("--status")
+        parser.add_argument("--block")
+        parser.add_argument("--service")
+
+    def handle(self, *args, **options):
+        fmt = options["format"]
+        params = {key: options[key] for key in (
+            "month", "created_after", "created_before", "status", "block",
+            "service") if options[key]}
+        try:
+            parcels = filter_parcels(Parcel.objects.all(), params)
+        except ValidationError as e:
+            raise CommandError(e.detail)
+
+        output = options["output"] or export_filename(fmt, params)
+        chunks = STREAMS[fmt](ledger_rows(ledger_queryset(parcels)))
+        if output == "-":
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        written = 0
+        with open(output, "wb") as out:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        self.stdout.write(f"Wrote {written} bytes to {output}")
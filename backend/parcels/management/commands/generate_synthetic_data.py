@@ -0,0 +1,133 @@
+import random
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from parcels.models import Parcel
+from students.models import Student
+from support.models import HelpRequest
+
+BLOCKS = ["Block A", "Block B", "Block C", "Block D", "Block E", "Block F"]
+FIRST_NAMES = ["Aarav", "Vivaan", "Aditya", "Diya", "Ananya", "Ishaan",
+               "Kavya", "Rohan", "Saanvi", "Arjun", "Meera", "Kabir",
+               "Priya", "Reyansh", "Tara", "Vihaan", "Nisha", "Dev"]
+LAST_NAMES = ["Sharma", "Verma", "Iyer", "Reddy", "Nair", "Gupta", "Khan",
+              "Das", "Mehta", "Patel", "Singh", "Rao", "Bose", "Joshi"]
+# Rough share of parcels per courier at a campus hostel
+SERVICES = [("Amazon", 40), ("Flipkart", 25), ("Myntra", 10),
+            ("Blinkit", 8), ("BlueDart", 7), ("India Post", 6), ("DTDC", 4)]
+HELP_MESSAGES = ["Parcel not found at the counter", "QR code not scanning",
+                 "Wrong room number on parcel", "Parcel damaged",
+                 "Picked up by someone else"]
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate students, parcels and help requests for load tests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=1000)
+        parser.add_argument("--parcels", type=int, default=10000)
+        parser.add_argument("--days", type=int, default=120,
+                            help="Spread parcel arrivals over this many days")
+        parser.add_argument("--help-rate", type=float, default=0.03,
+                            help="Fraction of parcels with a help request")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+
+        with transaction.atomic():
+            students = self.make_students(rng, options["students"])
+            Student.objects.bulk_create(students, batch_size=batch_size)
+
+            parcels = self.make_parcels(
+                rng, students, options["parcels"], options["days"])
+            created = [parcel.created_at for parcel in parcels]
+            Parcel.objects.bulk_create(parcels, batch_size=batch_size)
+            # auto_now_add overwrites created_at on the instances too;
+            # put the generated timestamps back and save them
+            for parcel, created_at in zip(parcels, created):
+                parcel.created_at = created_at
+            Parcel.objects.bulk_update(
+                parcels, ["created_at"], batch_size=batch_size)
+
+            help_requests = self.make_help_requests(
+                rng, parcels, options["help_rate"])
+            HelpRequest.objects.bulk_create(
+                help_requests, batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(students)} students, {len(parcels)} parcels, "
+            f"{len(help_requests)} help requests"
+        ))
+
+    def make_students(self, rng, count):
+        students = []
+        for _ in range(count):
+            suffix = uuid.UUID(int=rng.getrandbits(128)).hex
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            students.append(Student(
+                id=uuid.UUID(int=rng.getrandbits(128)),
+                clerk_id=f"user_synthetic_{suffix}",
+                name=name,
+                email=f"{name.split()[0].lower()}.{suffix[:12]}@example.edu",
+                phone=f"9{rng.randrange(10 ** 9):09d}",
+                hostel_block=rng.choice(BLOCKS),
+                room_number=f"{rng.randint(1, 4)}{rng.randint(1, 40):02d}",
+            ))
+        return students
+
+    def make_parcels(self, rng, students, count, days):
+        now = timezone.now()
+        services, weights = zip(*SERVICES)
+        # A few heavy online shoppers receive most parcels (Pareto-ish)
+        student_weights = [rng.paretovariate(1.5) for _ in students]
+        owners = rng.choices(students, weights=student_weights, k=count)
+
+        parcels = []
+        for student in owners:
+            # Deliveries land during the day and peak in the afternoon
+            day = rng.randrange(days)
+            hour = min(21, max(8, int(rng.gauss(15, 2.5))))
+            created_at = (now - timedelta(days=day)).replace(
+                hour=hour, minute=rng.randrange(60))
+            created_at = min(created_at, now)
+
+            # Most parcels are collected the same evening, a few linger
+            pickup_hours = rng.lognormvariate(1.5, 1.0)
+            picked_up_time = created_at + timedelta(hours=pickup_hours)
+            picked_up = picked_up_time < now and rng.random() < 0.97
+
+            parcels.append(Parcel(
+                student=student,
+                tracking_id=str(uuid.UUID(int=rng.getrandbits(128))),
+                description=f"Package from {student.hostel_block}",
+                service=rng.choices(services, weights=weights)[0],
+                status=(Parcel.ParcelStatus.PICKED_UP if picked_up
+                        else Parcel.ParcelStatus.PENDING),
+                created_at=created_at,
+                picked_up_time=picked_up_time if picked_up else None,
+            ))
+        return parcels
+
+    def make_help_requests(self, rng, parcels, rate):
+        help_requests = []
+        for parcel in parcels:
+            if rng.random() >= rate:
+                continue
+            help_requests.append(HelpRequest(
+                user_type="student",
+                student=parcel.student,
+                parcel=parcel,
+                email=parcel.student.email,
+                message=rng.choice(HELP_MESSAGES),
+                status=rng.choices(
+                    ["pending", "in_progress", "resolved"],
+                    weights=[3, 1, 6])[0],
+            ))
+        return help_requests
@@ -0,0 +1,94 @@
+import os
+import re
+import resource
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules that only specific requests need and that must be imported on
+# first use, not when a worker boots
+LAZY_MODULES = ("qrcode", "PIL", "cloudinary", "cloudinary_storage.storage")
+
+STARTUP = """\
+import importlib
+import django
+django.setup()
+importlib.import_module({entry!r})
+from django.conf import settings
+importlib.import_module(settings.ROOT_URLCONF)
+"""
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_importtime(stderr):
+    """(module, self_us, cumulative_us, depth) per line of -X importtime"""
+    rows = []
+    for line in stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us),
+                         (len(indent) - 1) // 2))
+    return rows
+
+
+class Command(BaseCommand):
+    help = ("Profile worker cold start with python -X importtime: boot "
+            "Django in a fresh interpreter, load the WSGI/ASGI entry point "
+            "and URLconf, and summarise where the import time goes. Fails "
+            "if a module that should load lazily was imported.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--entry", default="backend.wsgi",
+                            help="Entry point module (e.g. backend.asgi)")
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--budget-ms", type=float, default=None,
+                            help="Fail if total import time exceeds this")
+        parser.add_argument("--allow", nargs="*", default=[],
+                            help="Lazy modules to tolerate this run")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        # settings.SETTINGS_MODULE reads None under override_settings
+        env.setdefault("DJANGO_SETTINGS_MODULE", settings.SETTINGS_MODULE)
+        before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c",
+             STARTUP.format(entry=options["entry"])],
+            env=env, capture_output=True, text=True, cwd=settings.BASE_DIR,
+        )
+        if result.returncode:
+            raise CommandError(f"Startup failed:\n{result.stderr[-2000:]}")
+        maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+        rows = parse_importtime(result.stderr)
+        total_us = sum(cum for _, _, cum, depth in rows if depth == 0)
+        by_package = defaultdict(int)
+        for name, self_us, _, _ in rows:
+            by_package[name.split(".")[0]] += self_us
+
+        self.stdout.write(
+            f"{options['entry']}: {len(rows)} modules, "
+            f"{total_us / 1000:.1f} ms import time"
+            # maxrss only grows, so it is the child's peak unless an
+            # earlier child of this process peaked higher
+            + (f", peak RSS {maxrss / 1024:.1f} MiB" if maxrss > before else ""))
+        self.stdout.write("Top packages by self time:")
+        for package, self_us in sorted(by_package.items(),
+                                       key=lambda item: -item[1])[:options["top"]]:
+            self.stdout.write(f"  {self_us / 1000:8.1f} ms  {package}")
+
+        loaded = {name for name, _, _, _ in rows}
+        eager = [module for module in LAZY_MODULES
+                 if module in loaded and module not in options["allow"]]
+        if eager:
+            raise CommandError(
+                f"Imported at startup but should load lazily: {', '.join(eager)}")
+        if options["budget_ms"] is not None and total_us / 1000 > options["budget_ms"]:
+            raise CommandError(
+                f"Import time {total_us / 1000:.1f} ms exceeds budget "
+                f"{options['budget_ms']:.1f} ms")
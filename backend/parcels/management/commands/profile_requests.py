@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.profiling import (
+    HEADER, MODES, clear_toggle, make_token, set_toggle)
+
+
+class Command(BaseCommand):
+    help = ("Ask for request profiles (needs PROFILING_ENABLED). `token` "
+            "prints an X-Profile header value for profiling chosen requests; "
+            "`on` profiles every request under a path for a while, in all "
+            "workers; `off` stops that. Reports land in PROFILING_DIR.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["token", "on", "off"])
+        parser.add_argument("--mode", choices=MODES, default="sample")
+        parser.add_argument("--path", default="/",
+                            help="Path prefix to profile (on)")
+        parser.add_argument("--minutes", type=int, default=10,
+                            help="How long profiling stays on (on)")
+
+    def handle(self, *args, **options):
+        if not settings.PROFILING_ENABLED:
+            self.stderr.write("PROFILING_ENABLED is off; requests won't be "
+                              "profiled until it is set")
+
+        if options["action"] == "token":
+            minutes = settings.PROFILING_TOKEN_MAX_AGE // 60
+            self.stdout.write(f"{HEADER}: {make_token(options['mode'])}")
+            self.stdout.write(f"(valid for {minutes} minutes)")
+        elif options["action"] == "on":
+            if options["minutes"] <= 0:
+                raise CommandError("--minutes must be positive")
+            if settings.CACHES["default"]["BACKEND"].endswith("LocMemCache"):
+                self.stderr.write("The default cache is per process, so web "
+                                  "workers won't see this; set CACHE_BACKEND "
+                                  "to a shared cache or use `token`")
+            set_toggle(options["path"], options["mode"], options["minutes"])
+            self.stdout.write(
+                f"Profiling {options['path']}* ({options['mode']}) for "
+                f"{options['minutes']} minutes; workers pick it up within "
+                f"{settings.PROFILING_TOGGLE_POLL_SECONDS}s")
+        else:
+            clear_toggle()
+            self.stdout.write("Profiling toggle cleared")
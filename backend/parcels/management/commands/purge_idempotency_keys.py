@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from parcels.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = ("Delete stored Idempotency-Key responses older than "
+            "IDEMPOTENCY_TTL_HOURS. Run it from cron, e.g. hourly.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {purge_expired()} expired keys")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from parcels.deferred import upload_deferred
+
+
+class Command(BaseCommand):
+    help = ("Upload parcel photos queued while image uploads were "
+            "unavailable. Run it from cron, e.g. every minute.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None,
+                            help="Upload at most this many photos")
+
+    def handle(self, *args, **options):
+        uploaded, dropped, remaining = upload_deferred(options["limit"])
+        self.stdout.write(f"Uploaded {uploaded} photos, dropped {dropped}, "
+                          f"{remaining} still queued")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parcels', '0007_imageasset'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='parcel',
+            name='image',
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parcels', '0010_parcel_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeferredUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64)),
+                ('data', models.BinaryField()),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('parcel', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='deferred_upload', to='parcels.parcel')),
+            ],
+        ),
+    ]
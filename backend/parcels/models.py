@@ -1,7 +1,7 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from students.models import Student
 import uuid
-from cloudinary.models import CloudinaryField
 
 
 class Parcel(models.Model):
@@ -22,19 +22,12 @@ class Parcel(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     picked_up_time = models.DateTimeField(blank=True, null=True)
+    # Set on every save; queryset update()s must set it themselves. Keys
+    # the cached serialized form of the parcel (parcels.serializers)
+    updated_at = models.DateTimeField(auto_now=True)
     
-    image = CloudinaryField(
-        'image',
-        folder='hosteldrop/parcels',
-        blank=True,
-        null=True,
-        transformation={
-            'width': 800,
-            'height': 600,
-            'crop': 'limit',
-            'quality': 'auto:good'
-        }
-    )
+    # URL from the configured image storage (see parcels.storage)
+    image = models.CharField(max_length=500, blank=True, null=True)
 
     def save(self, *args, **kwargs):
         if not self.tracking_id:
@@ -51,3 +44,51 @@ class Parcel(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
         ]
+
+
+class ImageAsset(models.Model):
+    """Index of uploaded parcel photos by content hash, so a re-sent photo
+    (e.g. a guard retrying create_parcel) reuses the stored asset"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    url = models.URLField(max_length=500)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} -> {self.url}"
+
+
+class IdempotencyKey(models.Model):
+    """Response stored for an ``Idempotency-Key`` header, so a retried
+    write replays it instead of running again (see parcels.idempotency).
+    ``status_code`` is null while the first request is still running."""
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=100)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'],
+                                    name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key} -> {self.status_code or 'in flight'}"
+
+
+class DeferredUpload(models.Model):
+    """A parcel photo that arrived while image uploads were unavailable,
+    kept until ``manage.py upload_deferred_images`` stores it and sets
+    Parcel.image (see parcels.deferred)"""
+    parcel = models.OneToOneField(
+        Parcel, on_delete=models.CASCADE, related_name='deferred_upload')
+    sha256 = models.CharField(max_length=64)
+    data = models.BinaryField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Photo for parcel {self.parcel_id} ({self.attempts} attempts)"
@@ -0,0 +1,141 @@
+"""Consumed-token store: parcels whose QR has already been redeemed.
+
+Guards rescan the same code and students show old screenshots; those
+scans are answered 409 from here without a database query. Parcels are
+recorded by id once picked up, so every token ever issued for them is
+covered, whichever way they were released (verify_qr, the scan socket,
+a pickup pass or mark_picked_up).
+
+Lookups go through up to three tiers:
+
+* an optional Bloom filter (CONSUMED_BLOOM_CAPACITY > 0) that answers
+  "not consumed" for fresh scans without a cache round trip. It is seeded
+  on first use with the parcels picked up while their tokens can still be
+  valid, so a restarted worker keeps refusing them. A "maybe" is confirmed
+  by the other tiers, so it can't cause a false 409; ids consumed by other
+  workers since the seeding miss it and go to the database as before;
+* an in-process LRU of recent ids (CONSUMED_LRU_SIZE), trusted for
+  CONSUMED_LOCAL_SECONDS;
+* the default cache, shared by all workers and surviving their restarts
+  when it is Redis or Memcached, for as long as a token stays valid.
+
+A parcel set back to pending (e.g. in the admin) is forgotten by the shared
+tier and this worker at once, and by other workers within
+CONSUMED_LOCAL_SECONDS.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from functools import cache
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.utils import timezone
+
+from utils.metrics import REPLAY_HITS
+from .models import Parcel
+
+# Tokens are valid for 48 hours (utils.qr); a parcel can't be replayed later
+SHARED_TIMEOUT = 48 * 3600
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, sized for ``capacity`` items at
+    ``error_rate`` false positives"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate)
+                               / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class ConsumedParcels:
+    def __init__(self, lru_size, local_seconds, bloom_capacity=0):
+        self.lru_size = lru_size
+        self.local_seconds = local_seconds
+        self.bloom = BloomFilter(bloom_capacity) if bloom_capacity else None
+        self.recent = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(parcel_id):
+        return f"consumed:{parcel_id}"
+
+    def _remember(self, key):
+        with self.lock:
+            self.recent[key] = time.monotonic()
+            self.recent.move_to_end(key)
+            if len(self.recent) > self.lru_size:
+                self.recent.popitem(last=False)
+            if self.bloom is not None:
+                self.bloom.add(key)
+
+    def __contains__(self, parcel_id):
+        key = self._key(parcel_id)
+        if self.bloom is not None and key not in self.bloom:
+            return False
+        with self.lock:
+            seen = self.recent.get(key)
+        if seen is not None and time.monotonic() - seen < self.local_seconds:
+            REPLAY_HITS.labels("local").inc()
+            return True
+        if shared_cache.get(key):
+            REPLAY_HITS.labels("shared").inc()
+            self._remember(key)
+            return True
+        return False
+
+    def add_many(self, parcel_ids):
+        keys = [self._key(parcel_id) for parcel_id in parcel_ids]
+        shared_cache.set_many(dict.fromkeys(keys, True), SHARED_TIMEOUT)
+        for key in keys:
+            self._remember(key)
+
+    def add(self, parcel_id):
+        self.add_many([parcel_id])
+
+    def discard(self, parcel_id):
+        key = self._key(parcel_id)
+        shared_cache.delete(key)
+        with self.lock:
+            self.recent.pop(key, None)
+
+
+@cache
+def _consumed_parcels(lru_size, local_seconds, bloom_capacity):
+    consumed = ConsumedParcels(lru_size, local_seconds, bloom_capacity)
+    if consumed.bloom is not None:
+        recent = Parcel.objects.filter(
+            status=Parcel.ParcelStatus.PICKED_UP,
+            picked_up_time__gte=timezone.now() - timedelta(
+                seconds=SHARED_TIMEOUT))
+        for parcel_id in recent.values_list('id', flat=True).iterator():
+            consumed.bloom.add(consumed._key(parcel_id))
+    return consumed
+
+
+def consumed_parcels():
+    """The process's store, or None when CONSUMED_TOKENS_ENABLED is off"""
+    if not settings.CONSUMED_TOKENS_ENABLED:
+        return None
+    return _consumed_parcels(settings.CONSUMED_LRU_SIZE,
+                             settings.CONSUMED_LOCAL_SECONDS,
+                             settings.CONSUMED_BLOOM_CAPACITY)
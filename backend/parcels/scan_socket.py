@@ -0,0 +1,127 @@
+"""WebSocket channel for guard scanning devices, served at /ws/scans/.
+
+A device connects once, authenticating with a SCAN_DEVICE_TOKENS entry
+(``Authorization: Bearer <token>``, or ``?token=`` from a browser, which
+can't set headers on a WebSocket), then sends one JSON text frame per scan:
+
+    {"id": "<device's reference>", "token": "<scanned QR token>"}
+
+and gets back, as each verification finishes,
+
+    {"id": ..., "status": 200, "valid": true, "parcel": {...}}
+
+with the same status and body verify_qr would return. Scans are pipelined:
+a device need not wait for one result before sending the next, up to
+SCAN_PIPELINE_DEPTH of them run at once, and results may arrive out of
+order (match them by ``id``). Once SCAN_PIPELINE_DEPTH are in flight the
+socket stops reading until one finishes, so a device that sends faster
+than scans verify is slowed down by the server's flow control rather than
+queueing work without bound. This skips the TLS handshake and DRF request
+setup a POST to /parcels/verify-qr/ pays on every scan.
+
+Plain ASGI, no Channels: backend/asgi.py routes the path here. Needs an
+ASGI server with WebSocket support (uvicorn with ``websockets``).
+"""
+import asyncio
+import hmac
+import time
+from urllib.parse import parse_qs
+
+import orjson
+from django.conf import settings
+
+from utils.aio import db_write
+from utils.metrics import SCAN_ACK_LATENCY
+from .scanning import verify_scan
+
+PATH = "/ws/scans/"
+
+# Close codes in the application range (4000-4999)
+CLOSE_UNAUTHORIZED = 4401
+
+
+def device_token(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"authorization" and value.startswith(b"Bearer "):
+            return value[7:].decode("latin-1")
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return query.get("token", [""])[0]
+
+
+def is_authorized(scope):
+    token = device_token(scope)
+    return bool(token) and any(
+        hmac.compare_digest(token, allowed)
+        for allowed in settings.SCAN_DEVICE_TOKENS)
+
+
+class ScanSession:
+    def __init__(self, send):
+        self._send = send
+        self.send_lock = asyncio.Lock()
+        self.slots = asyncio.Semaphore(settings.SCAN_PIPELINE_DEPTH)
+        self.tasks = set()
+
+    async def send(self, message):
+        async with self.send_lock:
+            await self._send({"type": "websocket.send",
+                              "text": orjson.dumps(message).decode()})
+
+    async def receive(self, text):
+        """Start handling a frame once a pipeline slot is free"""
+        received = time.perf_counter()
+        # Waiting here, not in the task, stops the read loop while the
+        # pipeline is full: the backlog is at most SCAN_PIPELINE_DEPTH
+        await self.slots.acquire()
+        task = asyncio.create_task(self.handle(text, received))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def handle(self, text, received):
+        try:
+            try:
+                frame = orjson.loads(text)
+            except orjson.JSONDecodeError:
+                frame = None
+            if not isinstance(frame, dict):
+                await self.send({"id": None, "status": 400,
+                                 "error": "Send a JSON object per scan"})
+                return
+
+            try:
+                code, body = await db_write(verify_scan, frame.get("token"))
+            except Exception as e:
+                code, body = 500, {"error": str(e)}
+            await self.send({"id": frame.get("id"), "status": code, **body})
+            SCAN_ACK_LATENCY.observe(time.perf_counter() - received)
+        finally:
+            self.slots.release()
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def scan_socket(scope, receive, send):
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    if not is_authorized(scope):
+        # Closing before accepting makes the server answer 403
+        await send({"type": "websocket.close", "code": CLOSE_UNAUTHORIZED})
+        return
+    await send({"type": "websocket.accept"})
+
+    session = ScanSession(send)
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            text = message.get("text")
+            if text is None and message.get("bytes") is not None:
+                text = message["bytes"].decode("utf-8", "replace")
+            await session.receive(text or "")
+    finally:
+        await session.close()
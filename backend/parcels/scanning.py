@@ -0,0 +1,103 @@
+"""Parcel QR verification shared by the verify_qr view and the guard
+devices' scan socket (parcels/scan_socket.py)."""
+from django.core.signing import BadSignature, SignatureExpired
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+
+from utils.metrics import QR_VERIFICATIONS
+from utils.qr import unsign_scanned
+from .cache import bump_parcels_version
+from .models import Parcel
+from .replay import consumed_parcels
+
+
+def _already_picked():
+    QR_VERIFICATIONS.labels("already_picked").inc()
+    return status.HTTP_409_CONFLICT, {
+        "valid": False,
+        "reason": "already_picked",
+        "message": "Parcel has already been picked up"
+    }
+
+
+def verify_scan(token):
+    """Check a scanned parcel token and mark the parcel as picked up.
+
+    Returns ``(http status, response body)``; every outcome is counted in
+    QR_VERIFICATIONS.
+    """
+    if not token:
+        QR_VERIFICATIONS.labels("missing").inc()
+        return status.HTTP_400_BAD_REQUEST, {"error": "token required"}
+
+    try:
+        # Verify token signature (dashboard code or printed label) and
+        # extract parcel_id
+        parcel_id = unsign_scanned(token)
+        # ✅ Convert to int since unsign_token returns string
+        parcel_id = int(parcel_id)
+    except SignatureExpired:
+        QR_VERIFICATIONS.labels("expired").inc()
+        return status.HTTP_410_GONE, {
+            "valid": False, "reason": "expired",
+            "message": "QR code has expired"}
+    except ValueError:
+        QR_VERIFICATIONS.labels("invalid").inc()
+        return status.HTTP_400_BAD_REQUEST, {
+            "valid": False, "reason": "invalid",
+            "message": "Invalid parcel ID in QR code"}
+    except BadSignature:
+        QR_VERIFICATIONS.labels("tampered").inc()
+        return status.HTTP_400_BAD_REQUEST, {
+            "valid": False, "reason": "tampered", "message": "Invalid QR code"}
+
+    # Rescans of redeemed codes are answered without a query
+    consumed = consumed_parcels()
+    if consumed is not None and parcel_id in consumed:
+        return _already_picked()
+
+    try:
+        parcel = Parcel.objects.select_related('student').get(id=parcel_id)
+    except Parcel.DoesNotExist:
+        QR_VERIFICATIONS.labels("not_found").inc()
+        return status.HTTP_404_NOT_FOUND, {
+            "valid": False, "reason": "not_found",
+            "message": "Parcel not found"}
+
+    # Check if parcel is still available for pickup
+    if parcel.status != Parcel.ParcelStatus.PENDING:
+        if consumed is not None:
+            consumed.add(parcel.id)
+        return _already_picked()
+
+    # Mark as picked up, conditionally: of two concurrent scans of the same
+    # code (a pipelined retry, two counters) only one may release it
+    parcel.status = Parcel.ParcelStatus.PICKED_UP
+    parcel.picked_up_time = timezone.now()
+    released = Parcel.objects.filter(
+        id=parcel.id, status=Parcel.ParcelStatus.PENDING,
+    ).update(status=parcel.status, picked_up_time=parcel.picked_up_time,
+             updated_at=parcel.picked_up_time)
+    if not released:
+        return _already_picked()
+    # update() skips the post_save signal that normally does these
+    bump_parcels_version(parcel.student_id)
+    if consumed is not None:
+        transaction.on_commit(lambda: consumed.add(parcel.id))
+    QR_VERIFICATIONS.labels("valid").inc()
+
+    return status.HTTP_200_OK, {
+        "valid": True,
+        "message": "Parcel successfully picked up!",
+        "parcel": {
+            "id": parcel.id,
+            "tracking_id": parcel.tracking_id,
+            "student_name": parcel.student.name,
+            "student_room": parcel.student.room_number,
+            "student_block": parcel.student.hostel_block,
+            "picked_up_at": parcel.picked_up_time.isoformat(),
+            "description": parcel.description,
+            "service": parcel.service
+        }
+    }
@@ -1,6 +1,68 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
 from rest_framework import serializers
 from .models import Parcel
 from students.serializers import StudentMiniSerializer
+from .images import image_url, srcset, variant_url
+
+
+def student_digest(student):
+    """Short stable hash of the student fields a fragment embeds, so a name
+    or room edit changes their parcels' keys and nothing else does"""
+    values = "\x1f".join(str(getattr(student, field))
+                          for field in StudentMiniSerializer.Meta.fields)
+    return hashlib.blake2b(values.encode(), digest_size=8).hexdigest()
+
+
+def fragment_key(parcel, variant, digest=None):
+    if digest is None:
+        digest = student_digest(parcel.student)
+    return (f"parcel:{variant}:{parcel.pk}:{parcel.updated_at.timestamp()}:"
+            f"{digest}")
+
+
+class CachedParcelListSerializer(serializers.ListSerializer):
+    """Assembles lists from each parcel's cached serialized form, fetched
+    in one get_many, so only new or changed parcels run the field
+    machinery. Picked-up parcels no longer change, so they stay cached
+    for FRAGMENT_PICKED_UP_TIMEOUT rather than the list timeout. Sparse
+    (?fields=) lists load trimmed rows and skip the cache.
+    """
+
+    def to_representation(self, data):
+        if self.context.get('fields'):
+            return super().to_representation(data)
+        parcels = list(data.all() if isinstance(data, models.manager.BaseManager)
+                       else data)
+        # No ?image= renders the plain URL plus a srcset, unlike ?image=full
+        variant = self.context.get('image_variant') or 'default'
+        digests = {}
+        keys = []
+        for parcel in parcels:
+            if parcel.student_id not in digests:
+                digests[parcel.student_id] = student_digest(parcel.student)
+            keys.append(fragment_key(
+                parcel, variant, digests[parcel.student_id]))
+        cache = caches['fragments']
+        fragments = cache.get_many(keys)
+
+        picked_up, pending = {}, {}
+        for key, parcel in zip(keys, parcels):
+            if key not in fragments:
+                fragment = self.child.to_representation(parcel)
+                fragments[key] = fragment
+                if parcel.status == Parcel.ParcelStatus.PICKED_UP:
+                    picked_up[key] = fragment
+                else:
+                    pending[key] = fragment
+        if picked_up:
+            cache.set_many(picked_up, settings.FRAGMENT_PICKED_UP_TIMEOUT)
+        if pending:
+            cache.set_many(pending, settings.PARCEL_LIST_CACHE_TIMEOUT)
+        return [fragments[key] for key in keys]
 
 
 class ParcelSerializer(serializers.ModelSerializer):
@@ -11,12 +73,22 @@ class ParcelSerializer(serializers.ModelSerializer):
     class Meta:
         model = Parcel
         fields = '__all__'
+        list_serializer_class = CachedParcelListSerializer
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # ✅ Sparse fieldsets (?fields=id,status on the viewset)
+        only = self.context.get('fields')
+        if only:
+            fields = {name: field for name, field in fields.items()
+                      if name in only}
+        return fields
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
 
         # Ensure student name is always present
-        if data['student'] and 'name' in data['student']:
+        if 'student' not in data or (data['student'] and 'name' in data['student']):
             pass
         else:
             data['student'] = {
@@ -27,14 +99,18 @@ class ParcelSerializer(serializers.ModelSerializer):
                 'email': instance.student.email
             }
 
-        if not data.get('tracking_id'):
+        if 'tracking_id' in data and not data['tracking_id']:
             data['tracking_id'] = str(instance.tracking_id)
 
         # ✅ Handle Cloudinary image URL properly
-        if instance.image:
-            # CloudinaryField returns the full URL directly
-            data['image'] = str(instance.image.url) if hasattr(instance.image, 'url') else str(instance.image)
-        else:
-            data['image'] = None
+        if 'image' in data:
+            url = image_url(instance.image)
+            variant = self.context.get('image_variant')
+            if url and variant:
+                # Lists asked for a single size (e.g. ?image=thumb)
+                data['image'] = variant_url(url, variant)
+            else:
+                data['image'] = url
+                data['image_srcset'] = srcset(url) if url else None
 
         return data
@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from students.models import Student
+from .cache import bump_parcels_version
+from .models import Parcel
+from .replay import consumed_parcels
+
+
+@receiver(post_save, sender=Parcel)
+@receiver(post_delete, sender=Parcel)
+def parcel_changed(sender, instance, **kwargs):
+    """Created, picked up or deleted parcels change the student's list"""
+    bump_parcels_version(instance.student_id)
+
+
+@receiver(post_save, sender=Parcel)
+def parcel_status_changed(sender, instance, created, **kwargs):
+    """Keep the consumed-token store in step with saves (mark_picked_up,
+    the admin); the bulk pickup paths record parcels themselves"""
+    consumed = consumed_parcels()
+    if consumed is None or created:
+        return
+    parcel_id = instance.id
+    # Once committed, so a rolled back pickup never refuses a pending parcel
+    if instance.status == Parcel.ParcelStatus.PICKED_UP:
+        transaction.on_commit(lambda: consumed.add(parcel_id))
+    else:
+        transaction.on_commit(lambda: consumed.discard(parcel_id))
+
+
+@receiver(post_save, sender=Student)
+def student_changed(sender, instance, created, **kwargs):
+    """Parcel lists embed the student's name and room, so edits invalidate"""
+    if not created:
+        bump_parcels_version(instance.pk)
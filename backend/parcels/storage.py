@@ -0,0 +1,167 @@
+"""Where parcel photos live.
+
+IMAGE_STORAGE picks the backend:
+
+``cloudinary``
+    Uploads to Cloudinary, which derives the variants eagerly.
+``local``
+    Writes to LOCAL_IMAGE_ROOT under content-addressed names and serves
+    them from /parcels/media/. Variants are resized on first request and
+    kept on disk next to the original. This needs no external service, so
+    small deployments and offline tests can use it.
+
+Both backends return the URL to store on Parcel.image from ``save`` and
+derive variant URLs from it without I/O.
+"""
+import os
+import re
+import tempfile
+from functools import cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404
+from django.urls import reverse
+
+from utils.uploads import delivery_url, upload
+
+# name -> (max width, max height, crop), smallest first. "fill" crops to
+# exactly that size; "limit" only scales down, keeping the aspect ratio.
+VARIANTS = {
+    "thumb": (160, 120, "fill"),
+    "card": (480, 360, "limit"),
+    "full": (800, 600, "limit"),
+}
+
+
+class CloudinaryImageStorage:
+    def save(self, image_file, digest):
+        # The public id is the content hash, so even a racing duplicate
+        # upload (or a retry, see utils.uploads) lands on the same asset
+        # instead of creating a new one
+        result = upload(
+            image_file,
+            folder="hosteldrop/parcels",
+            public_id=f"parcel_{digest}",
+            overwrite=False,
+            resource_type="image",
+            transformation=[
+                {'width': 800, 'height': 600, 'crop': 'limit'},
+                {'quality': 'auto:good'}
+            ],
+            # Derive the variants in the background now rather than on
+            # the first dashboard load
+            eager=[self.transformation(name) for name in VARIANTS],
+            eager_async=True,
+        )
+        return result['secure_url']
+
+    def url(self, name):
+        if name.startswith(("http://", "https://")):
+            return name
+        # A bare "image/upload/v123/<public id>.jpg" as written by the old
+        # CloudinaryField
+        return delivery_url(name)
+
+    @staticmethod
+    def transformation(variant):
+        width, height, crop = VARIANTS[variant]
+        gravity = "g_auto," if crop == "fill" else ""
+        return f"c_{crop},{gravity}w_{width},h_{height},q_auto"
+
+    def variant_url(self, url, variant):
+        if "/upload/" not in url:
+            # Not a Cloudinary delivery URL; serve it as is
+            return url
+        return url.replace(
+            "/upload/", f"/upload/{self.transformation(variant)}/", 1)
+
+
+class LocalImageStorage:
+    # <first two hex digits>/<sha256>.jpg
+    NAME = re.compile(r"^([0-9a-f]{2})/\1[0-9a-f]{62}\.jpg$")
+    QUALITY = 85
+
+    def __init__(self, root, base_url=""):
+        self.root = root
+        self.base_url = base_url + reverse(
+            'parcel_image', args=('full', 'x'))[:-len('full/x')]
+
+    def path(self, variant, name):
+        if variant not in VARIANTS or not self.NAME.match(name):
+            raise Http404("No such image")
+        return os.path.join(self.root, variant, name)
+
+    def save(self, image_file, digest):
+        name = f"{digest[:2]}/{digest}.jpg"
+        path = self.path('full', name)
+        if not os.path.exists(path):
+            from PIL import Image, ImageOps
+
+            with Image.open(image_file) as image:
+                image = ImageOps.exif_transpose(image).convert("RGB")
+                # Same bounds Cloudinary applies to incoming uploads
+                image.thumbnail(VARIANTS['full'][:2])
+                self._write(image, path)
+        return f"{self.base_url}full/{name}"
+
+    def url(self, name):
+        return name
+
+    def variant_url(self, url, variant):
+        prefix = f"{self.base_url}full/"
+        if not url.startswith(prefix):
+            return url
+        return f"{self.base_url}{variant}/{url[len(prefix):]}"
+
+    def open_variant(self, variant, name):
+        """Filesystem path of a variant, rendering it on first request"""
+        path = self.path(variant, name)
+        if os.path.exists(path):
+            return path
+        original = self.path('full', name)
+        if not os.path.exists(original):
+            raise Http404("No such image")
+
+        from PIL import Image, ImageOps
+
+        width, height, crop = VARIANTS[variant]
+        with Image.open(original) as image:
+            if crop == "fill":
+                image = ImageOps.fit(image, (width, height))
+            else:
+                image = image.copy()
+                image.thumbnail((width, height))
+            self._write(image, path)
+        return path
+
+    def _write(self, image, path):
+        # Concurrent renders of the same file each write a temp file and
+        # atomically rename it into place; readers never see a partial one
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                image.save(out, format="JPEG", quality=self.QUALITY,
+                           optimize=True)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def get_image_storage():
+    """The backend named by IMAGE_STORAGE"""
+    return _image_storage(settings.IMAGE_STORAGE, settings.LOCAL_IMAGE_ROOT,
+                          settings.LOCAL_IMAGE_BASE_URL)
+
+
+@cache
+def _image_storage(backend, local_root, local_base_url):
+    if backend == "cloudinary":
+        return CloudinaryImageStorage()
+    if backend == "local":
+        return LocalImageStorage(local_root, local_base_url)
+    raise ImproperlyConfigured(
+        f"IMAGE_STORAGE must be 'cloudinary' or 'local', not {backend!r}")
@@ -1,3 +1,1638 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connections, router, transaction
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.test import (
+    AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase,
+    TransactionTestCase, override_settings, tag)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from backend.routers import (
+    ReplicaPinningMiddleware, is_pinned, reads_from_replica)
+
+from students.models import Student
+from support.models import HelpRequest
+from utils.benchmark import ITERATIONS, measure, measure_concurrent
+from utils.profiling import (
+    StackSampler, clear_toggle, make_token, prune, set_toggle)
+from utils.qr import pass_signer, signer
+from utils.throttling import get_buckets
+from .models import DeferredUpload, IdempotencyKey, ImageAsset, Parcel
+from .replay import BloomFilter, _consumed_parcels, consumed_parcels
+from .scanning import verify_scan
+from .serializers import ParcelSerializer
+
+FAKE_UPLOAD = {"secure_url": "https://res.cloudinary.com/demo/parcel.jpg"}
+
+
+def seed(students=50, parcels=300):
+    call_command("generate_synthetic_data", students=students,
+                 parcels=parcels, stdout=io.StringIO())
+
+
+@tag("benchmark")
+@mock.patch("cloudinary.uploader.upload", return_value=FAKE_UPLOAD)
+class ParcelEndpointBenchmarks(TestCase):
+    """Latency/throughput per endpoint with query-count budgets.
+
+    Run with ``python manage.py test --tag benchmark`` and raise
+    BENCHMARK_ITERATIONS for stable numbers.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed()
+        cls.student = Student.objects.order_by("?").first()
+        cls.busy_student = max(
+            Student.objects.all(), key=lambda s: s.parcels.count())
+
+    def setUp(self):
+        cache.clear()
+
+    def test_all_parcels(self, upload):
+        with self.assertNumQueries(1):
+            response = self.client.get("/parcels/all/")
+        self.assertEqual(response.status_code, 200)
+        measure("all_parcels", lambda: self.client.get("/parcels/all/"))
+
+    def test_my_parcels(self, upload):
+        url = f"/parcels/my/?clerk_id={self.busy_student.clerk_id}"
+        # Student lookup + parcel list on a cold cache
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Warm cache and conditional GET only resolve the student
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+        def cold():
+            cache.clear()
+            self.client.get(url)
+
+        measure("my_parcels (cold cache)", cold)
+        measure("my_parcels (warm cache)", lambda: self.client.get(url))
+        measure("my_parcels (304)", lambda: self.client.get(
+            url, HTTP_IF_NONE_MATCH=response["ETag"]))
+
+    def test_parcel_qr(self, upload):
+        parcel = Parcel.objects.filter(
+            status=Parcel.ParcelStatus.PENDING).first()
+        url = f"/parcels/qr/{parcel.id}/"
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        measure("parcel_qr", lambda: self.client.get(url))
+        measure("parcel_qr_base64",
+                lambda: self.client.get(f"{url}base64/"))
+
+    def test_verify_qr(self, upload):
+        pending = list(Parcel.objects.filter(
+            status=Parcel.ParcelStatus.PENDING)[:ITERATIONS + 1])
+        tokens = [signer.sign(str(parcel.id)) for parcel in pending]
+
+        # Fetch parcel + student, status update, version bump
+        with self.assertNumQueries(3):
+            response = self.client.post(
+                "/parcels/verify-qr/", {"token": tokens.pop()},
+                content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        tokens = iter(tokens)
+        measure("verify_qr", lambda: self.client.post(
+            "/parcels/verify-qr/", {"token": next(tokens)},
+            content_type="application/json"), iterations=len(pending) - 1)
+
+    def test_create_parcel(self, upload):
+        def create():
+            image = io.BytesIO(b"\x89PNG fake image bytes")
+            image.name = "parcel.png"
+            return self.client.post("/parcels/create/", {
+                "student_id": str(self.student.id),
+                "description": "Benchmark parcel",
+                "service": "Amazon",
+                "image": image,
+            })
+
+        # Student, image hash lookup, hash index insert, parcel insert,
+        # version bump. Repeats reuse the stored image: one fewer query.
+        with self.assertNumQueries(5):
+            response = create()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.json()["parcel"]["image"], FAKE_UPLOAD["secure_url"])
+        measure("create_parcel", create)
+
+
+class RequestTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        student = Student.objects.create(
+            clerk_id="user_timing", name="Tara Iyer", email="tara@example.edu")
+        cls.parcel = Parcel.objects.create(student=student)
+
+    def test_disabled_by_default(self):
+        response = self.client.get(f"/parcels/qr/{self.parcel.id}/")
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(REQUEST_TIMING_ENABLED=True, SLOW_REQUEST_MS=0,
+                       CORS_ALLOWED_ORIGINS=["https://a.example",
+                                             "https://b.example"])
+    def test_server_timing_and_slow_log(self):
+        with self.assertLogs("hosteldrop.slow_requests") as logs:
+            response = Client().get(f"/parcels/qr/{self.parcel.id}/")
+        timing = response["Server-Timing"]
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="1 queries, 0 duplicate"', timing)
+        self.assertIn("qr;dur=", timing)
+        self.assertIn("total;dur=", timing)
+        self.assertEqual(response["Timing-Allow-Origin"],
+                         "https://a.example, https://b.example")
+        self.assertIn("Slow request GET", logs.output[0])
+
+    def test_dispatcher_keeps_execute_wrapper_pairing(self):
+        from django.db import connection
+        from django.db.backends.signals import connection_created
+        from utils.timing import _dispatch_query
+
+        def passthrough(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        # A connection first opened inside someone's execute_wrapper()
+        with mock.patch.object(connection, "execute_wrappers", []):
+            with connection.execute_wrapper(passthrough):
+                connection_created.send(type(connection), connection=connection)
+            self.assertEqual(connection.execute_wrappers, [_dispatch_query])
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        student = Student.objects.create(
+            clerk_id="user_profile", name="Neel Rao", email="neel@example.edu")
+        cls.parcel = Parcel.objects.create(student=student)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_patch = override_settings(
+            PROFILING_ENABLED=True, PROFILING_DIR=self.directory,
+            PROFILING_SAMPLE_INTERVAL_MS=1)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        self.addCleanup(clear_toggle)
+
+    def reports(self):
+        return sorted(os.listdir(self.directory))
+
+    def get(self, **headers):
+        # A new client loads the middleware under the current settings
+        return Client().get(f"/parcels/qr/{self.parcel.id}/", headers=headers)
+
+    def test_unprofiled_requests_leave_nothing(self):
+        self.assertNotIn("X-Profile-Id", self.get())
+        self.assertNotIn("X-Profile-Id", self.get(X_Profile="forged"))
+        self.assertEqual(self.reports(), [])
+
+    def test_signed_header_writes_cprofile_report(self):
+        response = self.get(X_Profile=make_token("cprofile"))
+        report_id = response["X-Profile-Id"]
+        self.assertEqual(self.reports(),
+                         [f"{report_id}.json", f"{report_id}.prof"])
+        with open(os.path.join(self.directory, f"{report_id}.json")) as f:
+            meta = json.load(f)
+        self.assertEqual(meta["view"], "parcel_qr")
+        self.assertEqual((meta["status"], meta["trigger"], meta["mode"]),
+                         (200, "header", "cprofile"))
+
+        import pstats
+
+        stats = pstats.Stats(os.path.join(self.directory, f"{report_id}.prof"))
+        self.assertTrue(any(func == "parcel_qr"
+                            for _, _, func in stats.stats))
+
+    def test_toggle_samples_matching_paths(self):
+        set_toggle(f"/parcels/qr/{self.parcel.id}/", minutes=1)
+        report_id = self.get()["X-Profile-Id"]
+        self.assertEqual(self.reports(),
+                         [f"{report_id}.folded", f"{report_id}.json"])
+        with open(os.path.join(self.directory, f"{report_id}.json")) as f:
+            self.assertEqual(json.load(f)["trigger"], "toggle")
+        self.assertNotIn("X-Profile-Id", Client().get("/parcels/all/"))
+
+    def report(self, report_id, suffix="json"):
+        path = os.path.join(self.directory, f"{report_id}.{suffix}")
+        if suffix == "prof":
+            import pstats
+
+            return pstats.Stats(path)
+        with open(path) as f:
+            return json.load(f) if suffix == "json" else f.read()
+
+    async def test_asgi_profiles_the_view_thread(self):
+        def busy_qr(*args, **kwargs):
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+            return b"png"
+
+        url = f"/parcels/qr/{self.parcel.id}/"
+        with mock.patch("parcels.views.cached_qr_png", busy_qr):
+            # Sync view: runs in a sync_to_async thread, not the loop's
+            response = await AsyncClient().get(
+                url, headers={"X-Profile": make_token("cprofile")})
+            report_id = response["X-Profile-Id"]
+            self.assertEqual(self.report(report_id)["mode"], "cprofile")
+            self.assertTrue(any(
+                func in ("parcel_qr", "busy_qr")
+                for _, _, func in self.report(report_id, "prof").stats))
+
+            response = await AsyncClient().get(
+                url, headers={"X-Profile": make_token("sample")})
+            folded = self.report(response["X-Profile-Id"], "folded")
+            self.assertIn("parcels.views:parcel_qr", folded)
+            self.assertNotIn("EpollSelector", folded)
+
+        # Async views run on the loop: sampled there, cProfile refused
+        response = await AsyncClient().get(
+            f"/parcels/async/qr/{self.parcel.id}/base64/",
+            headers={"X-Profile": make_token("cprofile")})
+        meta = self.report(response["X-Profile-Id"])
+        self.assertEqual(meta["mode"], "sample")
+        self.assertIn("refused", meta)
+
+    def test_sampler_folds_stacks(self):
+        def busy():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+
+        with StackSampler(threading.get_ident(), 0.001) as sampler:
+            busy()
+        self.assertGreater(sampler.samples, 0)
+        stack, count = sampler.folded().splitlines()[0].rsplit(" ", 1)
+        self.assertTrue(stack.endswith("test_sampler_folds_stacks.<locals>.busy"))
+        self.assertGreater(int(count), 0)
+
+    def test_disk_cap_drops_oldest_reports(self):
+        for stem, age in (("old", 30), ("new", 10)):
+            for suffix in ("json", "prof"):
+                path = os.path.join(self.directory, f"{stem}.{suffix}")
+                with open(path, "wb") as f:
+                    f.write(b"x" * 400)
+                os.utime(path, (time.time() - age,) * 2)
+        prune(self.directory, 1000)
+        self.assertEqual(self.reports(), ["new.json", "new.prof"])
+
+
+class ImageVariantTests(TestCase):
+    URL = "https://res.cloudinary.com/demo/image/upload/v1/hosteldrop/parcels/p1.jpg"
+
+    @classmethod
+    def setUpTestData(cls):
+        student = Student.objects.create(
+            clerk_id="user_images", name="Ira Das", email="ira@example.edu")
+        Parcel.objects.create(student=student, image=cls.URL)
+
+    def test_srcset_by_default(self):
+        parcel = self.client.get("/parcels/all/").json()[0]
+        self.assertEqual(parcel["image"], self.URL)
+        self.assertEqual(parcel["image_srcset"].count("/upload/"), 3)
+        self.assertIn("/upload/c_fill,g_auto,w_160,h_120,q_auto/v1/",
+                      parcel["image_srcset"])
+        self.assertTrue(parcel["image_srcset"].endswith(" 800w"))
+
+    def test_thumbnail_only_lists(self):
+        for path in ("/parcels/all/?image=thumb",
+                     "/parcels/my/?clerk_id=user_images&image=thumb"):
+            parcel = self.client.get(path).json()[0]
+            self.assertIn("/upload/c_fill,g_auto,w_160", parcel["image"])
+            self.assertNotIn("image_srcset", parcel)
+
+    @override_settings(CLOUDINARY_STORAGE={
+        "CLOUD_NAME": "demo", "API_KEY": "", "API_SECRET": ""})
+    @mock.patch("utils.uploads._configured", False)
+    def test_bare_public_id_configures_sdk(self):
+        import cloudinary
+
+        # As a fresh worker: nothing configured the SDK at import time. The
+        # SDK config is process-global; put the real one back afterwards
+        patcher = mock.patch.object(cloudinary, "_config", cloudinary.Config())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Parcel.objects.update(image="image/upload/v1/hosteldrop/parcels/p1.jpg")
+        parcel = self.client.get("/parcels/all/").json()[0]
+        self.assertEqual(parcel["image"], self.URL)
+
+    @mock.patch("cloudinary.uploader.upload", return_value=FAKE_UPLOAD)
+    def test_variants_derived_eagerly_on_upload(self, upload):
+        image = io.BytesIO(b"\x89PNG fake image bytes")
+        image.name = "parcel.png"
+        self.client.post("/parcels/create/", {
+            "student_id": str(Student.objects.get().id), "image": image})
+        self.assertEqual(len(upload.call_args.kwargs["eager"]), 3)
+
+
+@mock.patch("cloudinary.uploader.upload", return_value=FAKE_UPLOAD)
+class ImageDedupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = Student.objects.create(
+            clerk_id="user_dedup", name="Om Rao", email="om@example.edu")
+
+    def create(self, content):
+        image = io.BytesIO(content)
+        image.name = "parcel.jpg"
+        return self.client.post("/parcels/create/", {
+            "student_id": str(self.student.id), "image": image})
+
+    def test_identical_photo_uploaded_once(self, upload):
+        first = self.create(b"same photo").json()["parcel"]
+        second = self.create(b"same photo").json()["parcel"]
+        self.assertEqual(upload.call_count, 1)
+        self.assertEqual(first["image"], second["image"])
+        self.assertEqual(ImageAsset.objects.count(), 1)
+        self.assertTrue(upload.call_args.kwargs["public_id"].startswith(
+            f"parcel_{ImageAsset.objects.get().sha256}"))
+
+        self.create(b"another photo")
+        self.assertEqual(upload.call_count, 2)
+
+
+@override_settings(CLOUDINARY_BREAKER_THRESHOLD=2,
+                   CLOUDINARY_BREAKER_COOLDOWN=60)
+@mock.patch("utils.uploads.time.sleep")
+class UploadClientTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = Student.objects.create(
+            clerk_id="user_upload", name="Ira Sen", email="ira@example.edu")
+
+    def setUp(self):
+        # A fresh breaker per test
+        patcher = mock.patch("utils.uploads._breaker", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create(self, content=b"photo"):
+        image = io.BytesIO(content)
+        image.name = "parcel.jpg"
+        return self.client.post("/parcels/create/", {
+            "student_id": str(self.student.id), "image": image})
+
+    def test_transient_failures_are_retried(self, sleep):
+        from cloudinary.exceptions import Error
+
+        with mock.patch("cloudinary.uploader.upload",
+                        side_effect=[Error("Socket error"), FAKE_UPLOAD]) as upload:
+            body = self.create().json()
+        self.assertEqual(upload.call_count, 2)
+        self.assertEqual(body["parcel"]["image"], FAKE_UPLOAD["secure_url"])
+        self.assertFalse(body["image_pending"])
+
+    @override_settings(CLOUDINARY_CONNECT_TIMEOUT=3, CLOUDINARY_READ_TIMEOUT=15,
+                       CLOUDINARY_UPLOAD_DEADLINE=20, CLOUDINARY_UPLOAD_RETRIES=5)
+    def test_retries_stay_within_the_deadline(self, sleep):
+        from cloudinary.exceptions import Error
+
+        clock = [1000.0]
+        timeouts = []
+
+        def timed_out(file, timeout, **options):
+            # Each attempt runs into its read timeout
+            timeouts.append(timeout)
+            clock[0] += timeout.read_timeout
+            raise Error("Read timed out")
+
+        sleep.side_effect = lambda seconds: clock.__setitem__(
+            0, clock[0] + seconds)
+        with mock.patch("utils.uploads.time.monotonic", lambda: clock[0]), \
+                mock.patch("cloudinary.uploader.upload", side_effect=timed_out):
+            body = self.create().json()
+        self.assertTrue(body["image_pending"])
+        self.assertEqual(timeouts[0].read_timeout, 15)
+        # The retry gets only what is left of the 20 s, not another 15 s
+        self.assertEqual(len(timeouts), 2)
+        self.assertLess(timeouts[1].read_timeout, 5)
+        self.assertLessEqual(clock[0], 1020.0)
+
+    def test_rejected_upload_is_not_retried(self, sleep):
+        from cloudinary.exceptions import BadRequest
+
+        with mock.patch("cloudinary.uploader.upload",
+                        side_effect=BadRequest("Invalid image file")) as upload, \
+                self.assertLogs("hosteldrop.parcels", "ERROR"):
+            body = self.create().json()
+        self.assertEqual(upload.call_count, 1)
+        self.assertIsNone(body["parcel"]["image"])
+        self.assertFalse(DeferredUpload.objects.exists())
+
+    def test_open_circuit_defers_uploads_until_drained(self, sleep):
+        from cloudinary.exceptions import Error
+
+        with mock.patch("cloudinary.uploader.upload",
+                        side_effect=Error("Socket error")) as upload:
+            self.create(b"first")
+            self.create(b"second")
+            # Open now: fails fast without calling Cloudinary
+            calls = upload.call_count
+            body = self.create(b"third").json()
+            self.assertEqual(upload.call_count, calls)
+        self.assertEqual(body["parcel"]["image"], None)
+        self.assertTrue(body["image_pending"])
+        self.assertEqual(DeferredUpload.objects.count(), 3)
+
+        health = self.client.get("/health/").json()
+        self.assertEqual(health["status"], "degraded")
+        self.assertEqual(health["image_uploads"]["state"], "open")
+        self.assertEqual(health["image_uploads"]["queued"], 3)
+
+        # A new process (the cron command) starts with a closed circuit
+        out = io.StringIO()
+        with mock.patch("utils.uploads._breaker", None), \
+                mock.patch("cloudinary.uploader.upload",
+                           return_value=FAKE_UPLOAD) as upload:
+            call_command("upload_deferred_images", stdout=out)
+        self.assertEqual(upload.call_count, 3)
+        self.assertIn("Uploaded 3 photos", out.getvalue())
+        self.assertFalse(DeferredUpload.objects.exists())
+        parcel = Parcel.objects.get(id=body["parcel"]["id"])
+        self.assertEqual(parcel.image, FAKE_UPLOAD["secure_url"])
+
+    def test_circuit_lets_one_trial_through_after_cooldown(self, sleep):
+        from utils.uploads import CircuitBreaker
+
+        breaker = CircuitBreaker(threshold=1, cooldown=60)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        breaker.opened_at -= 60
+        self.assertTrue(breaker.allow())
+        # Only the one trial while it runs
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.snapshot()["state"], "half_open")
+        breaker.record_success()
+        self.assertEqual(breaker.snapshot(), {
+            "state": "closed", "failures": 0, "retry_in": 0.0})
+        self.assertTrue(breaker.allow())
+
+    def test_health_when_all_is_well(self, sleep):
+        response = self.client.get("/health/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "ok")
+
+
+class LocalImageStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = Student.objects.create(
+            clerk_id="user_local", name="Uma Sen", email="uma@example.edu")
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings_override = override_settings(
+            IMAGE_STORAGE="local", LOCAL_IMAGE_ROOT=root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create(self):
+        from PIL import Image
+
+        image = io.BytesIO()
+        Image.new("RGB", (1600, 900), "teal").save(image, format="PNG")
+        image.seek(0)
+        image.name = "parcel.png"
+        return self.client.post("/parcels/create/", {
+            "student_id": str(self.student.id), "image": image})
+
+    def test_store_and_serve_variants(self):
+        parcel = self.create().json()["parcel"]
+        self.assertRegex(parcel["image"],
+                         r"^/parcels/media/full/([0-9a-f]{2})/\1[0-9a-f]{62}\.jpg$")
+        self.assertIn(parcel["image"].replace("/full/", "/thumb/") + " 160w",
+                      parcel["image_srcset"])
+
+        from PIL import Image
+
+        full = self.client.get(parcel["image"])
+        self.assertEqual(full["Content-Type"], "image/jpeg")
+        self.assertIn("immutable", full["Cache-Control"])
+        self.assertEqual(
+            Image.open(io.BytesIO(b"".join(full.streaming_content))).size,
+            (800, 450))
+        thumb = self.client.get(parcel["image"].replace("/full/", "/thumb/"))
+        self.assertEqual(
+            Image.open(io.BytesIO(b"".join(thumb.streaming_content))).size,
+            (160, 120))
+
+    def test_range_and_conditional_requests(self):
+        url = self.create().json()["parcel"]["image"]
+        etag = self.client.get(url)["ETag"]
+
+        partial = self.client.get(url, HTTP_RANGE="bytes=0-9")
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(len(partial.content), 10)
+        self.assertTrue(partial["Content-Range"].startswith("bytes 0-9/"))
+        self.assertEqual(
+            self.client.get(url, HTTP_RANGE="bytes=999999-").status_code, 416)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get("/parcels/media/full/../x.jpg").status_code, 404)
+
+
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = Student.objects.create(
+            clerk_id="user_fragment", name="Asha Iyer",
+            email="asha@example.edu", room_number="101")
+        cls.parcels = [Parcel.objects.create(student=cls.student)
+                       for _ in range(3)]
+
+    def setUp(self):
+        caches["fragments"].clear()
+        cache.clear()
+
+    def my_parcels(self):
+        return self.client.get("/parcels/my/?clerk_id=user_fragment").json()
+
+    def test_lists_reuse_fragments(self):
+        first = self.client.get("/parcels/all/").json()
+        with mock.patch.object(ParcelSerializer, "to_representation") as child:
+            self.assertEqual(self.client.get("/parcels/all/").json(), first)
+        child.assert_not_called()
+
+        # A change re-renders just that parcel, not its siblings or other
+        # students' parcels
+        other = Parcel.objects.create(student=Student.objects.create(
+            clerk_id="user_other", name="Dev Sen", email="dev@example.edu"))
+        self.client.get("/parcels/all/")
+        self.parcels[0].description = "Books"
+        self.parcels[0].save()
+        rendered = ParcelSerializer.to_representation
+        with mock.patch.object(ParcelSerializer, "to_representation",
+                               autospec=True, side_effect=rendered) as child:
+            data = self.client.get("/parcels/all/").json()
+        self.assertNotIn(other, [call.args[1] for call in child.call_args_list])
+        self.assertEqual([call.args[1] for call in child.call_args_list],
+                         [self.parcels[0]])
+        self.assertEqual({p["description"] for p in data}, {"Books", None})
+
+    def test_student_edits_invalidate(self):
+        self.assertEqual(self.my_parcels()[0]["student"]["room_number"], "101")
+        self.client.patch(
+            f"/students/{self.student.id}/update/", {"room_number": "305"},
+            content_type="application/json")
+        self.assertTrue(all(p["student"]["room_number"] == "305"
+                            for p in self.my_parcels()))
+
+    def test_default_and_full_variants_cached_apart(self):
+        url = "https://res.cloudinary.com/demo/image/upload/v1/p.jpg"
+        Parcel.objects.filter(id=self.parcels[0].id).update(image=url)
+        def photo(path):
+            return next(parcel for parcel in self.client.get(path).json()
+                        if parcel["id"] == self.parcels[0].id)
+
+        full = photo("/parcels/all/?image=full")
+        default = photo("/parcels/all/")
+        self.assertIn("c_limit,w_800", full["image"])
+        self.assertNotIn("image_srcset", full)
+        self.assertEqual(default["image"], url)
+        self.assertIn("image_srcset", default)
+
+    def test_picked_up_parcels_cached_longer(self):
+        self.client.patch(f"/parcels/{self.parcels[0].id}/picked-up/")
+        with mock.patch.object(caches["fragments"], "set_many",
+                               wraps=caches["fragments"].set_many) as set_many:
+            self.client.get("/parcels/all/")
+        timeouts = {len(call.args[0]): call.args[1]
+                    for call in set_many.call_args_list}
+        self.assertEqual(timeouts, {1: settings.FRAGMENT_PICKED_UP_TIMEOUT,
+                                    2: settings.PARCEL_LIST_CACHE_TIMEOUT})
+
+
+class ParcelViewSetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(students=10, parcels=260)
+
+    def test_page_size_is_capped(self):
+        with self.assertNumQueries(2):  # COUNT + page
+            body = self.client.get("/parcels/viewset/?page_size=1000").json()
+        self.assertEqual(body["count"], 260)
+        self.assertEqual(len(body["results"]), 200)
+        self.assertEqual(
+            len(self.client.get("/parcels/viewset/").json()["results"]), 50)
+
+    def test_filters_and_ordering(self):
+        student = Parcel.objects.values_list("student", flat=True).first()
+        day = Parcel.objects.order_by("created_at").first().created_at.date()
+        body = self.client.get(
+            f"/parcels/viewset/?status=PENDING&student={student}"
+            f"&created_after={day}&ordering=created_at").json()
+        expected = Parcel.objects.filter(
+            status="PENDING", student=student).order_by("created_at")
+        self.assertEqual([p["id"] for p in body["results"]],
+                         [p.id for p in expected[:50]])
+        self.assertEqual(
+            self.client.get("/parcels/viewset/?status=LOST").status_code, 400)
+        self.assertEqual(
+            self.client.get("/parcels/viewset/?student=1").status_code, 400)
+        self.assertEqual(self.client.get(
+            "/parcels/viewset/?created_before=tomorrow").status_code, 400)
+
+        # Unindexed columns are ignored for ordering
+        with CaptureQueriesContext(connections["default"]) as queries:
+            self.client.get("/parcels/viewset/?ordering=description")
+        self.assertNotIn('"description" ASC', queries[-1]["sql"])
+
+    def test_sparse_fields_trim_sql_and_json(self):
+        with CaptureQueriesContext(connections["default"]) as queries:
+            body = self.client.get(
+                "/parcels/viewset/?fields=id,status").json()
+        self.assertEqual(set(body["results"][0]), {"id", "status"})
+        self.assertNotIn("description", queries[-1]["sql"])
+        self.assertNotIn("students_student", queries[-1]["sql"])
+
+        with self.assertNumQueries(2):
+            body = self.client.get(
+                "/parcels/viewset/?fields=tracking_id,student").json()
+        self.assertEqual(set(body["results"][0]), {"tracking_id", "student"})
+        self.assertIn("name", body["results"][0]["student"])
+
+        self.assertEqual(
+            self.client.get("/parcels/viewset/?fields=secret").status_code, 400)
+
+
+class RenderingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(students=5, parcels=40)
+
+    @override_settings(STREAM_CHUNK_SIZE=7)
+    def test_streamed_list_matches_buffered(self):
+        buffered = self.client.get("/parcels/all/").json()
+        response = self.client.get("/parcels/all/?stream=1")
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            json.loads(b"".join(response.streaming_content)), buffered)
+
+    def test_compression_threshold_and_types(self):
+        plain = self.client.get("/parcels/all/").content
+        response = self.client.get(
+            "/parcels/all/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain)
+
+        streamed = self.client.get(
+            "/parcels/all/?stream=1", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(json.loads(gzip.decompress(
+            b"".join(streamed.streaming_content))), json.loads(plain))
+
+        small = self.client.get(
+            "/parcels/my/?clerk_id=nobody", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(small.has_header("Content-Encoding"))
+        png = self.client.get(f"/parcels/qr/{Parcel.objects.first().id}/",
+                              HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(png.has_header("Content-Encoding"))
+
+    def test_malformed_json_is_a_400(self):
+        response = self.client.post("/parcels/verify-qr/", "{not json",
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class LedgerExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        student = Student.objects.create(
+            clerk_id="user_ledger", name="Zoya Khan", email="zoya@example.edu",
+            hostel_block="Block C", room_number="204")
+        cls.picked = Parcel.objects.create(
+            student=student, service="Amazon",
+            status=Parcel.ParcelStatus.PICKED_UP)
+        Parcel.objects.filter(pk=cls.picked.pk).update(
+            picked_up_time=cls.picked.created_at + timedelta(hours=3))
+        Parcel.objects.create(student=student, service="Delhivery")
+
+    def test_csv_export(self):
+        response = self.client.get("/parcels/export/csv/?status=PICKED_UP")
+        self.assertTrue(response.streaming)
+        self.assertIn("attachment;", response["Content-Disposition"])
+        rows = list(csv.reader(io.StringIO(
+            b"".join(response.streaming_content).decode("utf-8-sig"))))
+        self.assertEqual(rows[0][0], "Tracking ID")
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][0], str(self.picked.tracking_id))
+        self.assertEqual(rows[1][2:6], ["Zoya Khan", "Block C", "204", "Amazon"])
+        self.assertEqual(rows[1][8], "3.0")
+
+    def test_csv_cells_cannot_be_formulas(self):
+        Student.objects.filter(clerk_id="user_ledger").update(
+            name='=HYPERLINK("http://evil.example","x")', hostel_block="@SUM(1)")
+        Parcel.objects.filter(pk=self.picked.pk).update(service="-2+3")
+        response = self.client.get("/parcels/export/csv/?status=PICKED_UP")
+        rows = list(csv.reader(io.StringIO(
+            b"".join(response.streaming_content).decode("utf-8-sig"))))
+        self.assertEqual(rows[1][2:6], [
+            '\'=HYPERLINK("http://evil.example","x")', "'@SUM(1)", "204",
+            "'-2+3"])
+        self.assertEqual(rows[1][8], "3.0")
+
+    def test_xlsx_export(self):
+        response = self.client.get("/parcels/export/xlsx/?block=Block%20C")
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode()
+        self.assertEqual(sheet.count("<row>"), 3)
+        self.assertIn("<t>Delhivery</t>", sheet)
+
+    def test_bad_filters_and_format(self):
+        self.assertEqual(
+            self.client.get("/parcels/export/csv/?month=May").status_code, 400)
+        self.assertEqual(
+            self.client.get("/parcels/export/pdf/").status_code, 404)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "ledger.csv")
+            call_command("export_ledger", "--status", "PENDING", "-o", path,
+                         stdout=io.StringIO())
+            with open(path, encoding="utf-8-sig") as fh:
+                self.assertEqual(len(list(csv.reader(fh))), 2)
+
+
+class LabelSheetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        student = Student.objects.create(
+            clerk_id="user_labels", name="Meera Das", email="meera@example.edu",
+            hostel_block="Block A", room_number="12")
+        cls.parcels = Parcel.objects.bulk_create(
+            Parcel(student=student) for _ in range(30))
+
+    def assertValidPdf(self, pdf, pages):
+        self.assertTrue(pdf.startswith(b"%PDF-1.4"))
+        self.assertIn(f"/Count {pages} >>".encode(), pdf)
+        # Every xref entry points at its object
+        xref = int(pdf.rsplit(b"startxref\n", 1)[1].split()[0])
+        entries = pdf[xref:].split(b"\n")[3:]
+        for number, entry in enumerate(entries[:pdf.count(b" 0 obj")], 1):
+            offset = int(entry.split()[0])
+            self.assertTrue(pdf[offset:].startswith(f"{number} 0 obj".encode()))
+
+    def test_pdf_sheet(self):
+        response = self.client.get("/parcels/labels/pdf/?status=PENDING")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(response.streaming)
+        self.assertValidPdf(b"".join(response.streaming_content), pages=2)
+
+        ids = ",".join(str(p.id) for p in self.parcels[:3])
+        response = self.client.get(f"/parcels/labels/pdf/?ids={ids}")
+        self.assertValidPdf(b"".join(response.streaming_content), pages=1)
+
+    def test_png_sheet_and_errors(self):
+        from PIL import Image
+        from utils.labelsheet import PAGE_SIZE
+
+        response = self.client.get("/parcels/labels/png/?page=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Image.open(io.BytesIO(response.content)).size,
+                         PAGE_SIZE)
+        self.assertEqual(
+            self.client.get("/parcels/labels/png/?page=3").status_code, 404)
+        self.assertEqual(
+            self.client.get("/parcels/labels/gif/").status_code, 404)
+        self.assertEqual(self.client.get(
+            "/parcels/labels/pdf/?status=PICKED_UP").status_code, 404)
+        with override_settings(LABEL_SHEET_MAX_LABELS=10):
+            self.assertEqual(
+                self.client.get("/parcels/labels/pdf/").status_code, 400)
+
+    def test_old_labels_still_scan(self):
+        from parcels.labels import labels
+
+        def scan(token):
+            return self.client.post(
+                "/parcels/verify-qr/", {"token": token},
+                content_type="application/json").status_code
+
+        three_days_ago = time.time() - 3 * 86400
+        with mock.patch("django.core.signing.time.time",
+                        return_value=three_days_ago):
+            old = [label["token"] for label in labels(
+                Parcel.objects.filter(pk__in=[p.pk for p in self.parcels[:2]]))]
+            dashboard = signer.sign(str(self.parcels[2].id))
+        self.assertEqual(scan(old[0]), 200)
+        # Dashboard codes still expire after 48 hours
+        self.assertEqual(scan(dashboard), 410)
+        with override_settings(LABEL_TOKEN_MAX_AGE_DAYS=2):
+            self.assertEqual(scan(old[1]), 410)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "labels.png")
+            call_command("print_labels", format="png", output=output,
+                         stdout=io.StringIO())
+            self.assertEqual(sorted(os.listdir(directory)),
+                             ["labels-1.png", "labels-2.png"])
+
+
+class BootstrapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = Student.objects.create(
+            clerk_id="user_boot", name="Tara Nair", email="tara@example.edu")
+        cls.pending = [Parcel.objects.create(student=cls.student)
+                       for _ in range(3)]
+        cls.picked = Parcel.objects.create(
+            student=cls.student, status=Parcel.ParcelStatus.PICKED_UP,
+            picked_up_time=timezone.now())
+        HelpRequest.objects.create(
+            user_type="student", student=cls.student, parcel=cls.picked,
+            message="Wrong parcel")
+        HelpRequest.objects.create(
+            user_type="student", student=cls.student, message="Thanks",
+            status="resolved")
+
+    def setUp(self):
+        caches["fragments"].clear()
+        cache.clear()
+
+    def test_student_bootstrap(self):
+        url = "/parcels/bootstrap/student/?clerk_id=user_boot"
+        # Student, parcels, help requests
+        with self.assertNumQueries(3):
+            body = self.client.get(url).json()
+        self.assertEqual(body["student"]["name"], "Tara Nair")
+        self.assertEqual(len(body["parcels"]), 4)
+        self.assertEqual(body["parcels"], self.client.get(
+            "/parcels/my/?clerk_id=user_boot").json())
+        self.assertEqual(len(body["help_requests"]), 2)
+        self.assertEqual(body["summary"], {
+            "pending_parcels": 3, "picked_up_parcels": 1,
+            "open_help_requests": 1})
+        self.assertEqual(set(body["qr_codes"]),
+                         {str(parcel.id) for parcel in self.pending})
+        self.assertTrue(body["qr_codes"][str(self.pending[0].id)].startswith(
+            "data:image/png;base64,"))
+
+        # The parcel list is cached like /parcels/my/'s; more parcels
+        # don't add queries
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        Parcel.objects.create(student=self.student)
+        with self.assertNumQueries(3):
+            body = self.client.get(url).json()
+        self.assertEqual(body["summary"]["pending_parcels"], 4)
+
+    def test_student_bootstrap_errors(self):
+        self.assertEqual(self.client.get(
+            "/parcels/bootstrap/student/").status_code, 400)
+        self.assertEqual(self.client.get(
+            "/parcels/bootstrap/student/?clerk_id=nobody").status_code, 404)
+
+    def test_guard_bootstrap(self):
+        other = Student.objects.create(
+            clerk_id="user_boot2", name="Vik Das", email="vik@example.edu")
+        for _ in range(5):
+            Parcel.objects.create(student=other)
+        with self.assertNumQueries(2):
+            body = self.client.get("/parcels/bootstrap/guard/").json()
+        self.assertEqual(len(body["parcels"]), 9)
+        self.assertEqual(body["summary"], {
+            "total_parcels": 9, "pending_parcels": 8, "picked_up_today": 1,
+            "open_help_requests": 1})
+        self.assertIn(str(self.picked.tracking_id),
+                      [help_request["trackingId"]
+                       for help_request in body["help_requests"]])
+
+
+class ConnModeTests(SimpleTestCase):
+    def test_no_persistent_connections_under_asgi(self):
+        from backend.db import apply_conn_mode, default_conn_mode
+
+        postgres = {"ENGINE": "django.db.backends.postgresql"}
+        sqlite = {"ENGINE": "django.db.backends.sqlite3"}
+        self.assertEqual(default_conn_mode(postgres, asgi=False), "persistent")
+        self.assertEqual(default_conn_mode(postgres, asgi=True), "pool")
+        self.assertEqual(default_conn_mode(sqlite, asgi=True), "none")
+        db = apply_conn_mode(postgres, default_conn_mode(postgres, asgi=True))
+        self.assertEqual(db["CONN_MAX_AGE"], 0)
+        self.assertIn("pool", db["OPTIONS"])
+
+
+class StartupImportTests(SimpleTestCase):
+    def test_heavy_integrations_load_lazily(self):
+        # Runs a fresh interpreter; fails if qrcode/PIL/etc. load at boot
+        out = io.StringIO()
+        call_command("importtime_report", "--entry", "backend.asgi",
+                     stdout=out)
+        self.assertIn("ms import time", out.getvalue())
+
+
+@override_settings(METRICS_TOKEN="s3cret")
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        student = Student.objects.create(
+            clerk_id="user_metrics", name="Dev Rao", email="dev@example.edu")
+        cls.parcel = Parcel.objects.create(student=student)
+
+    def setUp(self):
+        cache.clear()
+
+    def scrape(self):
+        response = self.client.get(
+            "/metrics/", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_verify_outcomes_and_qr_cache(self):
+        self.client.get(f"/parcels/qr/{self.parcel.id}/base64/")
+        self.client.get(f"/parcels/qr/{self.parcel.id}/base64/")
+        token = signer.sign(str(self.parcel.id))
+        for _ in range(2):
+            self.client.post("/parcels/verify-qr/", {"token": token},
+                             content_type="application/json")
+        self.client.post("/parcels/verify-qr/", {"token": token + "x"},
+                         content_type="application/json")
+
+        text = self.scrape()
+        for series in (
+            'hosteldrop_qr_verifications_total{outcome="valid"}',
+            'hosteldrop_qr_verifications_total{outcome="already_picked"}',
+            'hosteldrop_qr_verifications_total{outcome="tampered"}',
+            'hosteldrop_qr_cache_requests_total{result="hit"}',
+            'hosteldrop_qr_cache_requests_total{result="miss"}',
+            'hosteldrop_qr_render_duration_seconds_count',
+            'hosteldrop_request_duration_seconds_bucket{le="0.005",'
+            'status="2xx",view="verify_qr"}',
+            'hosteldrop_request_duration_seconds_count{status="4xx",'
+            'view="verify_qr"}',
+            'hosteldrop_requests_total{method="POST",status="409",'
+            'view="verify_qr"}',
+            'hosteldrop_db_queries_total{view="verify_qr"}',
+        ):
+            self.assertIn(series, text)
+
+    def test_token_required(self):
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+        self.assertEqual(self.client.get(
+            "/metrics/", HTTP_AUTHORIZATION="Bearer guess").status_code, 403)
+        self.scrape()
+
+    @override_settings(METRICS_TOKEN="")
+    def test_closed_without_a_token(self):
+        self.assertEqual(self.client.get("/metrics/").status_code, 403)
+        with self.settings(METRICS_PUBLIC=True):
+            self.assertEqual(self.client.get("/metrics/").status_code, 200)
+
+
+class PickupPassTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = Student.objects.create(
+            clerk_id="user_pass", name="Ira Sen", email="ira@example.edu",
+            room_number="204", hostel_block="Block B")
+        cls.parcels = [Parcel.objects.create(student=cls.student)
+                       for _ in range(3)]
+        Parcel.objects.create(student=cls.student,
+                              status=Parcel.ParcelStatus.PICKED_UP)
+
+    def post(self, path, data):
+        return self.client.post(path, data, content_type="application/json")
+
+    def test_pass_lists_pending_parcels(self):
+        response = self.client.get("/parcels/pass/?clerk_id=user_pass")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["pending_count"], 3)
+        self.assertTrue(response.json()["qr_code"].startswith(
+            "data:image/png;base64,"))
+
+        token = pass_signer.sign(str(self.student.id))
+        response = self.post("/parcels/pass/verify/", {"token": token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p["id"] for p in response.json()["parcels"]],
+                         [p.id for p in self.parcels])
+        self.assertFalse(Parcel.objects.filter(
+            id__in=[p.id for p in self.parcels],
+            status=Parcel.ParcelStatus.PICKED_UP).exists())
+
+    def test_partial_then_full_pickup(self):
+        token = pass_signer.sign(str(self.student.id))
+        etag = self.client.get(
+            "/parcels/my/?clerk_id=user_pass").headers["ETag"]
+
+        first = self.parcels[0].id
+        response = self.post("/parcels/pass/pickup/",
+                             {"token": token, "parcel_ids": [first, 999999]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p["id"] for p in response.json()["parcels"]],
+                         [first])
+        self.assertEqual(response.json()["skipped"], [999999])
+        # The bulk update bypasses signals but must still invalidate lists
+        self.assertNotEqual(self.client.get(
+            "/parcels/my/?clerk_id=user_pass").headers["ETag"], etag)
+
+        # Student, savepoint, locked select, update, version bump, release:
+        # the same however many parcels are waiting
+        with self.assertNumQueries(6):
+            response = self.post("/parcels/pass/pickup/", {"token": token})
+        self.assertEqual(len(response.json()["parcels"]), 2)
+        self.assertFalse(Parcel.objects.filter(
+            student=self.student,
+            status=Parcel.ParcelStatus.PENDING).exists())
+        self.assertFalse(Parcel.objects.filter(
+            id__in=[p.id for p in self.parcels],
+            picked_up_time__isnull=True).exists())
+
+        response = self.post("/parcels/pass/pickup/", {"token": token})
+        self.assertEqual(response.status_code, 409)
+
+    def test_concurrent_pickup_is_not_reported_twice(self):
+        # Another guard releases the first parcel between this request's
+        # select and its update, as can happen without row locks
+        def racing(queryset, *args, **kwargs):
+            class Raced:
+                def order_by(self, *fields):
+                    rows = list(queryset.order_by(*fields))
+                    Parcel.objects.filter(id=rows[0].id).update(
+                        status=Parcel.ParcelStatus.PICKED_UP,
+                        picked_up_time=timezone.now() - timedelta(seconds=1))
+                    return rows
+            return Raced()
+
+        token = pass_signer.sign(str(self.student.id))
+        with mock.patch.object(QuerySet, "select_for_update", autospec=True,
+                               side_effect=racing):
+            response = self.post("/parcels/pass/pickup/", {
+                "token": token, "parcel_ids": [p.id for p in self.parcels]})
+        self.assertEqual([p["id"] for p in response.json()["parcels"]],
+                         [p.id for p in self.parcels[1:]])
+        self.assertEqual(response.json()["skipped"], [self.parcels[0].id])
+
+    def test_parcel_token_is_not_a_pass(self):
+        parcel_token = signer.sign(str(self.student.id))
+        response = self.post("/parcels/pass/verify/", {"token": parcel_token})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["reason"], "tampered")
+
+        pass_token = pass_signer.sign(str(self.parcels[0].id))
+        response = self.post("/parcels/verify-qr/", {"token": pass_token})
+        self.assertEqual(response.status_code, 400)
+
+
+class AdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(students=20, parcels=100)
+        cls.admin = User.objects.create_superuser(
+            "warden", "warden@example.edu", "pw")
+        cls.student = Student.objects.order_by("name").first()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connections["default"]) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for url in ("/admin/parcels/parcel/", "/admin/support/helprequest/",
+                    "/admin/students/student/"):
+            before = self.changelist_queries(url)
+            students = list(Student.objects.all())
+            Parcel.objects.bulk_create(
+                Parcel(student=student) for student in students * 5)
+            HelpRequest.objects.bulk_create(
+                HelpRequest(user_type="student", student=student,
+                            parcel=student.parcels.first(), message="Late")
+                for student in students)
+            self.assertEqual(self.changelist_queries(url), before, url)
+
+    def test_search(self):
+        parcel = Parcel.objects.first()
+        response = self.client.get(
+            f"/admin/parcels/parcel/?q={parcel.tracking_id}")
+        self.assertEqual(list(response.context["cl"].result_list), [parcel])
+
+        response = self.client.get(
+            f"/admin/parcels/parcel/?q={self.student.name[:4]}")
+        self.assertIn(self.student.parcels.first(),
+                      response.context["cl"].result_list)
+        self.assertTrue(all(p.student.name.startswith(self.student.name[:4])
+                            for p in response.context["cl"].result_list))
+
+        response = self.client.get(
+            f"/admin/parcels/parcel/?q={self.student.email}")
+        self.assertEqual({p.student_id for p in
+                          response.context["cl"].result_list},
+                         {self.student.id})
+
+    def test_student_autocomplete(self):
+        response = self.client.get("/admin/autocomplete/", {
+            "app_label": "parcels", "model_name": "parcel",
+            "field_name": "student", "term": self.student.name[:3]})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(str(self.student.id),
+                      [r["id"] for r in response.json()["results"]])
+
+
+@mock.patch("cloudinary.uploader.upload", return_value=FAKE_UPLOAD)
+class IdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = Student.objects.create(
+            clerk_id="user_retry", name="Tara Roy", email="tara@example.edu")
+
+    def create(self, key, description="Books"):
+        image = io.BytesIO(b"photo")
+        image.name = "parcel.jpg"
+        return self.client.post("/parcels/create/", {
+            "student_id": str(self.student.id), "description": description,
+            "image": image}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_create_is_replayed(self, upload):
+        first = self.create("intake-1")
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(1):
+            retry = self.create("intake-1")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Parcel.objects.count(), 1)
+        self.assertEqual(upload.call_count, 1)
+
+        self.assertEqual(self.create("intake-1", "Shoes").status_code, 422)
+        self.assertEqual(self.create("intake-2").status_code, 201)
+        self.assertEqual(Parcel.objects.count(), 2)
+
+    def test_in_flight_and_abandoned_claims(self, upload):
+        claim = self.create("intake-3")
+        IdempotencyKey.objects.filter(key="intake-3").update(
+            status_code=None, response=None)
+        response = self.create("intake-3")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+        IdempotencyKey.objects.filter(key="intake-3").update(
+            created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.create("intake-3").status_code, 201)
+        self.assertEqual(Parcel.objects.count(), 2)
+        self.assertEqual(claim.status_code, 201)
+
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - timedelta(days=2))
+        call_command("purge_idempotency_keys", stdout=io.StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_retried_scan_is_not_a_conflict(self, upload):
+        parcel = Parcel.objects.create(student=self.student)
+        token = signer.sign(str(parcel.id))
+        codes = [self.client.post(
+            "/parcels/verify-qr/", {"token": token},
+            content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY="scan-1").status_code for _ in range(2)]
+        self.assertEqual(codes, [200, 200])
+        response = self.client.post("/parcels/verify-qr/", {"token": token},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 409)
+
+
+@override_settings(
+    THROTTLE_ENABLED=True,
+    THROTTLE_RATES={"pickup": "5/min", "qr": "2/min", "heavy": "2/min",
+                    "default": "100/min"},
+    THROTTLE_GLOBAL_RATES={"heavy": "3/min"})
+class ThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        student = Student.objects.create(
+            clerk_id="user_throttle", name="Kabir Das",
+            email="kabir@example.edu")
+        cls.parcels = [Parcel.objects.create(student=student)
+                       for _ in range(3)]
+
+    def setUp(self):
+        get_buckets().clear()
+        cache.clear()
+
+    def scan(self, parcel):
+        return self.client.post(
+            "/parcels/verify-qr/", {"token": signer.sign(str(parcel.id))},
+            content_type="application/json")
+
+    def test_heavy_lists_cannot_starve_pickup(self):
+        codes = [self.client.get("/parcels/all/").status_code
+                 for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+        response = self.client.get("/parcels/export/csv/")
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+
+        self.assertEqual([self.scan(p).status_code for p in self.parcels],
+                         [200, 200, 200])
+
+    def test_per_client_and_global_buckets(self):
+        def get_all(ip):
+            return self.client.get(
+                "/parcels/all/", REMOTE_ADDR=ip).status_code
+
+        self.assertEqual([get_all("10.0.0.1"), get_all("10.0.0.1"),
+                          get_all("10.0.0.1")], [200, 200, 429])
+        # Another client has its own bucket but the scope's cap is shared
+        self.assertEqual([get_all("10.0.0.2"), get_all("10.0.0.3")],
+                         [200, 429])
+
+    def test_clients_behind_the_load_balancer_are_apart(self):
+        def get_all(forwarded_for):
+            return self.client.get(
+                "/parcels/all/", REMOTE_ADDR="10.0.0.254",
+                HTTP_X_FORWARDED_FOR=forwarded_for).status_code
+
+        # Keyed on the address the balancer appended, not its own, and not
+        # on whatever the client put in front of it
+        self.assertEqual([get_all("203.0.113.5"),
+                          get_all("1.1.1.1, 203.0.113.5"),
+                          get_all("203.0.113.5")], [200, 200, 429])
+        self.assertEqual(get_all("198.51.100.7"), 200)
+
+    def test_clerk_id_only_adds_a_limit(self):
+        def get_qr(clerk_id, ip):
+            return self.client.get(
+                f"/parcels/qr/{self.parcels[0].id}/?clerk_id={clerk_id}",
+                REMOTE_ADDR=ip).status_code
+
+        # A new clerk_id per request doesn't earn a fresh bucket
+        self.assertEqual([get_qr("user_a", "10.0.0.1"),
+                          get_qr("user_b", "10.0.0.1"),
+                          get_qr("user_c", "10.0.0.1")], [200, 200, 429])
+        # Nor does one student spread over addresses
+        self.assertEqual([get_qr("user_d", "10.0.0.2"),
+                          get_qr("user_d", "10.0.0.3"),
+                          get_qr("user_d", "10.0.0.4")], [200, 200, 429])
+
+    def test_bootstraps_are_scoped_like_their_panels(self):
+        for path in ("/parcels/bootstrap/guard/",
+                     "/parcels/bootstrap/student/?clerk_id=user_throttle"):
+            codes = [self.client.get(path).status_code for _ in range(3)]
+            self.assertEqual(codes, [200, 200, 429])
+
+    @override_settings(THROTTLE_BACKEND="cache")
+    def test_shared_cache_buckets(self):
+        codes = [self.client.get(
+            f"/parcels/qr/{self.parcels[0].id}/base64/").status_code
+            for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+        self.assertIsNotNone(cache.get("throttle:qr:ip:127.0.0.1"))
+
+
+class AsyncViewTests(TransactionTestCase):
+    """Async read paths must return what their sync counterparts return.
+
+    TransactionTestCase: db_read runs queries on other connections, which
+    can't see rows inside a TestCase transaction.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.student = Student.objects.create(
+            clerk_id="user_async", name="Kabir Das", email="kabir@example.edu",
+            hostel_block="Block B", room_number="204")
+        self.parcel = Parcel.objects.create(
+            student=self.student, service="Amazon")
+
+    async def test_matches_sync_views(self):
+        for sync_path, async_path in (
+            ("/parcels/my/?clerk_id=user_async",
+             "/parcels/async/my/?clerk_id=user_async"),
+            ("/parcels/all/", "/parcels/async/all/"),
+            ("/students/by-clerk/?clerk_id=user_async",
+             "/students/async/by-clerk/?clerk_id=user_async"),
+        ):
+            expected = (await self.async_client.get(sync_path)).json()
+            response = await self.async_client.get(async_path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected)
+
+    async def test_conditional_get_and_qr(self):
+        url = "/parcels/async/my/?clerk_id=user_async"
+        response = await self.async_client.get(url)
+        response = await self.async_client.get(
+            url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.get(
+            f"/parcels/async/qr/{self.parcel.id}/base64/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["qr_code"].startswith(
+            "data:image/png;base64,"))
+
+
+@override_settings(CONSUMED_TOKENS_ENABLED=True)
+class ConsumedTokenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = Student.objects.create(
+            clerk_id="user_replay", name="Ravi Nair", email="ravi@example.edu")
+        cls.parcel = Parcel.objects.create(student=cls.student)
+
+    def setUp(self):
+        _consumed_parcels.cache_clear()
+        cache.clear()
+
+    def scan(self, parcel):
+        return self.client.post(
+            "/parcels/verify-qr/", {"token": signer.sign(str(parcel.id))},
+            content_type="application/json")
+
+    def committed(self):
+        # Pickups are recorded once their transaction commits
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def test_rescans_skip_the_database(self):
+        with self.committed():
+            self.assertEqual(self.scan(self.parcel).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.scan(self.parcel).status_code, 409)
+
+        # A fresh worker finds it in the shared tier
+        _consumed_parcels.cache_clear()
+        with self.assertNumQueries(0):
+            response = self.scan(self.parcel)
+        self.assertEqual(response.json()["reason"], "already_picked")
+
+        # Set back to pending: scannable again
+        self.parcel.status = Parcel.ParcelStatus.PENDING
+        with self.committed():
+            self.parcel.save()
+        self.assertEqual(self.scan(self.parcel).status_code, 200)
+
+    def test_other_pickup_paths_are_recorded(self):
+        parcels = [Parcel.objects.create(student=self.student)
+                   for _ in range(2)]
+        with self.committed():
+            self.client.post(
+                "/parcels/pass/pickup/",
+                {"token": pass_signer.sign(str(self.student.id))},
+                content_type="application/json")
+            self.client.patch(f"/parcels/{self.parcel.id}/picked-up/")
+        for parcel in parcels + [self.parcel]:
+            with self.assertNumQueries(0):
+                self.assertEqual(self.scan(parcel).status_code, 409)
+
+    def test_rolled_back_pickup_is_not_recorded(self):
+        with self.committed() as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.assertEqual(verify_scan(
+                    signer.sign(str(self.parcel.id)))[0], 200)
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertNotIn(self.parcel.id, consumed_parcels())
+        self.assertEqual(self.scan(self.parcel).status_code, 200)
+
+    @override_settings(CONSUMED_BLOOM_CAPACITY=1000)
+    def test_bloom_tier(self):
+        fresh = Parcel.objects.create(student=self.student)
+        with self.committed():
+            self.assertEqual(self.scan(self.parcel).status_code, 200)
+
+        # A restarted worker seeds its filter from the database once; the
+        # filter's "maybe" is then confirmed by the shared tier
+        _consumed_parcels.cache_clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.scan(self.parcel).status_code, 409)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.scan(self.parcel).status_code, 409)
+        self.assertEqual(self.scan(fresh).status_code, 200)
+
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(f"consumed:{i}")
+        self.assertTrue(all(f"consumed:{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"consumed:{i}" in bloom
+                              for i in range(1000, 11000))
+        self.assertLess(false_positives, 300)
+
+
+class ScanSocket:
+    """Drive backend.asgi's WebSocket route the way a server would"""
+
+    def __init__(self, path="/ws/scans/", token="device-1"):
+        from backend.asgi import application
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        scope = {"type": "websocket", "path": path,
+                 "query_string": f"token={token}".encode(), "headers": []}
+        self.task = asyncio.create_task(
+            application(scope, self.incoming.get, self.outgoing.put))
+
+    async def connect(self):
+        await self.incoming.put({"type": "websocket.connect"})
+        return await self.outgoing.get()
+
+    async def scan(self, ref, token):
+        await self.incoming.put(
+            {"type": "websocket.receive",
+             "text": json.dumps({"id": ref, "token": token})})
+
+    async def result(self):
+        return json.loads((await asyncio.wait_for(
+            self.outgoing.get(), timeout=5))["text"])
+
+    async def close(self):
+        await self.incoming.put({"type": "websocket.disconnect"})
+        await self.task
+
+
+@override_settings(SCAN_DEVICE_TOKENS=["device-1"])
+class ScanSocketTests(TransactionTestCase):
+    def setUp(self):
+        student = Student.objects.create(
+            clerk_id="user_socket", name="Zoya Khan", email="zoya@example.edu")
+        self.parcels = [Parcel.objects.create(student=student)
+                        for _ in range(5)]
+
+    async def test_pipelined_scans(self):
+        socket = ScanSocket()
+        self.assertEqual((await socket.connect())["type"], "websocket.accept")
+        # All scans go out before any result comes back
+        for parcel in self.parcels:
+            await socket.scan(parcel.id, signer.sign(str(parcel.id)))
+        await socket.scan("again", signer.sign(str(self.parcels[0].id)))
+        await socket.scan("bad", "nonsense")
+        results = {}
+        for _ in range(len(self.parcels) + 2):
+            result = await socket.result()
+            results[result["id"]] = result
+        await socket.close()
+
+        for parcel in self.parcels[1:]:
+            self.assertEqual(results[parcel.id]["status"], 200)
+            self.assertEqual(results[parcel.id]["parcel"]["tracking_id"],
+                             str(parcel.tracking_id))
+        # The repeated scan runs concurrently with the first: exactly one
+        # of them releases the parcel
+        self.assertEqual(sorted([results[self.parcels[0].id]["status"],
+                                 results["again"]["status"]]), [200, 409])
+        self.assertEqual(results["bad"]["reason"], "tampered")
+        self.assertEqual(await Parcel.objects.filter(
+            status=Parcel.ParcelStatus.PICKED_UP).acount(), 5)
+
+    @override_settings(SCAN_PIPELINE_DEPTH=2)
+    async def test_full_pipeline_stops_reading(self):
+        release = threading.Event()
+
+        def slow_scan(token):
+            release.wait(5)
+            return 200, {"valid": True}
+
+        socket = ScanSocket()
+        await socket.connect()
+        with mock.patch("parcels.scan_socket.verify_scan", slow_scan):
+            for parcel in self.parcels:
+                await socket.scan(parcel.id, "token")
+            await asyncio.sleep(0.1)
+            # Two verifying, one read and waiting for a slot, two unread
+            self.assertEqual(socket.incoming.qsize(), 2)
+            release.set()
+            results = [await socket.result() for _ in self.parcels]
+        await socket.close()
+        self.assertEqual(sorted(result["id"] for result in results),
+                         sorted(parcel.id for parcel in self.parcels))
+
+    async def test_unknown_device_is_refused(self):
+        socket = ScanSocket(token="stolen")
+        self.assertEqual(await socket.connect(),
+                         {"type": "websocket.close", "code": 4401})
+        await socket.task
+        socket = ScanSocket(path="/ws/other/")
+        self.assertEqual((await socket.connect())["type"], "websocket.close")
+
+
+def read_alias(request):
+    return HttpResponse(router.db_for_read(Parcel) or "default")
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"])
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def test_only_decorated_views_read_from_replicas(self):
+        request = self.factory.get("/parcels/all/")
+        self.assertEqual(read_alias(request).content, b"default")
+        response = reads_from_replica(read_alias)(request)
+        self.assertIn(response.content, (b"replica1", b"replica2"))
+        self.assertEqual(router.db_for_write(Parcel), "default")
+
+    def test_writer_is_pinned_to_primary(self):
+        view = reads_from_replica(read_alias)
+        middleware = ReplicaPinningMiddleware(lambda r: HttpResponse())
+
+        middleware(self.factory.post("/parcels/verify-qr/"))
+        pinned = view(self.factory.get("/parcels/all/"))
+        self.assertEqual(pinned.content, b"default")
+
+        other = view(self.factory.get(
+            "/parcels/all/", REMOTE_ADDR="10.0.0.9"))
+        self.assertNotEqual(other.content, b"default")
+
+    def test_failed_write_does_not_pin(self):
+        middleware = ReplicaPinningMiddleware(
+            lambda r: HttpResponse(status=400))
+        middleware(self.factory.post("/parcels/verify-qr/"))
+        self.assertFalse(is_pinned(self.factory.get("/parcels/all/")))
+
+
+@skipUnless(settings.DATABASE_REPLICAS,
+            "run alone with DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3")
+class ReplicaReadTests(TransactionTestCase):
+    """Run with a second local SQLite database configured as replica"""
+
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_reads_hit_replica_until_client_writes(self):
+        student = Student.objects.create(
+            clerk_id="user_replica", name="Meera Nair",
+            email="meera@example.edu")
+        parcel = Parcel.objects.create(student=student)
+        replica = connections[settings.DATABASE_REPLICAS[0]]
+
+        with CaptureQueriesContext(replica) as queries:
+            self.client.get("/parcels/all/")
+        self.assertEqual(len(queries), 1)
+
+        self.client.post(
+            "/parcels/verify-qr/", {"token": signer.sign(str(parcel.id))},
+            content_type="application/json")
+        with CaptureQueriesContext(replica) as queries:
+            self.client.get("/parcels/all/")
+        self.assertEqual(len(queries), 0)
+
+
+@tag("benchmark")
+class SemesterStartSurge(TransactionTestCase):
+    """Many students polling their parcels while the guard scans pickups"""
+
+    def setUp(self):
+        seed(students=100, parcels=600)
+        cache.clear()
+
+    def test_concurrent_dashboard_and_pickup(self):
+        students = list(Student.objects.all()[:40])
+        pending = list(Parcel.objects.filter(
+            status=Parcel.ParcelStatus.PENDING)[:20])
+
+        def student_poll(clerk_id):
+            return lambda: self.client_class().get(
+                f"/parcels/my/?clerk_id={clerk_id}").status_code
+
+        def guard_scan(parcel_id):
+            return lambda: self.client_class().post(
+                "/parcels/verify-qr/", {"token": signer.sign(str(parcel_id))},
+                content_type="application/json").status_code
+
+        def guard_list():
+            return self.client_class().get("/parcels/all/").status_code
+
+        calls = [student_poll(s.clerk_id) for s in students * 3]
+        calls += [guard_scan(p.id) for p in pending]
+        calls += [guard_list] * 5
+
+        _, statuses = measure_concurrent("semester_start_surge", calls)
+        self.assertTrue(all(code == 200 for code in statuses), statuses)
+        self.assertFalse(Parcel.objects.filter(
+            id__in=[p.id for p in pending],
+            status=Parcel.ParcelStatus.PENDING).exists())
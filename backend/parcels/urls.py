@@ -7,8 +7,15 @@ from .views import (
     parcel_qr,
     verify_qr,
     parcel_qr_base64,
+    pickup_pass,
+    verify_pass,
+    pickup_with_pass,
+    parcel_image,
+    export_ledger,
+    parcel_labels,
     ParcelViewSet
 )
+from . import async_views, bootstrap
 from rest_framework.routers import DefaultRouter
 
 router = DefaultRouter()
@@ -24,4 +31,19 @@ urlpatterns = [
     path('qr/<int:parcel_id>/', parcel_qr, name='parcel_qr'),
     path('qr/<int:parcel_id>/base64/', parcel_qr_base64, name='parcel_qr_base64'),
     path('verify-qr/', verify_qr, name='verify_qr'),
+    path('pass/', pickup_pass, name='pickup_pass'),
+    path('pass/verify/', verify_pass, name='verify_pass'),
+    path('pass/pickup/', pickup_with_pass, name='pickup_with_pass'),
+    path('media/<str:variant>/<path:name>', parcel_image, name='parcel_image'),
+    path('export/<str:fmt>/', export_ledger, name='export_ledger'),
+    path('labels/<str:fmt>/', parcel_labels, name='parcel_labels'),
+    path('bootstrap/student/', bootstrap.student_bootstrap,
+         name='student_bootstrap'),
+    path('bootstrap/guard/', bootstrap.guard_bootstrap, name='guard_bootstrap'),
+
+    # Async variants of the hot read paths (serve via ASGI)
+    path('async/my/', async_views.my_parcels, name='my_parcels_async'),
+    path('async/all/', async_views.all_parcels, name='all_parcels_async'),
+    path('async/qr/<int:parcel_id>/base64/', async_views.parcel_qr_base64,
+         name='parcel_qr_base64_async'),
 ]
@@ -2,24 +2,62 @@ from rest_framework.decorators import api_view, parser_classes, permission_class
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from django.utils import timezone
-from django.http import HttpResponse
-from django.views.decorators.http import etag
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import etag, require_GET
 from django.views.decorators.cache import cache_control
+from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django.core.signing import BadSignature, SignatureExpired
-from .models import Parcel
+from .models import ImageAsset, Parcel
+from .replay import consumed_parcels
+from .scanning import verify_scan
 from .serializers import ParcelSerializer
+from .cache import bump_parcels_version, versioned_parcel_response
+from .deferred import defer_upload
+from .filters import (
+    IndexedOrderingFilter, ParcelFilter, ParcelPagination, filter_parcels,
+    only_columns, sparse_fields)
+from .idempotency import idempotent
+from .images import content_hash, requested_variant
+from .labels import CONTENT_TYPES as LABEL_CONTENT_TYPES
+from .labels import labels, png_pages, stream_pdf as stream_label_pdf
+from .ledger import (
+    CONTENT_TYPES, STREAMS, export_filename, ledger_queryset, ledger_rows)
+from .storage import get_image_storage
 from students.models import Student
 from rest_framework import viewsets
 from rest_framework.parsers import MultiPartParser, FormParser
-import cloudinary.uploader
 import base64
-from utils.qr import make_qr_png, unsign_token
+import logging
+import time
+from backend.routers import reads_from_replica
+from utils.metrics import (
+    UPLOAD_DEDUP_HITS, UPLOAD_FAILURES, UPLOAD_LATENCY)
+from utils.qr import cached_qr_png, make_pass_png, unsign_pass
+from utils.labelsheet import LABELS_PER_PAGE
+from utils.throttling import throttle
+from utils.timing import span
+from utils.uploads import UploadUnavailable
+from utils.files import serve_file
+from utils.streaming import streaming_json_response, wants_stream
+
+logger = logging.getLogger("hosteldrop.parcels")
+
+
+def with_qr_urls(response_data):
+    """✅ Add QR URLs to each serialized parcel"""
+    for parcel_data in response_data:
+        parcel_data['qr_url'] = f"/parcels/qr/{parcel_data['id']}/"
+        parcel_data['qr_base64_url'] = f"/parcels/qr/{parcel_data['id']}/base64/"
+    return response_data
 
 
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
+@idempotent
 def create_parcel(request):
     data = request.data
     student_id = data.get("student_id")
@@ -40,30 +78,41 @@ def create_parcel(request):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # ✅ Handle image upload to Cloudinary manually for better control
+        # ✅ Store the image via the configured backend (parcels.storage)
         image_url = None
+        image_deferred = False
         if 'image' in request.FILES:
+            image_file = request.FILES['image']
+
+            # ✅ Same bytes already stored (e.g. a retried request): reuse them
+            digest = content_hash(image_file)
+            asset = ImageAsset.objects.filter(sha256=digest).first()
+            if asset is not None:
+                image_url = asset.url
+                UPLOAD_DEDUP_HITS.inc()
+                logger.info("Reusing stored image %s", image_url)
+
+        if 'image' in request.FILES and image_url is None:
             try:
-                image_file = request.FILES['image']
-
-                # Upload to Cloudinary with specific settings
-                upload_result = cloudinary.uploader.upload(
-                    image_file,
-                    folder="hosteldrop/parcels",
-                    public_id=f"parcel_{student.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}",
-                    overwrite=True,
-                    resource_type="image",
-                    transformation=[
-                        {'width': 800, 'height': 600, 'crop': 'limit'},
-                        {'quality': 'auto:good'}
-                    ]
-                )
-
-                image_url = upload_result['secure_url']
-                print(f"✅ Image uploaded to Cloudinary: {image_url}")
-
-            except Exception as upload_error:
-                print(f"❌ Image upload failed: {upload_error}")
+                upload_start = time.perf_counter()
+                with span('upload'):
+                    image_url = get_image_storage().save(image_file, digest)
+                UPLOAD_LATENCY.observe(time.perf_counter() - upload_start)
+                logger.info("Image stored: %s", image_url)
+
+                # ignore_conflicts: another request may have indexed it first
+                ImageAsset.objects.bulk_create(
+                    [ImageAsset(sha256=digest, url=image_url)],
+                    ignore_conflicts=True)
+
+            except UploadUnavailable:
+                # ✅ Cloudinary is down: queue the photo (parcels.deferred)
+                UPLOAD_FAILURES.inc()
+                image_deferred = True
+
+            except Exception:
+                UPLOAD_FAILURES.inc()
+                logger.exception("Image upload failed for student %s", student.id)
                 # Continue without image if upload fails
 
         # Create new parcel
@@ -72,12 +121,10 @@ def create_parcel(request):
             description=data.get("description", ""),
             service=data.get("service", ""),
             status=data.get("status", Parcel.ParcelStatus.PENDING),
+            image=image_url,
         )
-
-        # ✅ Set the image URL if upload was successful
-        if image_url:
-            parcel.image = image_url
-            parcel.save()
+        if image_deferred:
+            defer_upload(parcel, image_file, digest)
 
         serializer = ParcelSerializer(parcel)
         response_data = serializer.data
@@ -92,18 +139,32 @@ def create_parcel(request):
             "message": f"Parcel created successfully with tracking ID: {parcel.tracking_id}",
             "qr_url": f"/parcels/qr/{parcel.id}/",  # ✅ Fixed to use parcel.id
             # ✅ Added base64 URL
-            "qr_base64_url": f"/parcels/qr/{parcel.id}/base64/"
+            "qr_base64_url": f"/parcels/qr/{parcel.id}/base64/",
+            # ✅ Photo queued; Parcel.image is set once it is uploaded
+            "image_pending": image_deferred,
         }, status=status.HTTP_201_CREATED)
 
     except Exception as e:
-        print(f"❌ Error creating parcel: {e}")
+        logger.exception("Error creating parcel")
         return Response(
             {"error": str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
+def student_parcel_list(student, image_variant=None):
+    """Serialized parcels of a student as my_parcels returns them"""
+    parcels = Parcel.objects.filter(student=student).select_related('student')
+    with span('serialize'):
+        serializer = ParcelSerializer(
+            parcels, many=True, context={'image_variant': image_variant})
+        response_data = serializer.data
+
+    return with_qr_urls(response_data)
+
+
 @api_view(['GET'])
+@reads_from_replica
 def my_parcels(request):
     clerk_id = request.GET.get('clerk_id')
 
@@ -114,16 +175,18 @@ def my_parcels(request):
         )
 
     try:
-        parcels = Parcel.objects.filter(student__clerk_id=clerk_id)
-        serializer = ParcelSerializer(parcels, many=True)
-
-        # ✅ Add QR URLs to each parcel
-        response_data = serializer.data
-        for parcel_data in response_data:
-            parcel_data['qr_url'] = f"/parcels/qr/{parcel_data['id']}/"
-            parcel_data['qr_base64_url'] = f"/parcels/qr/{parcel_data['id']}/base64/"
-
-        return Response(response_data, status=status.HTTP_200_OK)
+        student = Student.objects.filter(clerk_id=clerk_id).only(
+            'id', 'parcels_version', 'parcels_changed_at').first()
+        if student is None:
+            return Response([], status=status.HTTP_200_OK)
+
+        image_variant = requested_variant(request)
+
+        # ✅ Versioned cache + ETag: repeat loads get 304 Not Modified
+        variant = f"my.{image_variant}" if image_variant else 'my'
+        return versioned_parcel_response(
+            request, student, variant,
+            lambda: student_parcel_list(student, image_variant))
     except Exception as e:
         return Response(
             {"error": str(e)},
@@ -132,6 +195,7 @@ def my_parcels(request):
 
 
 @api_view(['PATCH'])
+@idempotent
 def mark_picked_up(request, parcel_id):
     """Simple check - just mark parcel as picked up"""
     try:
@@ -162,18 +226,22 @@ def mark_picked_up(request, parcel_id):
 
 
 @api_view(['GET'])
+@reads_from_replica
 def all_parcels(request):
     try:
-        parcels = Parcel.objects.all()
-        serializer = ParcelSerializer(parcels, many=True)
+        parcels = Parcel.objects.select_related('student')
+        context = {'image_variant': requested_variant(request)}
 
-        # ✅ Add QR URLs to each parcel
-        response_data = serializer.data
-        for parcel_data in response_data:
-            parcel_data['qr_url'] = f"/parcels/qr/{parcel_data['id']}/"
-            parcel_data['qr_base64_url'] = f"/parcels/qr/{parcel_data['id']}/base64/"
+        if wants_stream(request):
+            # ✅ Constant memory however many parcels there are
+            return streaming_json_response(parcels, lambda batch: with_qr_urls(
+                ParcelSerializer(batch, many=True, context=context).data))
 
-        return Response(response_data, status=status.HTTP_200_OK)
+        with span('serialize'):
+            serializer = ParcelSerializer(parcels, many=True, context=context)
+            response_data = serializer.data
+
+        return Response(with_qr_urls(response_data), status=status.HTTP_200_OK)
     except Exception as e:
         return Response(
             {"error": str(e)},
@@ -182,6 +250,7 @@ def all_parcels(request):
 
 
 # ✅ QR Code generation endpoint - generates QR on-the-go
+@throttle
 @etag(lambda r, parcel_id: f"parcelqr-{parcel_id}")
 @cache_control(max_age=86400)  # Cache for 24 hours
 def parcel_qr(request, parcel_id):
@@ -193,7 +262,8 @@ def parcel_qr(request, parcel_id):
         return HttpResponse("Parcel not available for pickup", status=410)
 
     # Generate QR PNG using your existing utility
-    png_bytes = make_qr_png(str(parcel_id), max_age_hours=48)
+    with span('qr'):
+        png_bytes = cached_qr_png(str(parcel_id), max_age_hours=48)
 
     return HttpResponse(
         png_bytes,
@@ -206,72 +276,11 @@ def parcel_qr(request, parcel_id):
 
 # ✅ QR Code verification endpoint
 @api_view(["POST"])
+@idempotent
 def verify_qr(request):
     """Verify scanned QR token and mark parcel as picked up"""
-    token = request.data.get("token")
-    if not token:
-        return Response(
-            {"error": "token required"},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-
-    try:
-        # Verify token signature and extract parcel_id
-        parcel_id = unsign_token(token, max_age_hours=48)
-        # ✅ Convert to int since unsign_token returns string
-        parcel_id = int(parcel_id)
-    except (SignatureExpired, ValueError) as e:
-        if isinstance(e, SignatureExpired):
-            return Response(
-                {"valid": False, "reason": "expired",
-                    "message": "QR code has expired"},
-                status=status.HTTP_410_GONE
-            )
-        else:
-            return Response(
-                {"valid": False, "reason": "invalid",
-                    "message": "Invalid parcel ID in QR code"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-    except BadSignature:
-        return Response(
-            {"valid": False, "reason": "tampered", "message": "Invalid QR code"},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-
-    # Get the parcel
-    parcel = get_object_or_404(Parcel, id=parcel_id)
-
-    # Check if parcel is still available for pickup
-    if parcel.status != Parcel.ParcelStatus.PENDING:
-        return Response(
-            {
-                "valid": False,
-                "reason": "already_picked",
-                "message": "Parcel has already been picked up"
-            },
-            status=status.HTTP_409_CONFLICT
-        )
-
-    # Mark as picked up
-    parcel.status = Parcel.ParcelStatus.PICKED_UP
-    parcel.picked_up_time = timezone.now()
-    parcel.save(update_fields=["status", "picked_up_time"])
-
-    return Response({
-        "valid": True,
-        "message": "Parcel successfully picked up!",
-        "parcel": {
-            "id": parcel.id,
-            "tracking_id": parcel.tracking_id,
-            "student_name": parcel.student.name,
-            "student_room": parcel.student.room_number,
-            "student_block": parcel.student.hostel_block,
-            "picked_up_at": parcel.picked_up_time.isoformat(),
-            "description": parcel.description,
-            "service": parcel.service
-        }
-    })
+    code, body = verify_scan(request.data.get("token"))
+    return Response(body, status=code)
 
 
 # ✅ Get QR code as base64 (for mobile/web display)
@@ -288,7 +297,8 @@ def parcel_qr_base64(request, parcel_id):
         )
 
     # Generate QR PNG
-    png_bytes = make_qr_png(str(parcel_id), max_age_hours=48)
+    with span('qr'):
+        png_bytes = cached_qr_png(str(parcel_id), max_age_hours=48)
 
     # Convert to base64
     qr_base64 = base64.b64encode(png_bytes).decode('utf-8')
@@ -306,7 +316,296 @@ def parcel_qr_base64(request, parcel_id):
     })
 
 
+def pending_parcel_summary(parcel):
+    return {
+        "id": parcel.id,
+        "tracking_id": parcel.tracking_id,
+        "description": parcel.description,
+        "service": parcel.service,
+        "received_at": parcel.created_at.isoformat(),
+    }
+
+
+def student_summary(student):
+    return {
+        "id": str(student.id),
+        "name": student.name,
+        "room": student.room_number,
+        "block": student.hostel_block,
+    }
+
+
+def pass_student(token):
+    """(student, None) for a valid pickup pass, else (None, error response)"""
+    if not token:
+        return None, Response(
+            {"error": "token required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        student_id = unsign_pass(token, max_age_hours=48)
+    except SignatureExpired:
+        return None, Response(
+            {"valid": False, "reason": "expired",
+                "message": "Pickup pass has expired"},
+            status=status.HTTP_410_GONE
+        )
+    except BadSignature:
+        return None, Response(
+            {"valid": False, "reason": "tampered",
+                "message": "Invalid pickup pass"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    student = Student.objects.filter(pk=student_id).first()
+    if student is None:
+        return None, Response(
+            {"valid": False, "reason": "not_found",
+                "message": "Student not found"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return student, None
+
+
+# ✅ One QR per student that releases all of their pending parcels
+@api_view(['GET'])
+def pickup_pass(request):
+    """Pickup pass for a student as a base64 QR, with the pending count"""
+    clerk_id = request.GET.get('clerk_id')
+    if not clerk_id:
+        return Response(
+            {"error": "clerk_id is required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    student = get_object_or_404(Student, clerk_id=clerk_id)
+    pending = Parcel.objects.filter(
+        student=student, status=Parcel.ParcelStatus.PENDING).count()
+    if not pending:
+        return Response(
+            {"error": "No parcels waiting for pickup"},
+            status=status.HTTP_410_GONE
+        )
+
+    with span('qr'):
+        png_bytes = make_pass_png(str(student.id))
+    qr_base64 = base64.b64encode(png_bytes).decode('utf-8')
+
+    return Response({
+        "qr_code": f"data:image/png;base64,{qr_base64}",
+        "expires_in_hours": 48,
+        "pending_count": pending,
+        "student_info": student_summary(student),
+    })
+
+
+@api_view(["POST"])
+def verify_pass(request):
+    """Show the guard a pass holder's pending parcels; changes nothing"""
+    student, error = pass_student(request.data.get("token"))
+    if error:
+        return error
+
+    parcels = Parcel.objects.filter(
+        student=student, status=Parcel.ParcelStatus.PENDING
+    ).order_by('created_at')
+    return Response({
+        "valid": True,
+        "student": student_summary(student),
+        "parcels": [pending_parcel_summary(parcel) for parcel in parcels],
+    })
+
+
+@api_view(["POST"])
+@idempotent
+def pickup_with_pass(request):
+    """Mark all (or the listed ``parcel_ids``) pending parcels of the pass
+    holder as picked up in one conditional update"""
+    student, error = pass_student(request.data.get("token"))
+    if error:
+        return error
+
+    parcels = Parcel.objects.filter(
+        student=student, status=Parcel.ParcelStatus.PENDING)
+    requested = request.data.get("parcel_ids")
+    if requested is not None:
+        try:
+            requested = {int(parcel_id) for parcel_id in requested}
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "parcel_ids must be a list of parcel ids"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        parcels = parcels.filter(id__in=requested)
+
+    picked_up_at = timezone.now()
+    with transaction.atomic():
+        # Lock the rows so two guards scanning the same pass release each
+        # parcel once; the status filter keeps the update conditional
+        released = list(parcels.select_for_update().order_by('created_at'))
+        ids = [parcel.id for parcel in released]
+        updated = Parcel.objects.filter(
+            id__in=ids, status=Parcel.ParcelStatus.PENDING,
+        ).update(status=Parcel.ParcelStatus.PICKED_UP,
+                 picked_up_time=picked_up_at, updated_at=picked_up_at)
+        if updated < len(released):
+            # Where row locks are a no-op (SQLite) a concurrent pickup may
+            # have released some first; report only the rows this update
+            # changed, recognisable by its timestamp
+            mine = set(Parcel.objects.filter(
+                id__in=ids, picked_up_time=picked_up_at,
+            ).values_list('id', flat=True))
+            released = [parcel for parcel in released if parcel.id in mine]
+        if released:
+            # update() skips the post_save signal that normally does these
+            bump_parcels_version(student.pk)
+            consumed = consumed_parcels()
+            if consumed is not None:
+                released_ids = [parcel.id for parcel in released]
+                # Not before commit: after a rollback they are still pending
+                transaction.on_commit(
+                    lambda: consumed.add_many(released_ids))
+
+    skipped = []
+    if requested is not None:
+        skipped = sorted(requested - {parcel.id for parcel in released})
+    if not released:
+        return Response(
+            {
+                "valid": False,
+                "reason": "already_picked",
+                "message": "No pending parcels to pick up",
+                "skipped": skipped,
+            },
+            status=status.HTTP_409_CONFLICT
+        )
+
+    return Response({
+        "valid": True,
+        "message": f"{len(released)} parcel(s) successfully picked up!",
+        "student": student_summary(student),
+        "picked_up_at": picked_up_at.isoformat(),
+        "parcels": [pending_parcel_summary(parcel) for parcel in released],
+        "skipped": skipped,
+    })
+
+
+def parcel_image(request, variant, name):
+    """Serve a photo kept by the local image storage backend.
+
+    Names are content hashes, so a URL always refers to the same bytes and
+    can be cached for a year. Variants are resized on first request.
+    """
+    storage = get_image_storage()
+    if not hasattr(storage, 'open_variant'):
+        raise Http404("Images are not stored locally")
+    path = storage.open_variant(variant, name)
+    return serve_file(request, path, "image/jpeg",
+                      etag=f"{variant}-{name[3:-4]}", max_age=365 * 24 * 3600)
+
+
+@require_GET
+@throttle
+def export_ledger(request, fmt):
+    """Stream the parcel ledger as CSV or XLSX.
+
+    Takes the same filters as the viewset (see parcels.filters), e.g.
+    /parcels/export/xlsx/?month=2025-09&block=Block%20C
+    """
+    if fmt not in STREAMS:
+        return JsonResponse({"error": "Format must be csv or xlsx"}, status=404)
+    try:
+        parcels = filter_parcels(Parcel.objects.all(), request.GET)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+
+    rows = ledger_rows(ledger_queryset(parcels))
+    response = StreamingHttpResponse(
+        STREAMS[fmt](rows), content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{export_filename(fmt, request.GET)}"')
+    return response
+
+
+@require_GET
+@throttle
+def parcel_labels(request, fmt):
+    """Print-ready QR labels (QR, tracking ID, name, block/room) for the
+    parcels matching the viewset filters plus ?ids=1,2,3, e.g.
+    /parcels/labels/pdf/?status=PENDING&created_after=2025-09-01
+
+    PDF streams every sheet; PNG returns one sheet, chosen with ?page=.
+    """
+    if fmt not in LABEL_CONTENT_TYPES:
+        return JsonResponse({"error": "Format must be pdf or png"}, status=404)
+    try:
+        parcels = filter_parcels(Parcel.objects.all(), request.GET)
+        if request.GET.get('ids'):
+            parcels = parcels.filter(
+                id__in=[int(i) for i in request.GET['ids'].split(',')])
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        return JsonResponse(
+            {"error": "ids and page must be numbers"}, status=400)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+
+    limit = settings.LABEL_SHEET_MAX_LABELS
+    label_list = list(labels(parcels, limit=limit + 1))
+    if len(label_list) > limit:
+        return JsonResponse(
+            {"error": f"At most {limit} labels per request; narrow the filters"},
+            status=400)
+    if not label_list:
+        return JsonResponse({"error": "No parcels match"}, status=404)
+
+    filename = f"parcel-labels-{timezone.localdate().isoformat()}.{fmt}"
+    if fmt == "pdf":
+        response = StreamingHttpResponse(
+            stream_label_pdf(label_list), content_type=LABEL_CONTENT_TYPES[fmt])
+    else:
+        start = (page - 1) * LABELS_PER_PAGE
+        if page < 1 or start >= len(label_list):
+            return JsonResponse({"error": "No such page"}, status=404)
+        response = HttpResponse(
+            next(png_pages(label_list[start:start + LABELS_PER_PAGE])),
+            content_type=LABEL_CONTENT_TYPES[fmt])
+        filename = filename.replace(".png", f"-{page}.png")
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    return response
+
+
 class ParcelViewSet(viewsets.ModelViewSet):
-    queryset = Parcel.objects.all()
+    """Paginated parcel CRUD.
+
+    Lists filter with ?status=, ?student=, ?service=, ?block=, ?month=,
+    ?created_after= and ?created_before= (see parcels.filters), sort with
+    ?ordering= on indexed columns, and
+    ?fields=id,status,... limits both the JSON and the selected columns.
+    """
+    queryset = Parcel.objects.select_related('student')
     serializer_class = ParcelSerializer
     parser_classes = (MultiPartParser, FormParser)
+    pagination_class = ParcelPagination
+    filter_backends = [ParcelFilter, IndexedOrderingFilter]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.requested_fields()
+        if fields:
+            queryset = only_columns(queryset, fields)
+        return queryset
+
+    def requested_fields(self):
+        # Reads only; writes always validate and return the full parcel
+        if self.request.method not in ('GET', 'HEAD'):
+            return None
+        if not hasattr(self, '_fields'):
+            self._fields = sparse_fields(self.request, self.serializer_class)
+        return self._fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['image_variant'] = requested_variant(self.request)
+        context['fields'] = self.requested_fields()
+        return context
@@ -1,5 +1,16 @@
 from django.contrib import admin
 from .models import Student
 
-# Register your models here.
-admin.site.register(Student)
\ No newline at end of file
+
+@admin.register(Student)
+class StudentAdmin(admin.ModelAdmin):
+    list_display = ['name', 'email', 'hostel_block', 'room_number',
+                    'is_active']
+    list_filter = ['is_active', 'hostel_block']
+    # Name prefix and exact email / Clerk id, each backed by an index
+    # (students migration 0005 adds the UPPER() ones on PostgreSQL), so
+    # search and the parcel/help request autocompletes never scan the table
+    search_fields = ['^name', '=email', '=clerk_id']
+    readonly_fields = ['date_joined']
+    ordering = ['name']
+    show_full_result_count = False
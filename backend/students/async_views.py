@@ -0,0 +1,21 @@
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from students.models import Student
+from students.serializers import StudentSerializer
+from utils.aio import db_read
+from utils.throttling import throttle
+
+
+@require_GET
+@throttle
+async def get_student_by_clerk_id(request):
+    """Async variant of students.views.get_student_by_clerk_id"""
+    clerk_id = request.GET.get('clerk_id')
+    if not clerk_id:
+        return JsonResponse({"error": "clerk_id is required"}, status=400)
+
+    student = await db_read(Student.objects.filter(clerk_id=clerk_id).first)
+    if student is None:
+        return JsonResponse({"error": "Student not found"}, status=404)
+    return JsonResponse(StudentSerializer(student).data)
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0003_alter_student_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='parcels_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='parcels_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# Admin search compiles '^name' to UPPER("name"::text) LIKE 'X%' and
+# '=email' to UPPER("email"::text) = 'X' on PostgreSQL, which plain b-tree
+# indexes on the columns can't serve. Other databases keep the plain ones.
+INDEXES = {
+    "students_student_name_upper_like":
+        'UPPER("name") text_pattern_ops',
+    "students_student_email_upper": 'UPPER("email")',
+    "students_student_clerk_id_upper": 'UPPER("clerk_id")',
+}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, expression in INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" '
+            f'ON "students_student" ({expression})')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0004_student_parcels_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
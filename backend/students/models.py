@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import uuid
 from django.core.validators import RegexValidator
 
@@ -25,10 +26,32 @@ class Student(models.Model):
     room_number = models.CharField(max_length=10, blank=True)    # e.g. "204‑B"
     date_joined = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    # Bumped whenever this student's parcel list output changes; keys the
+    # parcel list cache and the ETag/Last-Modified of the parcel views.
+    parcels_version = models.PositiveIntegerField(default=0, editable=False)
+    parcels_changed_at = models.DateTimeField(
+        default=timezone.now, editable=False)
+
+    # Only ever changed with F() updates (parcels.cache.bump_parcels_version)
+    COUNTER_FIELDS = ('parcels_version', 'parcels_changed_at')
 
     def __str__(self):
         return f"{self.name} ({self.clerk_id})"
 
+    def save(self, *args, **kwargs):
+        # An instance's counters may be stale by the time it is saved (a
+        # parcel was picked up meanwhile); writing them back would reuse a
+        # version number for a different parcel list
+        if not self._state.adding:
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields
+                                 if not field.primary_key]
+            kwargs['update_fields'] = [
+                name for name in update_fields
+                if name not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ["name"]
         indexes = [
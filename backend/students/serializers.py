@@ -5,7 +5,7 @@ from .models import Student
 class StudentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Student
-        fields = '__all__'
+        exclude = ('parcels_version', 'parcels_changed_at')
 
 
 class StudentMiniSerializer(serializers.ModelSerializer):
@@ -1,3 +1,54 @@
+import json
+
 from django.test import TestCase
 
-# Create your tests here.
+from parcels.cache import bump_parcels_version
+from .models import Student
+
+
+class StudentListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Student.objects.bulk_create(
+            Student(clerk_id=f"user_{i}", name=f"Student {i:02}",
+                    email=f"s{i}@example.edu")
+            for i in range(12))
+
+    def test_streamed_list_matches_buffered(self):
+        buffered = self.client.get("/students/all/").json()
+        with self.settings(STREAM_CHUNK_SIZE=5):
+            response = self.client.get("/students/all/?stream=1")
+            body = b"".join(response.streaming_content)
+        self.assertEqual(json.loads(body), buffered)
+        self.assertEqual(len(buffered), 12)
+
+
+class ParcelsVersionTests(TestCase):
+    def setUp(self):
+        self.student = Student.objects.create(
+            clerk_id="user_version", name="Mira Das", email="mira@example.edu",
+            room_number="12")
+
+    def version(self):
+        return Student.objects.get(pk=self.student.pk).parcels_version
+
+    def test_save_keeps_concurrent_bump(self):
+        stale = Student.objects.get(pk=self.student.pk)
+        bump_parcels_version(self.student.pk)
+        stale.room_number = "14"
+        stale.save()
+        # The bump survives, and the receiver's own bump goes on top of it
+        self.assertEqual(self.version(), 2)
+        self.assertEqual(
+            Student.objects.get(pk=self.student.pk).room_number, "14")
+
+    def test_unchanged_sync_does_not_invalidate(self):
+        payload = {"clerk_id": "user_version", "name": "Mira Das",
+                   "email": "mira@example.edu"}
+        with self.assertNumQueries(1):
+            response = self.client.post("/students/sync-clerk/", payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.version(), 0)
+
+        self.client.post("/students/sync-clerk/", {**payload, "name": "Mira D"})
+        self.assertEqual(self.version(), 1)
@@ -7,6 +7,7 @@ from .views import (
     get_my_parcels,
     get_all_students,
 )
+from . import async_views
 
 urlpatterns = [
     # Clerk integration
@@ -14,6 +15,8 @@ urlpatterns = [
 
     # Student operations by clerk_id (for frontend)
     path('by-clerk/', get_student_by_clerk_id, name='get_student_by_clerk_id'),
+    path('async/by-clerk/', async_views.get_student_by_clerk_id,
+         name='get_student_by_clerk_id_async'),
 
     # Student operations by student_id (for internal API)
     path('<uuid:student_id>/', get_student_details, name='get_student_details'),
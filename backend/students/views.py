@@ -1,11 +1,16 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
+from backend.routers import reads_from_replica
 from django.core.exceptions import ValidationError
 from parcels.models import Parcel
 from parcels.serializers import ParcelSerializer
+from parcels.cache import versioned_parcel_response
+from parcels.images import requested_variant
 from students.models import Student
 from students.serializers import StudentSerializer
+from utils.streaming import streaming_json_response, wants_stream
+from utils.timing import span
 
 
 @api_view(['POST'])
@@ -34,15 +39,17 @@ def sync_clerk_user(request):
 
         if not created:
             # Update existing student with new data
-            student.name = data.get("name", student.name)
-            student.email = data.get("email", student.email)
-            student.profile_image = data.get(
-                "profile_image", student.profile_image)
-            student.phone = data.get("phone", student.phone)
-            student.hostel_block = data.get(
-                "hostel_block", student.hostel_block)
-            student.room_number = data.get("room_number", student.room_number)
-            student.save()
+            changed = []
+            for field in ("name", "email", "profile_image", "phone",
+                          "hostel_block", "room_number"):
+                value = data.get(field, getattr(student, field))
+                if value != getattr(student, field):
+                    setattr(student, field, value)
+                    changed.append(field)
+            # ✅ Logins usually change nothing: skip the write and the
+            # parcel list cache invalidation that comes with it
+            if changed:
+                student.save(update_fields=changed)
 
         serializer = StudentSerializer(student)
         return Response({
@@ -147,6 +154,7 @@ def update_student_details(request, student_id):
 
 
 @api_view(['GET'])
+@reads_from_replica
 def get_my_parcels(request, student_id):
     """Get all parcels for a specific student by student ID"""
     try:
@@ -158,10 +166,19 @@ def get_my_parcels(request, student_id):
         )
 
     try:
-        parcels = Parcel.objects.filter(
-            student=student).order_by('-created_at')
-        serializer = ParcelSerializer(parcels, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        image_variant = requested_variant(request)
+
+        def build():
+            parcels = Parcel.objects.filter(
+                student=student).select_related('student').order_by('-created_at')
+            with span('serialize'):
+                serializer = ParcelSerializer(
+                    parcels, many=True,
+                    context={'image_variant': image_variant})
+                return serializer.data
+
+        variant = f"student.{image_variant}" if image_variant else 'student'
+        return versioned_parcel_response(request, student, variant, build)
     except Exception as e:
         return Response(
             {"error": str(e)},
@@ -170,12 +187,18 @@ def get_my_parcels(request, student_id):
 
 
 @api_view(['GET'])
+@reads_from_replica
 def get_all_students(request):
     """Get all students (for admin use)"""
     try:
         students = Student.objects.filter(is_active=True).order_by('name')
-        serializer = StudentSerializer(students, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        if wants_stream(request):
+            return streaming_json_response(
+                students, lambda batch: StudentSerializer(batch, many=True).data)
+        with span('serialize'):
+            serializer = StudentSerializer(students, many=True)
+            data = serializer.data
+        return Response(data, status=status.HTTP_200_OK)
     except Exception as e:
         return Response(
             {"error": str(e)},
@@ -1,3 +1,22 @@
 from django.contrib import admin
+from .models import HelpRequest
 
-# Register your models here.
+
+@admin.register(HelpRequest)
+class HelpRequestAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user_type', 'get_student_name', 'parcel',
+                    'status', 'created_at']
+    list_filter = ['status', 'user_type']
+    list_select_related = ['student', 'parcel__student']
+    autocomplete_fields = ['student', 'parcel']
+    date_hierarchy = 'created_at'
+    show_full_result_count = False
+    search_fields = ['=email']
+    readonly_fields = ['created_at']
+    ordering = ['-created_at']
+
+    def get_student_name(self, obj):
+        return obj.student.name if obj.student else "N/A"
+
+    get_student_name.short_description = 'Student Name'
+    get_student_name.admin_order_field = 'student__name'
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('support', '0003_helprequest_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='helprequest',
+            index=models.Index(fields=['created_at'], name='support_hel_created_1ba822_idx'),
+        ),
+    ]
@@ -24,3 +24,9 @@ class HelpRequest(models.Model):
      
     def __str__(self):
         return f"HelpRequest({self.user_type}, {self.student}, {self.status})"
+
+    class Meta:
+        indexes = [
+            # Admin date_hierarchy and ordering
+            models.Index(fields=['created_at']),
+        ]
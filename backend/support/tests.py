@@ -1,3 +1,72 @@
-from django.test import TestCase
+import io
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import TestCase, tag
+
+from parcels.models import Parcel
+from students.models import Student
+from utils.benchmark import measure
+from .models import HelpRequest
+
+
+@tag("benchmark")
+class SupportEndpointBenchmarks(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command("generate_synthetic_data", students=50, parcels=600,
+                     help_rate=0.1, stdout=io.StringIO())
+        cls.help_request = HelpRequest.objects.select_related(
+            "student").first()
+        cls.email = cls.help_request.student.email
+
+    def test_get_help_requests(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                "/support/my-requests/?user_type=student")
+        self.assertEqual(response.status_code, 200)
+        measure("support get_help_requests", lambda: self.client.get(
+            "/support/my-requests/?user_type=student"))
+
+    def test_get_my_help_requests(self):
+        url = f"/support/my/?email={self.email}"
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        measure("support get_my_help_requests",
+                lambda: self.client.get(url))
+
+    def test_create_help_request(self):
+        parcel = Parcel.objects.first()
+
+        def create():
+            return self.client.post("/support/create/", {
+                "email": self.email,
+                "user_type": "student",
+                "parcel": parcel.id,
+                "message": "Parcel not found at the counter",
+            }, content_type="application/json")
+
+        # Student lookup, parcel FK validation, insert
+        with self.assertNumQueries(3):
+            response = create()
+        self.assertEqual(response.status_code, 201)
+        measure("support create_help_request", create)
+
+    def test_update_help_request(self):
+        url = f"/support/update/{self.help_request.id}/"
+        measure("support update_help_request", lambda: self.client.patch(
+            url, {"status": "resolved"}, content_type="application/json"))
+
+
+class IdempotentHelpRequestTests(TestCase):
+    def test_retry_creates_one_request(self):
+        student = Student.objects.create(
+            clerk_id="user_help", name="Nia Paul", email="nia@example.edu")
+        body = {"email": student.email, "user_type": "student",
+                "message": "Where is my parcel?"}
+        responses = [self.client.post(
+            "/support/create/", body, content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY="help-1") for _ in range(2)]
+        self.assertEqual([r.status_code for r in responses], [201, 201])
+        self.assertEqual(responses[0].json(), responses[1].json())
+        self.assertEqual(HelpRequest.objects.count(), 1)
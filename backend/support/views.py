@@ -1,11 +1,14 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
+from backend.routers import reads_from_replica
+from parcels.idempotency import idempotent
 from students.models import Student
 from .models import HelpRequest
 from .serializers import HelpRequestSerializer
 
 @api_view(['POST'])
+@idempotent
 def create_help_request(request):
    
     email = request.data.get("email")
@@ -21,18 +24,22 @@ def create_help_request(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
+@reads_from_replica
 def get_help_requests(request):
     user_type = request.query_params.get('user_type', None)
     if user_type == 'student':
-        help_requests = HelpRequest.objects.filter(user_type='student')
+        help_requests = HelpRequest.objects.filter(
+            user_type='student').select_related('parcel')
     elif user_type == 'warden':
-        help_requests = HelpRequest.objects.filter(user_type='warden')
+        help_requests = HelpRequest.objects.filter(
+            user_type='warden').select_related('parcel')
     else:
         return Response({"error": "Invalid user type"}, status=status.HTTP_400_BAD_REQUEST)
 
     serializer = HelpRequestSerializer(help_requests, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 @api_view(['GET'])
+@reads_from_replica
 def get_my_help_requests(request):
     email = request.query_params.get('email', None)
 
@@ -44,7 +51,8 @@ def get_my_help_requests(request):
     except Student.DoesNotExist:
         return Response({"error": "Student not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    help_requests = HelpRequest.objects.filter(student=student)
+    help_requests = HelpRequest.objects.filter(
+        student=student).select_related('parcel')
     serializer = HelpRequestSerializer(help_requests, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
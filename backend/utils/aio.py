@@ -0,0 +1,53 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_db_executor = None
+
+
+def _executor():
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_DB_THREADS,
+            thread_name_prefix="async-db",
+        )
+    return _db_executor
+
+
+def _run_read(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Same per-request connection handling as the WSGI path: close if
+        # CONN_MAX_AGE expired or broken, return to the pool in pool mode
+        close_old_connections()
+
+
+async def db_read(func, *args, **kwargs):
+    """Run a read-only ORM block from an async view.
+
+    Django's async ORM (``aget``, ``async for``) funnels every query through
+    one shared thread, which caps a worker at one query in flight. Read
+    paths instead run here on a bounded pool (ASYNC_DB_THREADS), each
+    thread holding its own connection, so concurrent requests overlap their
+    database round trips. Don't open transactions or write from ``func``.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        _executor(), context.run, partial(_run_read, func, args, kwargs))
+
+
+async def db_write(func, *args, **kwargs):
+    """Run a short autocommit write (e.g. a pickup) from async code on the
+    same pool as db_read. It runs in a fresh context, so a replica routing
+    set up by the caller can never apply to it."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor(), contextvars.Context().run,
+        partial(_run_read, func, args, kwargs))
@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+logger = logging.getLogger("hosteldrop.benchmark")
+
+# Keep the default small so the suite stays fast in CI; raise it locally
+# (BENCHMARK_ITERATIONS=500) when comparing before/after numbers.
+ITERATIONS = int(os.environ.get("BENCHMARK_ITERATIONS", "20"))
+CONCURRENCY = int(os.environ.get("BENCHMARK_CONCURRENCY", "8"))
+OUTPUT = os.environ.get("BENCHMARK_OUTPUT")
+
+
+def summarize(name, samples, wall_time=None):
+    """Latency percentiles (ms) and throughput (req/s) for a list of samples"""
+    ordered = sorted(samples)
+    wall_time = wall_time if wall_time is not None else sum(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    return {
+        "name": name,
+        "requests": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "max_ms": ordered[-1] * 1000,
+        "throughput_rps": len(samples) / wall_time if wall_time else 0.0,
+    }
+
+
+def report(result):
+    """Log one result line and append it to BENCHMARK_OUTPUT if set"""
+    logger.info(
+        "%-32s n=%-5d p50=%.2fms p95=%.2fms max=%.2fms %.1f req/s",
+        result['name'], result['requests'], result['p50_ms'],
+        result['p95_ms'], result['max_ms'], result['throughput_rps'])
+    if OUTPUT:
+        with open(OUTPUT, "a") as fh:
+            fh.write(json.dumps(result) + "\n")
+    return result
+
+
+def measure(name, func, iterations=None):
+    """Call ``func`` sequentially and report its latency distribution"""
+    iterations = iterations or ITERATIONS
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return report(summarize(name, samples))
+
+
+def measure_concurrent(name, funcs, concurrency=None):
+    """Run ``funcs`` on a thread pool, each thread acting as one client.
+
+    Returns the report together with every call's return value so callers
+    can assert on status codes.
+    """
+    def run(func):
+        start = time.perf_counter()
+        try:
+            result = func()
+            return time.perf_counter() - start, result
+        finally:
+            # Worker threads open their own connections; don't leak them
+            connections.close_all()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency or CONCURRENCY) as pool:
+        outcomes = list(pool.map(run, funcs))
+    wall_time = time.perf_counter() - start
+
+    samples = [elapsed for elapsed, _ in outcomes]
+    results = [result for _, result in outcomes]
+    return report(summarize(name, samples, wall_time)), results
+
@@ -0,0 +1,76 @@
+"""Response compression with a size threshold and optional brotli.
+
+Extends Django's GZipMiddleware: responses below COMPRESSION_MIN_BYTES and
+content that is already compressed (images, byte ranges) are passed
+through, and clients that accept ``br`` get brotli when the ``brotli``
+package is installed. Streaming responses are compressed chunk by chunk.
+"""
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+re_accepts_br = _lazy_re_compile(r"\bbr\b")
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript",
+                      "application/xml", "image/svg+xml")
+
+
+def compress_br_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in sequence:
+        # Flush per chunk so streamed rows reach the client promptly
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if not self.should_compress(response):
+            return response
+
+        if (brotli is not None
+                and not (response.streaming and response.is_async)
+                and re_accepts_br.search(
+                    request.META.get("HTTP_ACCEPT_ENCODING", ""))):
+            return self.compress_br(response)
+        return super().process_response(request, response)
+
+    def should_compress(self, response):
+        if response.status_code == 206 or response.has_header(
+                "Content-Encoding"):
+            return False
+        if not response.get("Content-Type", "").startswith(COMPRESSIBLE_TYPES):
+            return False
+        if response.streaming:
+            # Size unknown up front; FileResponse bodies aren't compressible
+            # types here anyway
+            return True
+        return len(response.content) >= settings.COMPRESSION_MIN_BYTES
+
+    def compress_br(self, response):
+        patch_vary_headers(response, ("Accept-Encoding",))
+        quality = settings.BROTLI_QUALITY
+        if response.streaming:
+            response.streaming_content = compress_br_sequence(
+                response.streaming_content, quality)
+            del response.headers["Content-Length"]
+        else:
+            compressed = brotli.compress(response.content, quality=quality)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
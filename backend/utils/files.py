@@ -0,0 +1,76 @@
+import os
+import re
+
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import quote_etag
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single-range ``Range`` header.
+
+    Returns None when the header is absent or not a single byte range (the
+    whole file is served) and raises ValueError when it is unsatisfiable.
+    """
+    match = RANGE.match(header or "")
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def serve_file(request, path, content_type, etag, max_age):
+    """Serve a file that never changes under ``etag``, with byte ranges.
+
+    Handles If-None-Match (304), single ``Range`` requests (206/416) and
+    long-lived public caching. Multi-range requests get the whole file,
+    which RFC 9110 allows.
+    """
+    etag = quote_etag(etag)
+    size = os.path.getsize(path)
+
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponse(status=304)
+    else:
+        try:
+            byte_range = parse_range(request.headers.get("Range"), size)
+            if byte_range is not None and request.headers.get(
+                    "If-Range", etag) != etag:
+                byte_range = None
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+        handle = open(path, "rb")
+        if byte_range is None:
+            response = FileResponse(handle, content_type=content_type)
+        else:
+            start, end = byte_range
+            handle.seek(start)
+            response = HttpResponse(
+                handle.read(end - start + 1), status=206,
+                content_type=content_type)
+            handle.close()
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = str(end - start + 1)
+
+    response["ETag"] = etag
+    response["Accept-Ranges"] = "bytes"
+    patch_cache_control(response, public=True, max_age=max_age,
+                        immutable=True)
+    return response
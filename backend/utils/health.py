@@ -0,0 +1,33 @@
+"""Health check for load balancers and uptime monitors.
+
+Answers 503 only when the database is unreachable, since that breaks every
+request. An open image-upload circuit (utils.uploads) reports "degraded":
+intake still works, photos are just queued, so the instance should stay in
+rotation.
+"""
+from django.db import DatabaseError, connection
+from django.http import JsonResponse
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
+
+from parcels.models import DeferredUpload
+from utils.uploads import breaker_state
+
+
+@never_cache
+@require_GET
+def health_view(request):
+    try:
+        connection.ensure_connection()
+        queued = DeferredUpload.objects.count()
+    except DatabaseError:
+        return JsonResponse({"status": "unavailable", "database": "down"},
+                            status=503)
+
+    uploads = {**breaker_state(), "queued": queued}
+    healthy = uploads["state"] == "closed"
+    return JsonResponse({
+        "status": "ok" if healthy else "degraded",
+        "database": "ok",
+        "image_uploads": uploads,
+    })
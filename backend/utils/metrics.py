@@ -0,0 +1,191 @@
+"""Prometheus metrics for the API.
+
+Metric updates are plain in-process increments. When the app runs under
+several worker processes, set ``PROMETHEUS_MULTIPROC_DIR`` to an empty,
+writable directory before the workers start: each process then writes its
+samples to its own mmap'd file and ``metrics_view`` merges them on scrape.
+With gunicorn, call ``prometheus_client.multiprocess.mark_process_dead``
+from the ``child_exit`` hook.
+"""
+import hmac
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from utils.timing import wrap_queries
+
+REQUEST_LATENCY = Histogram(
+    "hosteldrop_request_duration_seconds",
+    "Request latency by view and status class (2xx, 4xx...)",
+    ["view", "status"],
+)
+REQUESTS = Counter(
+    "hosteldrop_requests_total",
+    "Requests by view, method and status code",
+    ["view", "method", "status"],
+)
+DB_QUERIES = Counter(
+    "hosteldrop_db_queries_total",
+    "Database queries executed, by view",
+    ["view"],
+)
+DB_QUERY_TIME = Counter(
+    "hosteldrop_db_query_seconds_total",
+    "Time spent in database queries, by view",
+    ["view"],
+)
+UPLOAD_LATENCY = Histogram(
+    "hosteldrop_cloudinary_upload_duration_seconds",
+    "Parcel image upload duration (any IMAGE_STORAGE backend)",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 30),
+)
+UPLOAD_FAILURES = Counter(
+    "hosteldrop_cloudinary_upload_failures_total",
+    "Parcel image uploads that raised",
+)
+UPLOAD_DEDUP_HITS = Counter(
+    "hosteldrop_image_dedup_hits_total",
+    "Parcel image uploads skipped because the same bytes were already stored",
+)
+UPLOAD_RETRIES = Counter(
+    "hosteldrop_cloudinary_upload_retries_total",
+    "Cloudinary uploads retried after a transient failure",
+)
+UPLOAD_CIRCUIT_OPEN = Gauge(
+    "hosteldrop_cloudinary_circuit_open",
+    "1 while the Cloudinary upload circuit breaker is open",
+    multiprocess_mode="livemax",
+)
+UPLOADS_DEFERRED = Counter(
+    "hosteldrop_image_uploads_deferred_total",
+    "Parcel photos queued for a later upload because Cloudinary was down",
+)
+QR_RENDER_LATENCY = Histogram(
+    "hosteldrop_qr_render_duration_seconds",
+    "QR code PNG rendering time",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+QR_CACHE = Counter(
+    "hosteldrop_qr_cache_requests_total",
+    "QR PNG cache lookups by result (hit/miss)",
+    ["result"],
+)
+QR_VERIFICATIONS = Counter(
+    "hosteldrop_qr_verifications_total",
+    "verify_qr outcomes",
+    ["outcome"],
+)
+REPLAY_HITS = Counter(
+    "hosteldrop_qr_replay_hits_total",
+    "Rescans of picked up parcels refused by the consumed-token store, by "
+    "tier (local/shared)",
+    ["tier"],
+)
+SCAN_ACK_LATENCY = Histogram(
+    "hosteldrop_scan_ack_duration_seconds",
+    "Time from receiving a scan on the guard scan socket to sending its result",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1),
+)
+THROTTLED = Counter(
+    "hosteldrop_throttled_requests_total",
+    "Requests refused by the throttle, by scope and by which bucket ran dry "
+    "(client/global)",
+    ["scope", "bucket"],
+)
+
+
+class MetricsMiddleware:
+    """Record latency, status and DB usage per resolved view.
+
+    Query counts are summed locally and added to the counters once per
+    request, so instrumentation takes a handful of metric updates per
+    request rather than one per query.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = QueryTally()
+        start = time.perf_counter()
+        with wrap_queries(queries):
+            response = self.get_response(request)
+        return self.observe(request, response, queries, start)
+
+    async def __acall__(self, request):
+        queries = QueryTally()
+        start = time.perf_counter()
+        with wrap_queries(queries):
+            response = await self.get_response(request)
+        return self.observe(request, response, queries, start)
+
+    def observe(self, request, response, queries, start):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match else "<unmatched>"
+        # Status class, not code, to keep the histogram's series bounded
+        REQUEST_LATENCY.labels(view, f"{response.status_code // 100}xx").observe(
+            duration)
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        if queries.count:
+            DB_QUERIES.labels(view).inc(queries.count)
+            DB_QUERY_TIME.labels(view).inc(queries.duration)
+        return response
+
+
+class QueryTally:
+    """Database execute wrapper counting queries and their total time"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def metrics_view(request):
+    """Prometheus text exposition for holders of METRICS_TOKEN, or anyone
+    with METRICS_PUBLIC"""
+    token = settings.METRICS_TOKEN
+    if token:
+        sent = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(sent, f"Bearer {token}"):
+            return HttpResponseForbidden()
+    elif not settings.METRICS_PUBLIC:
+        return HttpResponseForbidden("Set METRICS_TOKEN to scrape metrics")
+
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
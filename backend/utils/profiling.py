@@ -0,0 +1,317 @@
+"""On-demand profiling of individual requests.
+
+Enabled with PROFILING_ENABLED; otherwise Django drops the middleware at
+startup and requests pay nothing for it. When enabled, a request is
+profiled if
+
+* it carries an ``X-Profile`` header signed by ``manage.py profile_requests
+  token`` (valid for the minutes given there),
+* ``manage.py profile_requests on --path /parcels/my/`` switched profiling
+  on for its path; workers poll that flag at most every
+  PROFILING_TOGGLE_POLL_SECONDS, so it costs no per-request lookup, or
+* it is picked at random at PROFILING_SAMPLE_RATE.
+
+Everything else costs one dictionary lookup and a clock read.
+
+Two modes:
+
+``cprofile``
+    Deterministic profile of the view, saved as ``<id>.prof`` for pstats,
+    snakeviz and friends. cProfile instruments every call, so timings are
+    inflated; only one request per process is profiled this way at a time
+    (others fall back to sampling).
+``sample``
+    A background thread records the request thread's stack every
+    PROFILING_SAMPLE_INTERVAL_MS, saved as ``<id>.folded``: one
+    ``frame;frame;frame count`` line per stack, as flamegraph.pl and
+    speedscope read them. Low overhead, so it is what sampled and toggled
+    requests use.
+
+Profilers attach in ``process_view`` to the thread that runs the view. That
+matters under ASGI, where a sync view runs in a sync_to_async worker
+thread rather than the event loop's. Async views run on the loop itself,
+so they are sampled there, including whatever else the loop runs
+meanwhile; cProfile can't follow them and is refused.
+
+Each report gets ``<id>.json`` with the request's method, path, view,
+status, duration and trigger, plus ``refused`` when a cprofile request
+got a sample instead, and its id comes back in ``X-Profile-Id``.
+Reports live in PROFILING_DIR; the oldest are deleted once it grows past
+PROFILING_MAX_MB.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signing import BadSignature, TimestampSigner
+
+MODES = ("cprofile", "sample")
+HEADER = "X-Profile"
+TOGGLE_KEY = "profiling:toggle"
+
+token_signer = TimestampSigner(salt="hosteldrop.profiling")
+# cProfile can't run in two threads of a process at once (3.12+ refuses)
+_cprofile_lock = threading.Lock()
+
+
+def make_token(mode="sample"):
+    """X-Profile header value asking for a ``mode`` profile"""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    return token_signer.sign(mode)
+
+
+def set_toggle(path_prefix, mode="sample", minutes=10):
+    """Profile every request under ``path_prefix`` for ``minutes``, in all
+    workers sharing the cache"""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    cache.set(TOGGLE_KEY, {"prefix": path_prefix, "mode": mode,
+                           "until": time.time() + minutes * 60}, minutes * 60)
+
+
+def clear_toggle():
+    cache.delete(TOGGLE_KEY)
+
+
+class StackSampler:
+    """Counts a thread's stacks, sampled from a background thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profile-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                module = frame.f_globals.get("__name__", "?")
+                frames.append(f"{module}:{code.co_qualname}")
+                frame = frame.f_back
+            if frames:
+                # Root first; ';' separates frames in the folded format
+                self.stacks[";".join(reversed(frames))] += 1
+                self.samples += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n"
+                       for stack, count in self.stacks.most_common())
+
+
+class ProfileRun:
+    """A request picked for profiling, and what watched its view"""
+
+    def __init__(self, mode, reason):
+        self.mode = mode
+        self.reason = reason
+        self.start = time.perf_counter()
+        # Thread the request entered the middleware on; the event loop's
+        # under ASGI
+        self.thread_id = threading.get_ident()
+        self.profiler = None
+        self.sampler = None
+        self.refused = None
+
+    @staticmethod
+    def new_sampler(thread_id):
+        return StackSampler(thread_id,
+                            settings.PROFILING_SAMPLE_INTERVAL_MS / 1000)
+
+    def call(self, view_func, request, args, kwargs):
+        """Run a sync view here, in the calling thread, under the profiler"""
+        if self.mode == "cprofile":
+            if _cprofile_lock.acquire(blocking=False):
+                import cProfile
+
+                self.profiler = cProfile.Profile()
+                try:
+                    self.profiler.enable()
+                    try:
+                        return view_func(request, *args, **kwargs)
+                    finally:
+                        self.profiler.disable()
+                finally:
+                    _cprofile_lock.release()
+            self.refused = "another request holds the cprofile slot"
+        with self.new_sampler(threading.get_ident()) as self.sampler:
+            return view_func(request, *args, **kwargs)
+
+    def follow(self):
+        """Sample the request's own thread, for a view that runs there"""
+        if self.mode == "cprofile":
+            self.refused = "async views can only be sampled"
+        self.sampler = self.new_sampler(self.thread_id).__enter__()
+
+    def stop(self):
+        if self.sampler is not None:
+            # Ends follow()'s sampler; a no-op for call()'s, already ended
+            self.sampler.__exit__(None, None, None)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.toggle = None
+        self.toggle_checked = float("-inf")
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def trigger(self, request):
+        """(mode, what triggered it) if this request should be profiled"""
+        header = request.META.get("HTTP_X_PROFILE")
+        if header:
+            try:
+                mode = token_signer.unsign(
+                    header, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+            except BadSignature:
+                mode = None
+            if mode in MODES:
+                return mode, "header"
+
+        now = time.monotonic()
+        if now - self.toggle_checked >= settings.PROFILING_TOGGLE_POLL_SECONDS:
+            self.toggle_checked = now
+            self.toggle = cache.get(TOGGLE_KEY)
+        toggle = self.toggle
+        if (toggle and toggle["until"] > time.time()
+                and request.path.startswith(toggle["prefix"])):
+            return toggle["mode"], "toggle"
+
+        rate = settings.PROFILING_SAMPLE_RATE
+        if rate and random.random() < rate:
+            return "sample", "sampling"
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = self.trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        request._profile_run = run = ProfileRun(*trigger)
+        try:
+            response = self.get_response(request)
+        finally:
+            run.stop()
+        return self.save(request, response, run)
+
+    async def __acall__(self, request):
+        trigger = self.trigger(request)
+        if trigger is None:
+            return await self.get_response(request)
+
+        request._profile_run = run = ProfileRun(*trigger)
+        try:
+            response = await self.get_response(request)
+        finally:
+            run.stop()
+        return self.save(request, response, run)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # A sync method: under ASGI, Django calls it in the worker thread
+        # that runs sync views, so calling the view from here puts the
+        # profiler on that thread. Being innermost, every other
+        # middleware's process_view has already run.
+        run = getattr(request, "_profile_run", None)
+        if run is None:
+            return None
+        if iscoroutinefunction(view_func):
+            # Runs on the request's thread (the event loop) once we return
+            run.follow()
+            return None
+        return run.call(view_func, request, view_args, view_kwargs)
+
+    def save(self, request, response, run):
+        if run.profiler is None and run.sampler is None:
+            # No view ran (unresolved path, or answered by a middleware)
+            return response
+        duration = time.perf_counter() - run.start
+        report_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        directory = settings.PROFILING_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, report_id)
+
+        match = request.resolver_match
+        meta = {
+            "id": report_id,
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 1),
+            "trigger": run.reason,
+            "mode": "cprofile" if run.profiler else "sample",
+            "pid": os.getpid(),
+        }
+        if run.refused:
+            meta["refused"] = run.refused
+        if run.profiler is not None:
+            run.profiler.dump_stats(f"{path}.prof")
+        else:
+            meta["samples"] = run.sampler.samples
+            meta["interval_ms"] = settings.PROFILING_SAMPLE_INTERVAL_MS
+            with open(f"{path}.folded", "w") as out:
+                out.write(run.sampler.folded())
+        with open(f"{path}.json", "w") as out:
+            json.dump(meta, out, indent=2)
+
+        prune(directory, settings.PROFILING_MAX_MB * 1024 * 1024)
+        response["X-Profile-Id"] = report_id
+        return response
+
+
+def prune(directory, max_bytes):
+    """Delete the oldest reports until ``directory`` fits in ``max_bytes``"""
+    reports = {}
+    total = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            total += stat.st_size
+            stem = entry.name.split(".", 1)[0]
+            size, mtime, paths = reports.get(stem, (0, stat.st_mtime, []))
+            reports[stem] = (size + stat.st_size, min(mtime, stat.st_mtime),
+                             paths + [entry.path])
+    for stem in sorted(reports, key=lambda stem: reports[stem][1]):
+        if total <= max_bytes:
+            break
+        size, _, paths = reports[stem]
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Pruned concurrently by another worker
+                pass
+        total -= size
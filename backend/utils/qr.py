@@ -1,16 +1,92 @@
 import io
-import qrcode
+import time
+from django.conf import settings
+from django.core.cache import cache
 from django.core.signing import TimestampSigner, BadSignature, SignatureExpired
+from utils.metrics import QR_CACHE, QR_RENDER_LATENCY
 
 signer = TimestampSigner()
+# Separate salt: a parcel token never verifies as a pickup pass or back
+pass_signer = TimestampSigner(salt="hosteldrop.pickup-pass")
+# Printed labels stay on a parcel until it is collected, which can be well
+# past the 48 hours a dashboard code lives; they get their own salt and
+# LABEL_TOKEN_MAX_AGE_DAYS
+label_signer = TimestampSigner(salt="hosteldrop.label")
 
 
-def make_qr_png(parcel_id: str, max_age_hours=48) -> bytes:
-    token = signer.sign(parcel_id)
+def render_qr_png(token: str) -> bytes:
+    # qrcode pulls in PIL; import on first render rather than at startup
+    import qrcode
+
     img_io = io.BytesIO()
+    start = time.perf_counter()
     qrcode.make(token, box_size=8, border=2).save(img_io, format="PNG")
+    QR_RENDER_LATENCY.observe(time.perf_counter() - start)
     return img_io.getvalue()
 
 
+def make_qr_png(parcel_id: str, max_age_hours=48) -> bytes:
+    return render_qr_png(signer.sign(parcel_id))
+
+
+def make_pass_png(student_id: str) -> bytes:
+    """QR pickup pass releasing all of a student's pending parcels"""
+    return render_qr_png(pass_signer.sign(student_id))
+
+
+def cached_qr_png(parcel_id: str, max_age_hours=48) -> bytes:
+    """make_qr_png, reusing a recent render for QR_CACHE_SECONDS.
+
+    The embedded token keeps its signing time, so a cached code is still
+    valid for at least ``max_age_hours`` minus the cache timeout.
+    """
+    key = f"qr:{parcel_id}"
+    png_bytes = cache.get(key)
+    if png_bytes is not None:
+        QR_CACHE.labels("hit").inc()
+        return png_bytes
+
+    QR_CACHE.labels("miss").inc()
+    png_bytes = make_qr_png(parcel_id, max_age_hours=max_age_hours)
+    cache.set(key, png_bytes, settings.QR_CACHE_SECONDS)
+    return png_bytes
+
+
+def cached_qr_pngs(parcel_ids, max_age_hours=48) -> dict:
+    """cached_qr_png for several parcels with one cache round trip each way;
+    maps each id to its PNG bytes"""
+    keys = {f"qr:{parcel_id}": parcel_id for parcel_id in parcel_ids}
+    found = cache.get_many(keys)
+    QR_CACHE.labels("hit").inc(len(found))
+    QR_CACHE.labels("miss").inc(len(keys) - len(found))
+
+    rendered = {key: make_qr_png(parcel_id, max_age_hours=max_age_hours)
+                for key, parcel_id in keys.items() if key not in found}
+    if rendered:
+        cache.set_many(rendered, settings.QR_CACHE_SECONDS)
+    return {parcel_id: found.get(key) or rendered[key]
+            for key, parcel_id in keys.items()}
+
+
 def unsign_token(token: str, max_age_hours=48) -> str:
     return signer.unsign(token, max_age=max_age_hours * 3600)
+
+
+def unsign_pass(token: str, max_age_hours=48) -> str:
+    return pass_signer.unsign(token, max_age=max_age_hours * 3600)
+
+
+def sign_label(parcel_id: str) -> str:
+    return label_signer.sign(parcel_id)
+
+
+def unsign_scanned(token: str) -> str:
+    """Parcel id from a scanned dashboard code (valid 48 hours) or printed
+    label (valid LABEL_TOKEN_MAX_AGE_DAYS)"""
+    try:
+        return unsign_token(token)
+    except SignatureExpired:
+        raise
+    except BadSignature:
+        return label_signer.unsign(
+            token, max_age=settings.LABEL_TOKEN_MAX_AGE_DAYS * 86400)
@@ -0,0 +1,36 @@
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from utils.rendering import dumps
+
+
+def stream_json_list(queryset, serialize, chunk_size=None):
+    """Yield ``queryset`` as one JSON array, ``chunk_size`` rows at a time.
+
+    Rows come from ``.iterator()`` (a server-side cursor on PostgreSQL) and
+    ``serialize(rows)`` turns each batch into a list, so peak memory is one
+    batch no matter how large the table is.
+    """
+    chunk_size = chunk_size or settings.STREAM_CHUNK_SIZE
+    rows = queryset.iterator(chunk_size=chunk_size)
+    yield b"["
+    separator = b""
+    while batch := list(islice(rows, chunk_size)):
+        data = serialize(batch)
+        if data:
+            yield separator + dumps(data)[1:-1]
+            separator = b","
+    yield b"]"
+
+
+def streaming_json_response(queryset, serialize, chunk_size=None):
+    return StreamingHttpResponse(
+        stream_json_list(queryset, serialize, chunk_size),
+        content_type="application/json")
+
+
+def wants_stream(request):
+    """Large lists stream when asked with ?stream=1"""
+    return request.GET.get("stream") in ("1", "true")
@@ -0,0 +1,188 @@
+"""Token-bucket throttling, per endpoint scope and per client.
+
+Every view belongs to a scope (THROTTLE_SCOPES maps URL names to scopes,
+anything unlisted is ``default``). A request spends one token from its
+client's bucket for that scope (THROTTLE_RATES) and, when the scope has a
+global cap, one from the scope's shared bucket (THROTTLE_GLOBAL_RATES).
+
+Scopes never share buckets, so the ``pickup`` scope (verify_qr and the
+pickup pass endpoints) keeps its whole budget however hard clients poll
+``heavy`` lists and exports.
+
+Buckets live in process memory by default (THROTTLE_BACKEND=local), which
+limits each worker separately. THROTTLE_BACKEND=cache keeps them in the
+default cache so every worker shares them; read-modify-write on the cache
+is not atomic, so concurrent requests may occasionally slip one extra
+token through.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import cache, wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+from utils.metrics import THROTTLED
+
+PERIODS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600,
+           "d": 86400, "day": 86400}
+
+
+@cache
+def parse_rate(rate):
+    """"120/min" -> (capacity, tokens per second); None means unlimited"""
+    if not rate:
+        return None
+    try:
+        count, period = rate.split("/")
+        count = int(count)
+        seconds = PERIODS[period]
+    except (KeyError, ValueError):
+        raise ImproperlyConfigured(f"Bad throttle rate {rate!r}, use N/min")
+    return count, count / seconds
+
+
+def _refill(state, capacity, per_second, now):
+    tokens, updated = state if state else (capacity, now)
+    return min(capacity, tokens + (now - updated) * per_second)
+
+
+class LocalBuckets:
+    """Buckets for this process, least recently used dropped past
+    ``max_keys`` (a dropped bucket is simply full again)"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, per_second):
+        """Seconds to wait, or 0 after spending a token"""
+        now = time.monotonic()
+        with self.lock:
+            tokens = _refill(self.buckets.pop(key, None),
+                             capacity, per_second, now)
+            wait = 0 if tokens >= 1 else (1 - tokens) / per_second
+            self.buckets[key] = (tokens - 1 if not wait else tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBuckets:
+    """Buckets in the default cache, shared by every worker"""
+
+    def take(self, key, capacity, per_second):
+        now = time.time()
+        key = f"throttle:{key}"
+        tokens = _refill(default_cache.get(key), capacity, per_second, now)
+        wait = 0 if tokens >= 1 else (1 - tokens) / per_second
+        # Expire once the bucket would be full again anyway
+        default_cache.set(key, (tokens - 1 if not wait else tokens, now),
+                          int(capacity / per_second) + 1)
+        return wait
+
+    def clear(self):
+        pass
+
+
+@cache
+def _buckets(backend):
+    if backend == "local":
+        return LocalBuckets()
+    if backend == "cache":
+        return CacheBuckets()
+    raise ImproperlyConfigured(f"Unknown THROTTLE_BACKEND {backend!r}")
+
+
+def get_buckets():
+    return _buckets(settings.THROTTLE_BACKEND)
+
+
+def request_scope(request, view=None):
+    scope = getattr(view, "throttle_scope", None)
+    if scope:
+        return scope
+    match = getattr(request, "resolver_match", None)
+    url_name = match.url_name if match else None
+    return settings.THROTTLE_SCOPES.get(url_name, "default")
+
+
+def client_idents(request):
+    """Buckets a request spends from: always its network address, and the
+    Clerk user it names too. ``?clerk_id=`` is client-supplied, so it only
+    adds a limit; varying it never earns a fresh bucket."""
+    idents = [f"ip:{BaseThrottle().get_ident(request)}"]
+    clerk_id = request.GET.get("clerk_id")
+    if clerk_id:
+        idents.append(f"clerk:{clerk_id}")
+    return idents
+
+
+def check(request, scope):
+    """Spend a token for ``request`` in ``scope``; the seconds to wait when
+    the client's or the scope's bucket is empty, else 0"""
+    if not settings.THROTTLE_ENABLED:
+        return 0
+    buckets = get_buckets()
+    per_client = parse_rate(settings.THROTTLE_RATES.get(scope))
+    if per_client:
+        for ident in client_idents(request):
+            wait = buckets.take(f"{scope}:{ident}", *per_client)
+            if wait:
+                THROTTLED.labels(scope, "client").inc()
+                return wait
+    shared = parse_rate(settings.THROTTLE_GLOBAL_RATES.get(scope))
+    if shared:
+        wait = buckets.take(f"{scope}:*", *shared)
+        if wait:
+            THROTTLED.labels(scope, "global").inc()
+            return wait
+    return 0
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """DRF throttle for every API view (DEFAULT_THROTTLE_CLASSES)"""
+
+    def allow_request(self, request, view):
+        self._wait = check(request, request_scope(request, view))
+        return not self._wait
+
+    def wait(self):
+        return self._wait
+
+
+def _throttled(wait):
+    return JsonResponse(
+        {"error": "Too many requests, slow down"}, status=429,
+        headers={"Retry-After": str(max(1, round(wait)))})
+
+
+def throttle(view):
+    """Throttle a plain Django view (sync or async) like TokenBucketThrottle
+    does API views"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            wait = check(request, request_scope(request))
+            if wait:
+                return _throttled(wait)
+            return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        wait = check(request, request_scope(request))
+        if wait:
+            return _throttled(wait)
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,179 @@
+import logging
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger("hosteldrop.slow_requests")
+
+_current = ContextVar("request_timing", default=None)
+_query_wrappers = ContextVar("query_wrappers", default=())
+
+
+def _dispatch_query(execute, sql, params, many, context):
+    wrappers = _query_wrappers.get()
+    for wrapper in wrappers:
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def _install_dispatcher(sender, connection, **kwargs):
+    # First in the list, not last: connection.execute_wrapper() pops the
+    # last entry on exit, and a connection first used inside such a block
+    # would otherwise lose that block's wrapper and keep ours
+    if _dispatch_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _dispatch_query)
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """Route the current context's queries through a database execute
+    wrapper.
+
+    Connections are per thread and the async ORM runs queries in a worker
+    thread, so the active wrappers live in a context variable (copied into
+    that thread) and a dispatcher installed on every connection applies them.
+    """
+    for connection in connections.all(initialized_only=True):
+        _install_dispatcher(None, connection)
+    token = _query_wrappers.set(_query_wrappers.get() + (wrapper,))
+    try:
+        yield
+    finally:
+        _query_wrappers.reset(token)
+
+
+@contextmanager
+def span(name):
+    """Time a named block (``qr``, ``upload``, ``serialize``...) of the
+    current request. Costs a single context variable lookup when
+    RequestTimingMiddleware is disabled."""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.spans[name] += time.perf_counter() - start
+
+
+class RequestTiming:
+    def __init__(self):
+        self.spans = defaultdict(float)
+        self.queries = []
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def sql_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def duplicate_queries(self):
+        """SQL statements (ignoring parameters) that ran more than once"""
+        counts = Counter(sql for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+    def slowest_queries(self, limit):
+        return sorted(self.queries, key=lambda q: q[1], reverse=True)[:limit]
+
+    def server_timing(self, total):
+        duplicates = sum(count - 1 for count in self.duplicate_queries().values())
+        metrics = [
+            f'db;dur={self.sql_time * 1000:.1f};'
+            f'desc="{len(self.queries)} queries, {duplicates} duplicate"'
+        ]
+        metrics += [
+            f"{name};dur={duration * 1000:.1f}"
+            for name, duration in self.spans.items()
+        ]
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+class RequestTimingMiddleware:
+    """Per-request SQL and span timings, exposed as ``Server-Timing``.
+
+    Enabled with REQUEST_TIMING_ENABLED; otherwise Django drops the
+    middleware at startup and requests pay nothing for it. Requests slower
+    than SLOW_REQUEST_MS are written to the ``hosteldrop.slow_requests`` log
+    with their slowest and duplicated statements.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            with wrap_queries(timing.record_query):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timing, start)
+
+    async def __acall__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            with wrap_queries(timing.record_query):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timing, start)
+
+    def finish(self, request, response, timing, start):
+        total = time.perf_counter() - start
+        response["Server-Timing"] = timing.server_timing(total)
+        response["Timing-Allow-Origin"] = ", ".join(settings.CORS_ALLOWED_ORIGINS)
+
+        if total * 1000 >= settings.SLOW_REQUEST_MS:
+            self.log_slow_request(request, response, timing, total)
+        return response
+
+    def log_slow_request(self, request, response, timing, total):
+        slowest = "\n".join(
+            f"  {duration * 1000:8.1f}ms  {sql}"
+            for sql, duration in timing.slowest_queries(
+                settings.SLOW_REQUEST_TOP_QUERIES)
+        )
+        duplicates = "\n".join(
+            f"  {count}x  {sql}"
+            for sql, count in timing.duplicate_queries().items()
+        )
+        logger.warning(
+            "Slow request %s %s -> %s in %.1fms (%d queries, %.1fms SQL; %s)"
+            "\nSlowest queries:\n%s\nDuplicate queries:\n%s",
+            request.method, request.get_full_path(), response.status_code,
+            total * 1000, len(timing.queries), timing.sql_time * 1000,
+            ", ".join(f"{name} {duration * 1000:.1f}ms"
+                      for name, duration in timing.spans.items()) or "no spans",
+            slowest or "  (none)", duplicates or "  (none)",
+        )
@@ -0,0 +1,230 @@
+"""Cloudinary client for parcel photo uploads.
+
+Uploads go through ``upload()``, which adds what the SDK leaves out:
+
+* a keep-alive connection pool sized for the worker's threads
+  (CLOUDINARY_POOL_SIZE), replacing the SDK's one-connection default, so
+  concurrent intake requests don't each pay a TLS handshake;
+* connect and read timeouts (CLOUDINARY_CONNECT_TIMEOUT,
+  CLOUDINARY_READ_TIMEOUT); the SDK waits forever by default;
+* up to CLOUDINARY_UPLOAD_RETRIES retries of transient failures (network
+  errors, 5xx, rate limiting) with jittered backoff, within
+  CLOUDINARY_UPLOAD_DEADLINE seconds: each attempt's timeout is cut to the
+  time left, and no retry starts without time to connect. Uploads use a
+  content-hash public id without overwrite, so a retry of an upload that
+  did land is harmless;
+* a circuit breaker: after CLOUDINARY_BREAKER_THRESHOLD failed uploads in
+  a row it opens, and uploads fail at once with UploadUnavailable for
+  CLOUDINARY_BREAKER_COOLDOWN seconds; then one trial upload decides
+  whether it closes again. Callers queue the photo for later
+  (parcels.deferred) instead of holding the request.
+
+The breaker is per process; ``breaker_state()`` reports it for health
+checks (utils.health).
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from utils.metrics import UPLOAD_CIRCUIT_OPEN, UPLOAD_RETRIES
+
+_configured = False
+_lock = threading.Lock()
+
+
+class UploadUnavailable(Exception):
+    """Cloudinary is unreachable or its circuit is open; try again later"""
+
+
+def configure_cloudinary():
+    """Configure the Cloudinary SDK from CLOUDINARY_STORAGE, once.
+
+    Deferred to first use so that workers which never handle an image
+    don't pay for it at startup.
+    """
+    global _configured
+    import cloudinary
+
+    if not _configured:
+        with _lock:
+            if not _configured:
+                cloudinary.config(
+                    cloud_name=settings.CLOUDINARY_STORAGE["CLOUD_NAME"],
+                    api_key=settings.CLOUDINARY_STORAGE["API_KEY"],
+                    api_secret=settings.CLOUDINARY_STORAGE["API_SECRET"],
+                    secure=True,
+                )
+                _configured = True
+
+
+def delivery_url(name):
+    """Delivery URL of a bare stored resource ("image/upload/v123/<id>.jpg").
+
+    Building it needs the cloud name, which the import-time config in
+    settings used to provide; configure the SDK first.
+    """
+    from cloudinary.models import CloudinaryField
+
+    configure_cloudinary()
+    return CloudinaryField().parse_cloudinary_resource(name).url
+
+
+_pooled = False
+
+
+def cloudinary_uploader():
+    """cloudinary.uploader, configured and given our pool on first use"""
+    global _pooled
+    import cloudinary.uploader
+
+    configure_cloudinary()
+    if not _pooled:
+        with _lock:
+            if not _pooled:
+                cloudinary.uploader._http = http_pool()
+                _pooled = True
+    return cloudinary.uploader
+
+
+def http_pool():
+    """The SDK's own connector (keep-alive, proxy aware) with our pool size
+    and timeouts. urllib3 retries are off: upload() does them."""
+    import cloudinary
+    from cloudinary.utils import get_http_connector
+    from urllib3 import Timeout
+
+    return get_http_connector(cloudinary.config(), {
+        **cloudinary.CERT_KWARGS,
+        "maxsize": settings.CLOUDINARY_POOL_SIZE,
+        "timeout": Timeout(connect=settings.CLOUDINARY_CONNECT_TIMEOUT,
+                           read=settings.CLOUDINARY_READ_TIMEOUT),
+        "retries": False,
+    })
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go ahead. Once the cooldown is over, lets a
+        single trial call through and holds the rest back until it ends
+        (or, should it never report back, for another cooldown)."""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+        UPLOAD_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            opened = self.state == self.OPEN
+        if opened:
+            UPLOAD_CIRCUIT_OPEN.set(1)
+
+    def snapshot(self):
+        with self.lock:
+            retry_in = 0.0
+            if self.state == self.OPEN:
+                retry_in = max(0.0, self.cooldown
+                               - (time.monotonic() - self.opened_at))
+            return {"state": self.state, "failures": self.failures,
+                    "retry_in": round(retry_in, 1)}
+
+
+_breaker = None
+
+
+def upload_breaker():
+    global _breaker
+    with _lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(settings.CLOUDINARY_BREAKER_THRESHOLD,
+                                      settings.CLOUDINARY_BREAKER_COOLDOWN)
+        return _breaker
+
+
+def breaker_state():
+    """The upload circuit's state, failure count and seconds until it will
+    try again, for health checks"""
+    return upload_breaker().snapshot()
+
+
+def is_transient(error):
+    """Whether a Cloudinary SDK error is worth retrying: network errors and
+    unparseable responses (the base Error), 5xx and rate limiting. Other
+    4xx mean the upload itself was refused."""
+    from cloudinary.exceptions import Error, GeneralError, RateLimited
+
+    return type(error) is Error or isinstance(error, (GeneralError, RateLimited))
+
+
+def upload(file, **options):
+    """cloudinary.uploader.upload with retries behind the circuit breaker.
+
+    Raises UploadUnavailable when the circuit is open or transient failures
+    outlast the retries; errors Cloudinary answered deliberately (a bad
+    image, bad credentials) propagate as they are.
+    """
+    uploader = cloudinary_uploader()
+    breaker = upload_breaker()
+    if not breaker.allow():
+        raise UploadUnavailable("Image uploads are paused after repeated failures")
+
+    from cloudinary.exceptions import Error
+    from urllib3 import Timeout
+
+    deadline = time.monotonic() + settings.CLOUDINARY_UPLOAD_DEADLINE
+    attempt = 0
+    while True:
+        # The pool's read timeout is per socket read; bound the whole
+        # attempt by what is left of the deadline
+        remaining = deadline - time.monotonic()
+        timeout = Timeout(
+            total=remaining,
+            connect=min(settings.CLOUDINARY_CONNECT_TIMEOUT, remaining),
+            read=min(settings.CLOUDINARY_READ_TIMEOUT, remaining))
+        try:
+            result = uploader.upload(file, timeout=timeout, **options)
+        except Error as e:
+            if not is_transient(e):
+                # Cloudinary answered, so it's up
+                breaker.record_success()
+                raise
+            backoff = min(2.0, 0.25 * 2 ** attempt) * random.uniform(0.5, 1.0)
+            attempt += 1
+            if (attempt > settings.CLOUDINARY_UPLOAD_RETRIES
+                    or deadline - time.monotonic() - backoff
+                    < settings.CLOUDINARY_CONNECT_TIMEOUT):
+                breaker.record_failure()
+                raise UploadUnavailable(str(e)) from e
+            UPLOAD_RETRIES.inc()
+            time.sleep(backoff)
+            if hasattr(file, "seek"):
+                file.seek(0)
+        else:
+            breaker.record_success()
+            return result